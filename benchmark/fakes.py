@@ -0,0 +1,355 @@
+"""
+In-process stand-ins for the backends used by the datasource package: they replay recorded responses
+through the same driver API surface the data sources call, so benchmarks run offline and deterministically.
+"""
+import asyncio
+import io
+import struct
+import threading
+import time
+import uuid
+
+from collections import namedtuple
+from itertools import chain
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from aiohttp import web
+from gremlin_python.structure.io.graphbinaryV1 import GraphBinaryReader, GraphBinaryWriter
+
+from datasource.GremlinDataSource import GremlinDataSource
+from datasource.Neo4jDataSource import Neo4jDataSource, GET_DEFAULT_DB
+
+FakeServer = namedtuple("FakeServer", ["address"])
+
+
+class FakeRecord(tuple):
+
+    def __new__(cls, keys, values):
+        record = super().__new__(cls, values)
+        record._keys = keys
+        return record
+
+    def keys(self):
+        return list(self._keys)
+
+    def data(self):
+        return dict(zip(self._keys, self))
+
+    def get(self, key, default=None):
+        return self.data().get(key, default)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._keys.index(key))
+        return tuple.__getitem__(self, key)
+
+
+class FakeResult:
+
+    def __init__(self, rows, address: str = "fake:7687", counters: dict = None):
+        # rows may be a generator, so that streaming consumers never hold the whole response
+        rows = iter(rows)
+        first = next(rows, None)
+        self._keys = list(first.keys()) if first is not None else []
+        self._rows = chain([first], rows) if first is not None else iter(())
+        self._summary = SimpleNamespace(
+            server=FakeServer(address), result_available_after=0, result_consumed_after=0,
+            counters=SimpleNamespace(**{
+                "nodes_created": 0, "nodes_deleted": 0, "relationships_created": 0,
+                "relationships_deleted": 0, "properties_set": 0, "labels_added": 0, **(counters or {})
+            })
+        )
+
+    def keys(self):
+        return self._keys
+
+    def __iter__(self):
+        keys = self._keys
+        for row in self._rows:
+            yield FakeRecord(keys, [row.get(key) for key in keys])
+
+    def data(self):
+        # like the driver, every record is built and then converted
+        return [record.data() for record in self]
+
+    def to_df(self):
+        # what the neo4j driver Result.to_df() does without expand: a frame built from one list per record
+        from pandas import DataFrame
+        return DataFrame([list(record) for record in self], columns=self._keys)
+
+    def single(self):
+        row = next(self._rows, None)
+        return FakeRecord(self._keys, [row.get(key) for key in self._keys]) if row is not None else None
+
+    def consume(self):
+        return self._summary
+
+
+class FakeTransaction:
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver.respond(query, parameters or {})
+
+    def commit(self):
+        self._driver.round_trip()
+
+
+class FakeSession:
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver.respond(query, parameters or {})
+
+    def begin_transaction(self):
+        return FakeTransaction(self._driver)
+
+    def read_transaction(self, transaction_function, *args, **kwargs):
+        return self._run_transaction(transaction_function, *args, **kwargs)
+
+    def write_transaction(self, transaction_function, *args, **kwargs):
+        return self._run_transaction(transaction_function, *args, **kwargs)
+
+    def _run_transaction(self, transaction_function, *args, **kwargs):
+        tx = FakeTransaction(self._driver)
+        result = transaction_function(tx, *args, **kwargs)
+        tx.commit()
+        return result
+
+    def last_bookmarks(self):
+        return ("fake:bookmark",)
+
+    def close(self):
+        pass
+
+
+class FakeNeo4jDriver:
+    """
+    Replays the rows recorded for every query; a response may also be a callable receiving the parameters.
+    `latency` seconds are slept on every statement and commit to emulate the network round-trip.
+    """
+
+    def __init__(self, responses: dict = None, latency: float = 0):
+        self.responses = {GET_DEFAULT_DB: [{"name": "neo4j"}], **(responses or {})}
+        self.latency = latency
+        self.statements = 0
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    def round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def respond(self, query, parameters):
+        self.statements += 1
+        self.round_trip()
+        if "rows" in parameters and query.startswith("UNWIND"):
+            return FakeResult([], counters={"nodes_created": len(parameters["rows"])})
+        response = self.responses.get(query, [])
+        return FakeResult(response(parameters) if callable(response) else response)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeNode(dict):
+
+    def __init__(self, node_id, labels, properties):
+        super().__init__(properties)
+        self.id = node_id
+        self.labels = frozenset(labels)
+
+
+class FakeRelationship(dict):
+
+    def __init__(self, edge_id, edge_type, start_node, end_node, properties):
+        super().__init__(properties)
+        self.id = edge_id
+        self.type = edge_type
+        self.start_node = start_node
+        self.end_node = end_node
+
+
+def fake_neo4j_data_source(responses: dict = None, latency: float = 0, **kwargs) -> Neo4jDataSource:
+    data_source = Neo4jDataSource("bolt", "localhost", "7687", None, None, **kwargs)
+    data_source.driver.close()
+    data_source.driver = FakeNeo4jDriver(responses, latency)
+    return data_source
+
+
+class FakeResultSet:
+
+    def __init__(self, results: list, batch_size: int = 64):
+        self._batches = [results[index:index + batch_size] for index in range(0, len(results), batch_size)]
+
+    def __iter__(self):
+        return iter(self._batches)
+
+    def all(self):
+        future = Future()
+        future.set_result([result for batch in self._batches for result in batch])
+        return future
+
+
+class FakeGremlinClient:
+
+    def __init__(self, responses: dict = None, latency: float = 0):
+        self.responses = responses or {}
+        self.latency = latency
+        self.requests: list = []
+        self._url = "ws://fake:8182/gremlin"
+
+    def submit(self, message, bindings=None, request_options=None):
+        self.requests.append((message, bindings, request_options))
+        if self.latency:
+            time.sleep(self.latency)
+        response = self.responses.get(message, []) if isinstance(message, str) else []
+        return FakeResultSet(response(bindings or {}) if callable(response) else response)
+
+    def submit_async(self, message, bindings=None, request_options=None):
+        future = Future()
+        future.set_result(self.submit(message, bindings, request_options))
+        return future
+
+    def close(self):
+        pass
+
+
+class FakeGremlinDataSource(GremlinDataSource):
+
+    responses: dict = {}
+    latency: float = 0
+
+    @classmethod
+    def _init_client(cls, **kwargs):
+        return FakeGremlinClient(cls.responses, cls.latency)
+
+
+class FakeGremlinServer:
+    """
+    Gremlin Server on localhost speaking the GraphBinary websocket protocol: every script is answered with the
+    rows recorded for it after `latency` seconds, the requests of a socket are served concurrently like the real
+    server does. A script not seen before costs `compile_latency` more seconds, like the compilation of a script
+    missing from the gremlin server script cache. Bytecode requests are answered with no rows; the traversal
+    source every request was aliased to and the number of websockets opened are recorded.
+    Used as `with FakeGremlinServer(responses) as server:` and reached on `server.port`.
+    """
+
+    def __init__(self, responses: dict = None, latency: float = 0, compile_latency: float = 0):
+        self.responses = responses or {}
+        self.latency = latency
+        self.compile_latency = compile_latency
+        self.compiled: set = set()
+        self.requests = 0
+        self.aliases: list = []
+        self.connections = 0
+        self.port = None
+        self._reader = GraphBinaryReader()
+        self._writer = GraphBinaryWriter()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-gremlin-server", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        return False
+
+    async def _start(self):
+        application = web.Application()
+        application.router.add_get("/gremlin", self._serve)
+        self._runner = web.AppRunner(application)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _serve(self, request):
+        websocket = web.WebSocketResponse(max_msg_size=0)
+        await websocket.prepare(request)
+        self.connections += 1
+        async for frame in websocket:
+            asyncio.ensure_future(self._answer(websocket, frame.data))
+        return websocket
+
+    async def _answer(self, websocket, data: bytes):
+        self.requests += 1
+        request_id, args = self._read_request(data)
+        script = args.get("gremlin") if isinstance(args.get("gremlin"), str) else None
+        self.aliases.append((args.get("aliases") or {}).get("g"))
+        latency = self.latency
+        if script not in self.compiled:
+            self.compiled.add(script)
+            latency += self.compile_latency
+        if latency:
+            await asyncio.sleep(latency)
+        response = self.responses.get(script, [])
+        rows = response(args.get("bindings") or {}) if callable(response) else response
+        await websocket.send_bytes(self._write_response(request_id, rows))
+
+    def _read_request(self, data: bytes):
+        buffer = io.BytesIO(data)
+        buffer.read(data[0] + 2)  # mime type length, mime type, version
+        request_id = uuid.UUID(bytes=buffer.read(16))
+        for _ in range(2):  # op and processor
+            buffer.read(struct.unpack(">i", buffer.read(4))[0])
+        args = {}
+        for _ in range(struct.unpack(">i", buffer.read(4))[0]):
+            key = self._reader.to_object(buffer)
+            args[key] = self._reader.to_object(buffer)
+        return request_id, args
+
+    def _write_response(self, request_id: uuid.UUID, rows: list) -> bytes:
+        # version, request id, status code, empty status message, status attributes and meta maps, result
+        response = bytearray(b"\x81\x00" + request_id.bytes + struct.pack(">ib2i", 200, 0, 0, 0) + struct.pack(">i", 0))
+        self._writer.to_dict(list(rows), response)
+        return bytes(response)
+
+
+class FakeMongoDbDataSource:
+    """
+    In-memory stand-in for MongoDbDataSource, to be passed as `GdbConnection(mongo=...)`
+    """
+
+    def __init__(self, collections: dict = None):
+        self.collections = {name: list(documents) for name, documents in (collections or {}).items()}
+        self.reads = 0
+
+    def find_all(self, collection):
+        self.reads += 1
+        return iter(self.collections.get(collection, []))
+
+    def find_one(self, collection, doc_id):
+        return next((doc for doc in self.collections.get(collection, []) if doc.get("_id") == doc_id), None)
+
+    def insert_one(self, collection, doc_to_write):
+        self.collections.setdefault(collection, []).append(doc_to_write)
+
+    def delete_all(self, collection):
+        self.collections[collection] = []
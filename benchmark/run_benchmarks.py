@@ -0,0 +1,721 @@
+"""
+Offline benchmark suite of the datasource package, running against the in-process fakes of benchmark.fakes.
+
+    python -m benchmark.run_benchmarks [--output results.json] [--baseline previous.json] [--only name ...]
+
+Every benchmark reports its primary metric as `seconds` (lower is better) plus its own details;
+with --baseline the run fails when a benchmark is slower than the baseline beyond --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from benchmark.fakes import (
+    FakeGremlinDataSource, FakeGremlinServer, FakeMongoDbDataSource, FakeNode, FakeRelationship, fake_neo4j_data_source
+)
+from datasource.Neo4jDataSource import APOC_GRAPH_FROM_CYPHER
+
+BENCHMARKS: dict = {}
+ROWS_QUERY = "MATCH (n:Benchmark) RETURN n.id AS id, n.name AS name, n.score AS score"
+ROWS = 10_000
+DF_ROWS = 1_000_000
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from datasource.GdbConnection import GdbConnection
+imported = time.perf_counter()
+backends = [module for module in ("neo4j", "gremlin_python", "aiohttp", "pymongo") if module in sys.modules]
+from benchmark.fakes import FakeMongoDbDataSource, FakeNeo4jDriver
+from datasource.Neo4jDataSource import Neo4jDataSource
+mongo = FakeMongoDbDataSource({"graphDbConnection": [{"type": "NEO4J", "protocol": "bolt", "uri": "localhost"}]})
+Neo4jDataSource.health_check = lambda self: None
+first_query = time.perf_counter()
+data_source = GdbConnection(mongo=mongo).get_graph_data_source()
+data_source.driver = FakeNeo4jDriver({"RETURN 1 AS one": [{"one": 1}]})
+data_source.run_query("RETURN 1 AS one", graph="neo4j")
+print(json.dumps({
+    "import_seconds": imported - start, "first_query_seconds": time.perf_counter() - first_query,
+    "modules_loaded_by_import": backends
+}))
+"""
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def measure(function, repeat: int = 5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(timings), "min": min(timings), "max": max(timings), "repeat": repeat}
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def rows(count: int = ROWS):
+    return ({"id": index, "name": f"node-{index}", "score": index / 3} for index in range(count))
+
+
+@benchmark
+def neo4j_run_query_dict():
+    data_source = fake_neo4j_data_source({ROWS_QUERY: lambda params: rows()})
+    return dict(measure(lambda: data_source.run_query(ROWS_QUERY)), rows=ROWS)
+
+
+@benchmark
+def neo4j_run_query_df():
+    """
+    time and peak memory of the columnar data frame of 1M rows, against Result.to_df() and a frame built
+    from the list of dicts returned by run_query
+    """
+    from pandas import DataFrame
+    data_source = fake_neo4j_data_source({ROWS_QUERY: lambda params: rows(DF_ROWS)})
+
+    def columnar():
+        return data_source.run_query(ROWS_QUERY, result_as_df=True)
+
+    def to_df():
+        return data_source.driver.session().read_transaction(lambda tx: tx.run(ROWS_QUERY).to_df())
+
+    def list_of_dicts():
+        return DataFrame(data_source.run_query(ROWS_QUERY))
+
+    return dict(
+        measure(columnar, repeat=3), rows=DF_ROWS,
+        to_df_seconds=measure(to_df, repeat=3)["seconds"],
+        list_of_dicts_seconds=measure(list_of_dicts, repeat=3)["seconds"],
+        peak_bytes=peak_memory(columnar), to_df_peak_bytes=peak_memory(to_df),
+        list_of_dicts_peak_bytes=peak_memory(list_of_dicts)
+    )
+
+
+@benchmark
+def neo4j_stream_query():
+    """
+    time to the first record and peak memory of streaming compared with the materialized run_query
+    """
+    data_source = fake_neo4j_data_source({ROWS_QUERY: lambda params: rows(ROWS * 10)})
+
+    def first_record():
+        next(iter(data_source.stream_query(ROWS_QUERY)))
+
+    def consume_stream():
+        for _ in data_source.stream_query(ROWS_QUERY):
+            pass
+
+    start = time.perf_counter()
+    first_record()
+    time_to_first_record = time.perf_counter() - start
+    result = measure(consume_stream, repeat=3)
+    return dict(
+        result, rows=ROWS * 10, time_to_first_record=time_to_first_record,
+        stream_peak_bytes=peak_memory(consume_stream),
+        run_query_peak_bytes=peak_memory(lambda: data_source.run_query(ROWS_QUERY))
+    )
+
+
+def legacy_node_as_map(node, metadata={}):
+    # Neo4jDataSource._get_node_as_map before GraphResult
+    return {
+        "id": node.id,
+        "labels": node.labels,
+        "properties": {k: v for (k, v) in node.items()},
+        "nodeMetadata": metadata.get(str(node.id)) if metadata else {}
+    }
+
+
+def legacy_edge_as_map(edge):
+    # Neo4jDataSource._get_edge_as_map before GraphResult
+    edge_map = {
+        "id": edge.id,
+        "type": edge.type,
+        "source": edge.start_node.id,
+        "target": edge.end_node.id,
+        "properties": {k: v for (k, v) in edge.items()}
+    }
+    for key in edge.keys():
+        edge_map.get("properties")[key] = edge.get(key)
+    return edge_map
+
+
+def graph_fixture(count: int = ROWS * 5):
+    nodes = [
+        FakeNode(index, ["Benchmark", "Node"], {"name": f"node-{index}", "score": index, "flag": index % 2 == 0})
+        for index in range(count)
+    ]
+    rels = [
+        FakeRelationship(index, "NEXT", nodes[index], nodes[index + 1], {"weight": index})
+        for index in range(len(nodes) - 1)
+    ]
+    return nodes, rels
+
+
+@benchmark
+def neo4j_graph_from_query():
+    """
+    graph_from_query of 100k elements into a GraphResult, against the nested dicts of the former
+    _get_node_as_map / _get_edge_as_map conversion
+    """
+    nodes, rels = graph_fixture()
+    data_source = fake_neo4j_data_source({APOC_GRAPH_FROM_CYPHER: [{"nodes": nodes, "rels": rels}]})
+    query = "MATCH p = (:Benchmark)-[:NEXT]->() RETURN p"
+
+    def legacy():
+        record = data_source.driver.respond(APOC_GRAPH_FROM_CYPHER, {}).single()
+        return {
+            "nodes": [legacy_node_as_map(node, record.get("nodeMetadata")) for node in record.get("nodes")],
+            "rels": [legacy_edge_as_map(edge) for edge in record.get("rels")]
+        }
+
+    result = measure(lambda: data_source.graph_from_query(query), repeat=3)
+    return dict(
+        result, elements=len(nodes) + len(rels),
+        legacy_seconds=measure(legacy, repeat=3)["seconds"],
+        projected_seconds=measure(lambda: data_source.graph_from_query(query, properties=["name"]), repeat=3)["seconds"],
+        as_map_seconds=measure(lambda: data_source.graph_from_query(query).as_map(), repeat=3)["seconds"],
+        as_map_materialized_seconds=measure(lambda: materialize(data_source.graph_from_query(query)), repeat=3)["seconds"],
+        graph_result_peak_bytes=peak_memory(lambda: data_source.graph_from_query(query)),
+        legacy_peak_bytes=peak_memory(legacy),
+        as_map_peak_bytes=peak_memory(lambda: data_source.graph_from_query(query).as_map()),
+        as_map_materialized_peak_bytes=peak_memory(lambda: materialize(data_source.graph_from_query(query)))
+    )
+
+
+def materialize(graph_result) -> dict:
+    # the legacy structure with every element dict built, as a caller walking the whole as_map() gets it
+    return {key: list(elements) for key, elements in graph_result.as_map().items()}
+
+
+@benchmark
+def graph_result_serialization():
+    """
+    synthetic nodes and relationships of 100k elements serialized to JSON bytes: the single-pass GraphResult
+    conversion and to_json(), against the former per element dicts encoded with the json module
+    """
+    from datasource.GraphResult import GraphResult
+    from datasource.Neo4jDataSource import Neo4jDataSource
+    nodes, rels = graph_fixture()
+    record = {"nodes": nodes, "rels": rels}
+
+    def legacy():
+        graph = {"nodes": [legacy_node_as_map(node) for node in nodes], "rels": [legacy_edge_as_map(edge) for edge in rels]}
+        return json.dumps(graph, default=list).encode()
+
+    def not_interned():
+        graph_result = GraphResult(intern=False)
+        graph_result.extend_nodes(nodes)
+        graph_result.extend_edges(rels)
+        return graph_result
+
+    return dict(
+        measure(lambda: Neo4jDataSource._graph_from_record(record).to_json(), repeat=3), elements=len(nodes) + len(rels),
+        not_interned_seconds=measure(lambda: not_interned().to_json(), repeat=3)["seconds"],
+        peak_bytes=peak_memory(lambda: Neo4jDataSource._graph_from_record(record).to_json()),
+        not_interned_peak_bytes=peak_memory(lambda: not_interned().to_json()),
+        legacy_peak_bytes=peak_memory(legacy),
+        legacy_seconds=measure(legacy, repeat=3)["seconds"],
+        convert_seconds=measure(lambda: Neo4jDataSource._graph_from_record(record), repeat=3)["seconds"],
+        legacy_convert_seconds=measure(lambda: [legacy_node_as_map(node) for node in nodes] + [
+            legacy_edge_as_map(edge) for edge in rels
+        ], repeat=3)["seconds"]
+    )
+
+
+@benchmark
+def neo4j_write_batch():
+    data_source = fake_neo4j_data_source(latency=0.001)
+    query = "CREATE (:Benchmark {id: row.id, name: row.name})"
+    single_rows = 500
+    per_row = measure(lambda: [
+        data_source.run_query(query.replace("row.", "$"), params=row, write=True) for row in rows(single_rows)
+    ], repeat=1)["seconds"]
+    return dict(
+        measure(lambda: data_source.write_batch(query, rows(ROWS * 10), batch_size=1000), repeat=3),
+        rows=ROWS * 10,
+        parallel_seconds=measure(
+            lambda: data_source.write_batch(query, rows(ROWS * 10), batch_size=1000, parallelism=4), repeat=3
+        )["seconds"],
+        per_row_seconds_per_1000=per_row / single_rows * 1000
+    )
+
+
+@benchmark
+def neo4j_transaction():
+    """
+    latency of a request issuing 5 small queries over a 1ms link: one run_query (session and managed
+    transaction) per query, compared with a single transaction running them all
+    """
+    queries = [f"MATCH (n:Benchmark {{id: $id}}) RETURN n.name AS name{index}" for index in range(5)]
+    data_source = fake_neo4j_data_source({query: [{"name": "node"}] for query in queries}, latency=0.001)
+
+    def one_transaction_per_query():
+        for query in queries:
+            data_source.run_query(query, params={"id": 1})
+
+    def single_transaction():
+        with data_source.transaction() as tx:
+            pending = [tx.submit(query, params={"id": 1}) for query in queries]
+            [result.result() for result in pending]
+
+    return dict(
+        measure(single_transaction, repeat=20), queries=len(queries),
+        run_query_seconds=measure(one_transaction_per_query, repeat=20)["seconds"]
+    )
+
+
+@benchmark
+def gremlin_run_query():
+    FakeGremlinDataSource.responses = {
+        "g.V().valueMap()": [{"id": [row["id"]], "name": [row["name"]], "score": [row["score"]]} for row in rows()]
+    }
+    data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"})
+    return dict(measure(lambda: data_source.run_query("g.V().valueMap()", graph="graph")), rows=ROWS)
+
+
+@benchmark
+def gremlin_traversal_sources():
+    """
+    startup of a data source serving 24 traversal sources of one gremlin server, then a script and a bytecode
+    traversal on every graph: the shared Client against the former Client and DriverRemoteConnection per graph,
+    with the websockets opened on the server and the executor threads started
+    """
+    from gremlin_python.driver.client import Client
+    from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+    from gremlin_python.process.anonymous_traversal import traversal
+    from datasource.GremlinDataSource import GremlinDataSource
+
+    graphs = {f"graph_{index}": f"g_{index}" for index in range(24)}
+
+    def use(run_script, traversals):
+        for graph in graphs:
+            run_script(graph)
+            traversals(graph).V().limit(1).to_list()
+
+    def shared(server):
+        start = time.perf_counter()
+        data_source = GremlinDataSource(protocol="ws", host="127.0.0.1", port=server.port, tinkerpop_graphs=graphs)
+        init = time.perf_counter() - start
+        use(lambda graph: data_source.run_query("g.V().limit(1)", graph=graph), data_source._get_traversal)
+        return data_source.close, init, time.perf_counter() - start
+
+    def legacy(server):
+        url = f"ws://127.0.0.1:{server.port}/gremlin"
+        start = time.perf_counter()
+        clients = {graph: Client(url, source) for graph, source in graphs.items()}
+        connections = {graph: DriverRemoteConnection(url, source) for graph, source in graphs.items()}
+        traversals = {graph: traversal().with_remote(connection) for graph, connection in connections.items()}
+        init = time.perf_counter() - start
+        use(lambda graph: clients[graph].submit("g.V().limit(1)").all().result(), traversals.get)
+
+        def close():
+            for closeable in chain(clients.values(), connections.values()): closeable.close()
+        return close, init, time.perf_counter() - start
+
+    results = {"traversal_sources": len(graphs)}
+    for name, setup in [("shared", shared), ("legacy", legacy)]:
+        with FakeGremlinServer() as server:
+            threads = threading.active_count()
+            close, init, total = setup(server)
+            results[f"{name}_threads"] = threading.active_count() - threads
+            results[f"{name}_init_seconds"], results[f"{name}_startup_seconds"] = init, total
+            results[f"{name}_sockets"] = server.connections
+            results[f"{name}_aliases_ok"] = server.aliases == [source for source in graphs.values() for _ in range(2)]
+            close()
+    results["seconds"] = results["shared_startup_seconds"]
+    return results
+
+
+@benchmark
+def gremlin_transaction_sessions():
+    """
+    200 write units of work of 2 statements each on a gremlin server answering after 1ms: the session clients
+    reused from the pool, against a new session client (websocket handshake and session close) per unit
+    """
+    from datasource.GremlinDataSource import GremlinDataSource
+
+    units = 200
+
+    def run(server, session_pool_size):
+        data_source = GremlinDataSource(
+            protocol="ws", host="127.0.0.1", port=server.port, tinkerpop_graphs={"graph": "g"},
+            session_pool_size=session_pool_size
+        )
+        start = time.perf_counter()
+        for index in range(units):
+            with data_source.transaction("graph", write=True) as tx:
+                tx.submit("g.addV('Benchmark').property('id', id)", {"id": index})
+                tx.submit("g.V().has('id', id).count()", {"id": index})
+        elapsed = time.perf_counter() - start
+        data_source.close()
+        return elapsed, server.connections
+
+    results = {"units": units}
+    for name, session_pool_size in [("pooled", 4), ("per_unit", 0)]:
+        with FakeGremlinServer(latency=0.001) as server:
+            elapsed, connections = run(server, session_pool_size)
+        results[f"{name}_seconds"], results[f"{name}_sockets"] = elapsed, connections
+        results[f"{name}_units_per_second"] = units / elapsed
+    results["seconds"] = results["pooled_seconds"]
+    return results
+
+
+@benchmark
+def gremlin_run_query_df():
+    """
+    time and peak memory of the columnar data frame of 1M valueMap results, against a frame built from the
+    list of results returned by run_query
+    """
+    from pandas import DataFrame
+    query = "g.V().valueMap()"
+    FakeGremlinDataSource.responses = {
+        query: [{"id": [row["id"]], "name": [row["name"]], "score": [row["score"]]} for row in rows(DF_ROWS)]
+    }
+    data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"})
+
+    def columnar():
+        return data_source.run_query(query, graph="graph", result_as_df=True, cardinality="single")
+
+    def list_of_dicts():
+        return DataFrame([
+            {key: values[0] for key, values in result.items()} for result in data_source.run_query(query, graph="graph")
+        ])
+
+    try:
+        return dict(
+            measure(columnar, repeat=3), rows=DF_ROWS,
+            list_of_dicts_seconds=measure(list_of_dicts, repeat=3)["seconds"],
+            peak_bytes=peak_memory(columnar), list_of_dicts_peak_bytes=peak_memory(list_of_dicts)
+        )
+    finally:
+        FakeGremlinDataSource.responses = {}
+
+
+@benchmark
+def gremlin_run_query_paged():
+    """
+    range() pages of a 100k rows traversal over a 5ms link, fetched one at a time and 4 at a time
+    """
+    query = "g.V().order().by('id').valueMap()"
+    values = [{"id": [row["id"]], "name": [row["name"]]} for row in rows(ROWS * 10)]
+    FakeGremlinDataSource.responses = {
+        f"{query}.range(_pageStart, _pageEnd)": lambda bindings: values[bindings["_pageStart"]:bindings["_pageEnd"]]
+    }
+    FakeGremlinDataSource.latency = 0.005
+    try:
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "graph"})
+
+        def consume(parallelism):
+            for _ in data_source.run_query_paged(query, graph="graph", page_size=1000, parallelism=parallelism):
+                pass
+
+        return dict(
+            measure(lambda: consume(1), repeat=3), rows=ROWS * 10,
+            parallel_seconds=measure(lambda: consume(4), repeat=3)["seconds"]
+        )
+    finally:
+        FakeGremlinDataSource.latency = 0
+
+
+@benchmark
+def gremlin_script_normalization():
+    """
+    300 lookups differing only by their literal on a local gremlin server answering after 1ms, where every script
+    not compiled yet costs 5ms more: submitted as they are, and normalized into one bound template
+    """
+    from datasource.GremlinDataSource import GremlinDataSource
+    queries = [f"g.V().has('benchmark', 'id', {index}).valueMap()" for index in range(300)]
+    result = {"queries": len(queries)}
+    for normalize in (False, True):
+        with FakeGremlinServer(latency=0.001, compile_latency=0.005) as server:
+            data_source = GremlinDataSource(
+                protocol="ws", host="127.0.0.1", port=server.port, tinkerpop_graphs={"graph": "g"},
+                normalize_scripts=normalize
+            )
+            seconds = measure(lambda: [data_source.run_query(query, graph="graph") for query in queries], repeat=1)["seconds"]
+            data_source.close()
+        result["seconds" if normalize else "raw_seconds"] = seconds
+        result["compiled_scripts" if normalize else "raw_compiled_scripts"] = len(server.compiled)
+    data_source = GremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"}, normalize_scripts=True)
+    result["prepare_microseconds"] = measure(
+        lambda: [data_source._prepare_script(query) for query in queries], repeat=3
+    )["seconds"] / len(queries) * 1_000_000
+    return result
+
+
+@benchmark
+def gremlin_async_throughput():
+    """
+    queries per second of 1000 concurrent queries on a local gremlin server answering after 5ms: the sync data
+    source driven by 16 threads over a pool of 16 websockets, against the async one over a single websocket
+    """
+    from datasource.AsyncGremlinDataSource import AsyncGremlinDataSource
+    from datasource.GremlinDataSource import GremlinDataSource
+    queries, workers, query = 1000, 16, "g.V(id).valueMap()"
+    with FakeGremlinServer({query: lambda bindings: [{"id": [bindings["id"]]}]}, latency=0.005) as server:
+        sync_source = GremlinDataSource(
+            protocol="ws", host="127.0.0.1", port=server.port, tinkerpop_graphs={"graph": "g"},
+            pool_size=workers, max_workers=workers
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def run_sync():
+                list(executor.map(lambda index: sync_source.run_query(query, {"id": index}, graph="graph"), range(queries)))
+            run_sync()
+            sync_seconds = measure(run_sync, repeat=3)["seconds"]
+        sync_source.close()
+
+        async def run_async():
+            async_source = AsyncGremlinDataSource(
+                protocol="ws", host="127.0.0.1", port=server.port, tinkerpop_graphs={"graph": "g"}
+            )
+            await async_source.run_query(query, {"id": 0}, graph="graph")
+            start = time.perf_counter()
+            await asyncio.gather(*(async_source.run_query(query, {"id": index}, graph="graph") for index in range(queries)))
+            elapsed = time.perf_counter() - start
+            await async_source.close()
+            return elapsed
+
+        async_seconds = statistics.median(asyncio.run(run_async()) for _ in range(3))
+    return {
+        "seconds": async_seconds, "queries": queries, "sync_threads_seconds": sync_seconds,
+        "async_queries_per_second": queries / async_seconds, "sync_queries_per_second": queries / sync_seconds
+    }
+
+
+@benchmark
+def gdb_connection_contention():
+    """
+    GdbConnection() and get_graph_data_source() called from many threads once the driver is connected
+    """
+    from datasource.GdbConnection import GdbConnection
+
+    GdbConnection.evict_singleton_instance()
+    connection = GdbConnection(mongo=FakeMongoDbDataSource())
+    connection.driver = fake_neo4j_data_source()
+    connection.connected = True
+    results = {}
+    for threads in [1, 16, 64, 128]:
+        calls = 2000
+
+        def worker():
+            for _ in range(calls):
+                GdbConnection().get_graph_data_source()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers: thread.start()
+        for thread in workers: thread.join()
+        elapsed = time.perf_counter() - start
+        results[f"threads_{threads}_calls_per_second"] = threads * calls / elapsed
+        results["seconds"] = elapsed
+    GdbConnection.evict_singleton_instance()
+    return results
+
+
+@benchmark
+def gdb_connection_outage():
+    """
+    get_graph_data_source() from 64 threads while the backend is down: the open circuit answers immediately
+    instead of rebuilding and probing a driver on every call
+    """
+    from datasource.GdbConnection import GdbConnection
+
+    GdbConnection.evict_singleton_instance()
+    connection = GdbConnection(mongo=FakeMongoDbDataSource(), retry_backoff=3600)
+    connection.circuit_breaker.record_failure()
+    threads, calls = 64, 2000
+
+    def worker():
+        for _ in range(calls):
+            connection.get_graph_data_source()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers: thread.start()
+    for thread in workers: thread.join()
+    elapsed = time.perf_counter() - start
+    GdbConnection.evict_singleton_instance()
+    return {"seconds": elapsed, "calls_per_second": threads * calls / elapsed}
+
+
+@benchmark
+def gdb_connection_cold_start():
+    """
+    import time of datasource.GdbConnection and latency of the first query in a fresh interpreter,
+    with the backend modules loaded by the bare import listed (none expected)
+    """
+    runs = [
+        json.loads(subprocess.run([sys.executable, "-c", COLD_START], capture_output=True, text=True, check=True).stdout)
+        for _ in range(5)
+    ]
+    return {
+        "seconds": statistics.median(run["import_seconds"] for run in runs),
+        "first_query_seconds": statistics.median(run["first_query_seconds"] for run in runs),
+        "modules_loaded_by_import": runs[0]["modules_loaded_by_import"]
+    }
+
+
+def prefork_worker(queries: int, results):
+    from datasource.GdbConnection import GdbConnection
+
+    connection = GdbConnection()
+    start = time.perf_counter()
+    for _ in range(queries):
+        connection.run_query("g.V().valueMap()", graph="graph")
+    results.put({"seconds": time.perf_counter() - start, "driver_pid": connection._pid})
+
+
+@benchmark
+def gdb_connection_prefork():
+    """
+    queries per second of 1, 2 and 4 forked workers sharing a GdbConnection preloaded by the parent:
+    every child rebuilds its own data source from the configuration read once by the parent. Every query
+    waits on a 2ms server round trip, the latency-bound work a worker overlaps with the others whatever the
+    number of cores; CPU-bound queries only scale up to `cpu_count` workers
+    """
+    from datasource import GdbConnection as gdb_connection
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return {"skipped": "fork is not available on this platform"}
+    gdb_connection.DATA_SOURCE_CLASSES["FAKEGREMLIN"] = ("benchmark.fakes", "FakeGremlinDataSource")
+    FakeGremlinDataSource.responses = {
+        "g.V().valueMap()": [{"id": [row["id"]], "name": [row["name"]]} for row in rows(50)]
+    }
+    FakeGremlinDataSource.latency = 0.002
+    mongo = FakeMongoDbDataSource({"graphDbConnection": [
+        {"type": "FAKEGREMLIN", "protocol": "ws", "uri": "fake", "tinkerpopGraphs": {"graph": "g"}}
+    ]})
+    gdb_connection.GdbConnection.evict_singleton_instance()
+    gdb_connection.GdbConnection(mongo=mongo).get_graph_data_source()
+
+    context = multiprocessing.get_context("fork")
+    results, queries = {}, 300
+    for workers in [1, 2, 4]:
+        queue = context.Queue()
+        processes = [context.Process(target=prefork_worker, args=(queries, queue)) for _ in range(workers)]
+        start = time.perf_counter()
+        for process in processes: process.start()
+        children = [queue.get() for _ in processes]
+        for process in processes: process.join()
+        elapsed = time.perf_counter() - start
+        results[f"workers_{workers}_queries_per_second"] = workers * queries / elapsed
+        results["seconds"] = elapsed
+        results["drivers_rebuilt_in_children"] = sum(child["driver_pid"] != os.getpid() for child in children)
+    results["mongo_reads"] = mongo.reads
+    results["cpu_count"] = os.cpu_count()
+    FakeGremlinDataSource.latency = 0
+    gdb_connection.GdbConnection.evict_singleton_instance()
+    return results
+
+
+@benchmark
+def singleton_contention():
+    """
+    bare singleton access of the registry from 64 and 128 threads, plain and keyed instances
+    """
+    from datasource.metaclass.SingletonRegistry import SingletonRegistry
+
+    class Probe(metaclass=SingletonRegistry):
+        pass
+
+    results = {}
+    calls = 5000
+    for threads in [64, 128]:
+        for keyed in [False, True]:
+            def worker(worker_index):
+                instance_key = worker_index % 8 if keyed else None
+                for _ in range(calls):
+                    Probe(instance_key=instance_key)
+
+            workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+            start = time.perf_counter()
+            for thread in workers: thread.start()
+            for thread in workers: thread.join()
+            elapsed = time.perf_counter() - start
+            results[f"threads_{threads}{'_keyed' if keyed else ''}_calls_per_second"] = threads * calls / elapsed
+            results["seconds"] = elapsed
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "seconds" not in result or "seconds" not in previous:
+            continue
+        if result["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {previous['seconds']:.6f}s -> {result['seconds']:.6f}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="offline benchmarks of the datasource package")
+    parser.add_argument("--output", help="file receiving the JSON results, stdout if not set")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown over the baseline")
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, function in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        try:
+            results[name] = function()
+        except ImportError as ex:
+            # optional dependencies (pandas, pyarrow, ...) that are not installed
+            results[name] = {"skipped": str(ex)}
+
+    report = {
+        "revision": git_revision(), "python": platform.python_version(),
+        "timestamp": time.time(), "results": results
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
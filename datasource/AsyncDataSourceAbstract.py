@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+
+
+class AsyncDataSourceAbstract(ABC):
+
+    @abstractmethod
+    async def get_default_graph(self):
+        ...
+
+    @abstractmethod
+    async def get_graphs(self):
+        ...
+
+    @abstractmethod
+    async def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = False, result_as_df: bool = False):
+        ...
+
+    @abstractmethod
+    async def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import logging
+import ssl
+import uuid
+
+import aiohttp
+
+from gremlin_python.driver.protocol import GremlinServerError
+from gremlin_python.driver.request import RequestMessage
+from gremlin_python.driver.serializer import GraphBinarySerializersV1
+
+from datasource.AsyncDataSourceAbstract import AsyncDataSourceAbstract
+from datasource.GraphResult import GraphResult
+from datasource.GremlinDataSource import GremlinDataSource, CARDINALITY_LIST
+
+
+class _GremlinWebSocket:
+    """
+    One websocket of AsyncGremlinDataSource: every request is written as soon as it is submitted and the
+    responses are matched to it by request id by a single reader task, so any number of requests share the socket
+    """
+
+    __slots__ = ("websocket", "serializer", "user", "password", "pending", "reader")
+
+    def __init__(self, websocket, serializer, user: str, password: str):
+        self.websocket = websocket
+        self.serializer = serializer
+        self.user = user
+        self.password = password
+        # request id -> (server batches received so far, future resolved with all the batches)
+        self.pending: dict = {}
+        self.reader = asyncio.ensure_future(self._read())
+
+    @property
+    def closed(self) -> bool:
+        return self.websocket.closed or self.reader.done()
+
+    async def submit(self, message: RequestMessage) -> list:
+        """
+        :return: the server batches of the response, each one a list of results
+        """
+        request_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = ([], future)
+        try:
+            await self.websocket.send_bytes(self.serializer.serialize_message(request_id, message))
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read(self):
+        error = ConnectionError("the gremlin server closed the connection")
+        try:
+            async for frame in self.websocket:
+                if frame.type == aiohttp.WSMsgType.ERROR:
+                    error = ConnectionError(f"the gremlin connection failed: {frame.data}")
+                    break
+                data = frame.data.encode() if frame.type == aiohttp.WSMsgType.TEXT else frame.data
+                await self._dispatch(self.serializer.deserialize_message(data))
+        except Exception as ex:
+            error = ConnectionError(f"the gremlin connection failed: {ex}")
+        for _, future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _dispatch(self, message: dict):
+        entry = self.pending.get(str(message["requestId"]))
+        if entry is None or entry[1].done():
+            return
+        batches, future = entry
+        status = message["status"]
+        if status["code"] == 407:
+            if not (self.user and self.password):
+                future.set_exception(GremlinServerError(status))
+                return
+            sasl = base64.b64encode(b"\x00" + self.user.encode() + b"\x00" + self.password.encode()).decode()
+            authentication = RequestMessage("traversal", "authentication", {"sasl": sasl})
+            await self.websocket.send_bytes(self.serializer.serialize_message(str(message["requestId"]), authentication))
+        elif status["code"] in (200, 206):
+            batches.append(message["result"]["data"] or [])
+            if status["code"] == 200:
+                future.set_result(batches)
+        elif status["code"] == 204:
+            future.set_result(batches)
+        else:
+            future.set_exception(GremlinServerError(status))
+
+    async def close(self):
+        await self.websocket.close()
+        await self.reader
+
+
+class AsyncGremlinDataSource(AsyncDataSourceAbstract):
+    """
+    Talks the gremlin server websocket protocol with aiohttp on the caller event loop, serializing the messages
+    with the gremlin_python serializers: no executor thread nor pooled connection is taken by a request, the
+    requests in flight are multiplexed on `pool_size` websockets opened on first use.
+    """
+
+    _logger = logging.getLogger("AsyncGremlinDataSource")
+    _CONNECTION_STRING: str = GremlinDataSource._CONNECTION_STRING
+    HEALTH_CHECK_QUERY: str = GremlinDataSource.HEALTH_CHECK_QUERY
+
+    def __init__(
+            self, protocol: str = None, host: str = "localhost",
+            port: str = "8182", user: str = "", password: str = "",
+            tinkerpop_graphs: dict = {}, pool_size: int = 1, message_serializer=None
+    ):
+        """
+        :param pool_size: the number of websockets the requests are spread over
+        :param message_serializer: a gremlin_python message serializer, GraphBinary by default like the sync Client
+        """
+        self.url = self._CONNECTION_STRING.format(protocol=protocol, host=host, port=port)
+        self.tinkerpop_graphs = tinkerpop_graphs
+        self.user = user
+        self.password = password
+        self.pool_size = max(pool_size or 1, 1)
+        self.serializer = message_serializer or GraphBinarySerializersV1()
+        self._ssl = ssl.create_default_context(ssl.Purpose.SERVER_AUTH) if protocol == "wss" else True
+        self._session: aiohttp.ClientSession = None
+        self._sockets: list = []
+        self._next_socket = 0
+        self._connect_lock: asyncio.Lock = None
+        self._logger.info("============>GREMLIN INIT ASYNC CLIENT<============")
+
+    async def close(self):
+        sockets, self._sockets = self._sockets, []
+        for socket in sockets:
+            await socket.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_socket(self) -> _GremlinWebSocket:
+        self._sockets = [socket for socket in self._sockets if not socket.closed]
+        if len(self._sockets) < self.pool_size:
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+            async with self._connect_lock:
+                self._sockets = [socket for socket in self._sockets if not socket.closed]
+                if len(self._sockets) < self.pool_size:
+                    if self._session is None or self._session.closed:
+                        self._session = aiohttp.ClientSession()
+                    websocket = await self._session.ws_connect(self.url, ssl=self._ssl, max_msg_size=0)
+                    self._sockets.append(_GremlinWebSocket(websocket, self.serializer, self.user, self.password))
+        self._next_socket = (self._next_socket + 1) % len(self._sockets)
+        return self._sockets[self._next_socket]
+
+    async def _submit(self, graph: str, query: str, params: dict = None) -> list:
+        traversal_source = self.tinkerpop_graphs.get(graph)
+        if not traversal_source:
+            raise KeyError("the selected graph is not available")
+        args = {"gremlin": query, "aliases": {"g": traversal_source}}
+        if params:
+            args["bindings"] = params
+        socket = await self._get_socket()
+        return await socket.submit(RequestMessage(processor="", op="eval", args=args))
+
+    async def run_query(
+            self, query: str, params: dict = {}, graph: str = None,
+            write: bool = False, result_as_df: bool = False, cardinality: str = CARDINALITY_LIST
+    ):
+        """
+        :param cardinality: see GremlinDataSource.run_query
+        """
+        batches = await self._submit(graph, query, params)
+        if result_as_df:
+            return GremlinDataSource._to_data_frame(GremlinDataSource._result_as_columns(batches, cardinality))
+        return [result for batch in batches for result in batch]
+
+    async def get_default_graph(self):
+        return next(iter(self.tinkerpop_graphs), None)
+
+    async def get_graphs(self):
+        return list(self.tinkerpop_graphs.keys())
+
+    async def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        """
+        see GremlinDataSource.graph_from_query
+        """
+        graph_result = GraphResult(properties)
+        for batch in await self._submit(graph, query, params):
+            for result in batch:
+                GremlinDataSource._add_to_graph(graph_result, result)
+        return graph_result
@@ -0,0 +1,91 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from datasource.MongoDbDataSource import MongoDbDataSource, MONGO_DB, BULK_CHUNK_SIZE
+from datasource.metaclass.SingletonMongoConnection import SingletonMongoConnection
+
+
+class AsyncMongoDbDataSource(metaclass=SingletonMongoConnection):
+    """
+    asyncio counterpart of MongoDbDataSource built on Motor, limited to the same collections
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MongoDbDataSource.get_mongo_uri(), MongoDbDataSource.get_mongo_port())
+        self.db = self.client.get_database(MONGO_DB)
+
+    def get_client(self):
+        return self.client
+
+    def get_collection(self, collection):
+        MongoDbDataSource._check_collection(collection)
+        return self.db.get_collection(collection)
+
+    async def insert_one(self, collection, doc_to_write):
+        return await self.get_collection(collection).insert_one(doc_to_write)
+
+    async def update_one(self, collection, query_filter, update):
+        return await self.get_collection(collection).update_one(query_filter, {'$set': update})
+
+    async def upsert_one(self, collection, query_filter, document):
+        return await self.get_collection(collection).replace_one(query_filter, document, True)
+
+    async def delete_one(self, collection, query_filter):
+        return await self.get_collection(collection).delete_one(query_filter)
+
+    async def find_one(self, collection, doc_id):
+        return await self.get_collection(collection).find_one({"_id": doc_id})
+
+    async def delete_all(self, collection):
+        await self.get_collection(collection).delete_many({})
+
+    async def bulk_write(self, collection, operations, ordered: bool = True, chunk_size: int = BULK_CHUNK_SIZE):
+        """
+        see MongoDbDataSource.bulk_write
+        """
+        target_collection = self.get_collection(collection)
+        totals = MongoDbDataSource._empty_bulk_result()
+        for offset, chunk in MongoDbDataSource._chunks(operations, chunk_size):
+            try:
+                result = await target_collection.bulk_write(chunk, ordered=ordered)
+                MongoDbDataSource._add_bulk_result(totals, result.bulk_api_result, offset)
+            except BulkWriteError as bwe:
+                MongoDbDataSource._add_bulk_result(totals, bwe.details, offset)
+                if ordered:
+                    raise BulkWriteError(totals)
+        if MongoDbDataSource._has_bulk_errors(totals):
+            raise BulkWriteError(totals)
+        return totals
+
+    async def insert_many(self, collection, documents, ordered: bool = True, chunk_size: int = BULK_CHUNK_SIZE):
+        return await self.bulk_write(collection, (InsertOne(document) for document in documents), ordered, chunk_size)
+
+    async def upsert_many(self, collection, documents, key="_id", ordered: bool = True,
+                          chunk_size: int = BULK_CHUNK_SIZE):
+        return await self.bulk_write(collection, MongoDbDataSource._upserts(documents, key), ordered, chunk_size)
+
+    def find_all(self, collection, query_filter: dict = None, projection=None, batch_size: int = 0, limit: int = 0):
+        """
+        :return: a Motor cursor, to be consumed with `async for`
+        """
+        return self.get_collection(collection).find(query_filter or {}, projection, batch_size=batch_size, limit=limit)
+
+    async def stream_all(self, collection, query_filter: dict = None, projection=None,
+                         batch_size: int = BULK_CHUNK_SIZE):
+        """
+        yields the matching documents as lists of at most `batch_size` documents
+        """
+        cursor = self.find_all(collection, query_filter, projection, batch_size=batch_size)
+        try:
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            await cursor.close()
+
+    @classmethod
+    def evict_singleton_instance(cls, instance_key=None):
+        SingletonMongoConnection.evict_instance(AsyncMongoDbDataSource, instance_key=instance_key)
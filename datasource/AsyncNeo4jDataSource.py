@@ -0,0 +1,101 @@
+import logging
+import neo4j
+
+from neo4j import AsyncGraphDatabase, AsyncResult
+from neo4j.exceptions import DriverError, Neo4jError
+
+from datasource.AsyncDataSourceAbstract import AsyncDataSourceAbstract
+from datasource.Neo4jDataSource import Neo4jDataSource, GET_DEFAULT_DB, GET_DBs, APOC_GRAPH_FROM_CYPHER
+
+
+class AsyncNeo4jDataSource(AsyncDataSourceAbstract):
+    _logger = logging.getLogger("AsyncNeo4jDataSource")
+
+    def __init__(self, protocol, uri, port, user, password, fetch_size: int = 1000):
+        auth = (user, password) if user and password else None
+        connection_uri = f"{protocol}://{uri}:{port or '7684'}"
+
+        self.driver = AsyncGraphDatabase.driver(connection_uri, auth=auth)
+        self.default_db = None
+        self.fetch_size = fetch_size
+
+    async def close(self):
+        await self.driver.close()
+
+    def _session(self, database=None, bookmarks=(), access_mode=neo4j.READ_ACCESS, fetch_size=None):
+        database = database or self.default_db
+        return self.driver.session(
+            database=database, bookmarks=bookmarks,
+            default_access_mode=access_mode, fetch_size=fetch_size or self.fetch_size
+        )
+
+    async def get_default_graph(self):
+        if not self.default_db:
+            try:
+                async with self._session() as ssn:
+                    query_result: AsyncResult = await ssn.run(GET_DEFAULT_DB)
+                    self.default_db = (await query_result.single())["name"]
+            except DriverError:
+                raise RuntimeError("an unexpected error occurred in the neo4j driver")
+            except Exception:
+                self.default_db = "neo4j"
+        return self.default_db
+
+    async def get_graphs(self):
+        databases = await self.run_query(query=GET_DBs)
+        return [database.get("name") for database in databases if database]
+
+    async def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = False,
+                        result_as_df: bool = False):
+        """
+        :param result_as_df: if true returns the result as dataframe pands
+        :param graph: the graph on which to execute the query
+        :param query: the string containing the cypher query to be executed
+        :param params: the parameters to be passed when executing the query
+        :param write: if set to true indicates that the query is in write, otherwise it is read-only query
+        :return: returns a list with the results of the query
+        """
+        graph = graph if graph else await self.get_default_graph()
+        self._logger.debug(f"LOG - DEBUG [neoj4 - query]: running query on {graph} DB instance:\n {query}")
+        access_mode = neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS
+        try:
+            async with self._session(database=graph, access_mode=access_mode) as ssn:
+                query_runner = self._run_query_df if result_as_df else self._run_query_dict
+                if not write:
+                    return await ssn.read_transaction(query_runner, query=query, params=params)
+                return await ssn.write_transaction(query_runner, query=query, params=params)
+        except (Neo4jError, DriverError) as nErr:
+            raise Neo4jDataSource._map_error(nErr)
+
+    async def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        graph = graph or await self.get_default_graph()
+        self._logger.debug(f"LOG - DEBUG [neoj4 - query]: running graph query on {graph} DB instance:\n {query}")
+        try:
+            async with self._session(database=graph) as ssn:
+                result = await ssn.read_transaction(
+                    self._run_query_single,
+                    APOC_GRAPH_FROM_CYPHER,
+                    {'query': query, 'param': params}
+                )
+                return Neo4jDataSource._graph_from_record(result, properties)
+        except (Neo4jError, DriverError) as nErr:
+            raise Neo4jDataSource._map_error(nErr)
+
+    """
+        utility methods
+    """
+
+    @classmethod
+    async def _run_query_dict(cls, tx, query, params):
+        res: AsyncResult = await tx.run(query=query, parameters=params)
+        return await res.data()
+
+    @classmethod
+    async def _run_query_df(cls, tx, query, params):
+        res: AsyncResult = await tx.run(query=query, parameters=params)
+        return await res.to_df()
+
+    @classmethod
+    async def _run_query_single(cls, tx, query, params):
+        res: AsyncResult = await tx.run(query=query, parameters=params)
+        return await res.single()
@@ -0,0 +1,191 @@
+import json
+import logging
+import pickle
+import sys
+import time
+
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future
+from threading import Lock
+
+from datasource.DataSourceAbstract import DataSourceAbstract
+
+CacheEntry = namedtuple("CacheEntry", ["value", "graph", "size", "expires_at"])
+
+
+class CachedDataSource(DataSourceAbstract):
+    """
+    Opt-in read-through cache around any DataSourceAbstract implementation.
+    Read results of `run_query` are kept in memory with LRU and TTL eviction inside a byte-size budget,
+    identical in-flight queries wait for the first caller instead of hitting the server again, and every
+    `write=True` query drops the cached entries of its graph.
+    Cached results are shared between callers and must not be mutated.
+    """
+
+    _logger = logging.getLogger("CachedDataSource")
+
+    def __init__(self, data_source: DataSourceAbstract, max_entries: int = 1024, ttl: float = 60,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.data_source = data_source
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._in_flight: dict = {}
+        self._generations: dict = {}
+        self._size = 0
+        self._lock: Lock = Lock()
+        self.stats: dict = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def __getattr__(self, item):
+        # backend specific methods (write_batch, run_traversal, ...) are delegated untouched
+        return getattr(self.data_source, item)
+
+    def get_default_graph(self):
+        return self.data_source.get_default_graph()
+
+    def get_graphs(self):
+        return self.data_source.get_graphs()
+
+    def close(self):
+        self.invalidate()
+        self.data_source.close()
+
+    def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        return self.data_source.graph_from_query(query, params=params, graph=graph, properties=properties)
+
+    def stream_query(
+            self, query: str, params: dict = {}, graph: str = None, write: bool = False,
+            fetch_size: int = None, batch_size: int = None
+    ):
+        records = self.data_source.stream_query(
+            query, params=params, graph=graph, write=write, fetch_size=fetch_size, batch_size=batch_size
+        )
+        if write:
+            return self._invalidate_after(records, graph or self.get_default_graph())
+        return records
+
+    @contextmanager
+    def transaction(self, graph: str = None, write: bool = False):
+        graph = graph or self.get_default_graph()
+        try:
+            with self.data_source.transaction(graph, write=write) as tx:
+                yield tx
+        finally:
+            if write:
+                self.invalidate(graph)
+
+    def run_query_paged(
+            self, query: str, params: dict = {}, graph: str = None, page_size: int = 10_000,
+            order_key: str = None, checkpoint: str = None, parallelism: int = 1
+    ):
+        # pages are not cached, a paginated result is far beyond the cache budget
+        return self.data_source.run_query_paged(
+            query, params=params, graph=graph, page_size=page_size, order_key=order_key,
+            checkpoint=checkpoint, parallelism=parallelism
+        )
+
+    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = None,
+                  result_as_df: bool = False):
+        graph = graph or self.get_default_graph()
+        if write:
+            try:
+                return self.data_source.run_query(query, params=params, graph=graph, write=True, result_as_df=result_as_df)
+            finally:
+                self.invalidate(graph)
+
+        key = (query, self._params_key(params), graph, result_as_df)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.value
+            if entry:
+                self._remove(key)
+            # a read is only joined by the readers of the same generation: one arriving after a write on the
+            # graph starts its own query instead of waiting for a value read before the write
+            generation = self._generations.setdefault(graph, 0)
+            in_flight_key = (key, generation)
+            future = self._in_flight.get(in_flight_key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[in_flight_key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = self.data_source.run_query(query, params=params, graph=graph, write=write, result_as_df=result_as_df)
+        except BaseException as ex:
+            with self._lock:
+                self._in_flight.pop(in_flight_key, None)
+            future.set_exception(ex)
+            raise
+        with self._lock:
+            self._in_flight.pop(in_flight_key, None)
+            # a write completed meanwhile on the graph: the value may be stale and is not stored
+            if self._generations.get(graph, 0) == generation:
+                self._store(key, value, graph)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, graph: str = None):
+        """
+        :param graph: the graph whose entries are dropped, if not set the whole cache is cleared
+        """
+        with self._lock:
+            self.stats["invalidations"] += 1
+            if graph is None:
+                self._entries.clear()
+                self._size = 0
+                for cached_graph in self._generations:
+                    self._generations[cached_graph] += 1
+                return
+            self._generations[graph] = self._generations.get(graph, 0) + 1
+            for key in [key for key, entry in self._entries.items() if entry.graph == graph]:
+                self._remove(key)
+
+    def _invalidate_after(self, records, graph: str):
+        """
+        yields the streamed records and drops the entries of the graph once the stream is exhausted or closed,
+        when its transaction is over: a read cached while the write was in progress is not kept
+        """
+        try:
+            yield from records
+        finally:
+            self.invalidate(graph)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._size)
+
+    def _store(self, key, value, graph):
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(value, graph, size, time.monotonic() + self.ttl)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    @classmethod
+    def _params_key(cls, params: dict):
+        return json.dumps(params, sort_keys=True, default=str) if params else ""
+
+    @classmethod
+    def _estimate_size(cls, value):
+        try:
+            return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(value)
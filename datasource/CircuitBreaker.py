@@ -0,0 +1,52 @@
+import random
+import time
+
+from threading import Lock
+
+
+class CircuitBreaker:
+    """
+    Guards the reconstruction of a backend driver: after `failure_threshold` consecutive failures the circuit
+    opens and callers are refused immediately; once the backoff expires a single caller is let through
+    (half-open) and its outcome closes the circuit again or reopens it with a doubled, jittered backoff.
+    """
+
+    CLOSED: str = "CLOSED"
+    OPEN: str = "OPEN"
+    HALF_OPEN: str = "HALF_OPEN"
+
+    def __init__(self, failure_threshold: int = 1, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self._next_backoff = backoff
+        self._lock: Lock = Lock()
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN or time.monotonic() < self.retry_at:
+            return False
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                return True
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._next_backoff = self.backoff
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                backoff = self._next_backoff * random.uniform(0.8, 1.2)
+                self.retry_at = time.monotonic() + backoff
+                self._next_backoff = min(self._next_backoff * 2, self.max_backoff)
+                self.state = self.OPEN
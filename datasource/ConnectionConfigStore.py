@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+
+from os import environ
+
+GRAPH_DB_CONNECTION_COLLECTION = "graphDbConnection"
+CONFIG_SNAPSHOT_ENV = "GRAPHDB_CONFIG_SNAPSHOT"
+
+
+class ConnectionConfigStore:
+    """
+    Local cache of the graphDbConnection documents: Mongo is read once and then only by `refresh()` or by the
+    background watcher. A snapshot file written by a previous run serves the first requests without waiting
+    for Mongo, which is then read once in the background and replaces it if it changed. The watcher follows the
+    collection through a change stream and falls back to polling when change streams are not available
+    (e.g. a standalone mongod). Listeners are called with the new documents whenever they change.
+    """
+
+    _logger = logging.getLogger("ConnectionConfigStore")
+
+    def __init__(self, mongo=None, snapshot_path: str = None, poll_interval: float = 30):
+        self._mongo = mongo
+        self._owns_mongo = mongo is None
+        self.snapshot_path = snapshot_path or environ.get(CONFIG_SNAPSHOT_ENV)
+        self.poll_interval = poll_interval
+        self._connections: list = None
+        self._listeners: list = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread = None
+
+    @property
+    def mongo(self):
+        # the Mongo client (and pymongo) is only loaded when the documents are read from Mongo
+        if self._mongo is None:
+            from datasource.MongoDbDataSource import MongoDbDataSource
+            self._mongo = MongoDbDataSource()
+        return self._mongo
+
+    def get_connections(self) -> list:
+        connections = self._connections
+        if connections is None:
+            with self._lock:
+                if self._connections is None:
+                    self._connections = self._read_snapshot()
+                    if self._connections is None:
+                        self._connections = self._read_mongo()
+                        self._write_snapshot(self._connections)
+                    else:
+                        self._refresh_in_background()
+                connections = self._connections
+        return connections
+
+    def refresh(self) -> bool:
+        """
+        reads the documents from Mongo and notifies the listeners if they changed
+        :return: true if the documents changed
+        """
+        connections = self._read_mongo()
+        with self._lock:
+            if connections == self._connections:
+                return False
+            self._connections = connections
+            self._write_snapshot(connections)
+        for listener in list(self._listeners):
+            try:
+                listener(connections)
+            except Exception as ex:
+                self._logger.error(f"graphdb.connection.reloadFailed: {ex}")
+        return True
+
+    def _refresh_in_background(self):
+        # the snapshot may be stale; while Mongo is unavailable it keeps serving
+        def refresh():
+            try:
+                self.refresh()
+            except Exception as ex:
+                self._logger.warning(f"graphdb.connection.snapshotNotRefreshed: {ex}")
+
+        threading.Thread(target=refresh, name="graphdb-config-refresh", daemon=True).start()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def start_watching(self):
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="graphdb-config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _after_fork(self):
+        """
+        keeps the documents read by the parent process; the lock, the watcher thread and the Mongo client
+        created by the store are not usable in the child and are created again
+        """
+        watching = self._watcher is not None and not self._stop.is_set()
+        self._lock, self._stop, self._watcher = threading.Lock(), threading.Event(), None
+        if self._owns_mongo:
+            self._mongo = None
+        if watching:
+            self.start_watching()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                collection = self.mongo.get_collection(GRAPH_DB_CONNECTION_COLLECTION)
+                with collection.watch(max_await_time_ms=int(self.poll_interval * 1000)) as stream:
+                    self.refresh()
+                    while not self._stop.is_set() and stream.alive:
+                        if stream.try_next() is not None:
+                            self.refresh()
+            except Exception as ex:
+                self._logger.info(f"change stream not available, polling graphDbConnection: {ex}")
+                self._poll()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as ex:
+                self._logger.error(f"graphdb.connection.reloadFailed: {ex}")
+
+    def _read_mongo(self) -> list:
+        # normalized like the snapshot (ObjectId as str), so both compare equal when nothing changed
+        return json.loads(json.dumps(list(self.mongo.find_all(GRAPH_DB_CONNECTION_COLLECTION)), default=str))
+
+    def _read_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path) as snapshot:
+                return json.load(snapshot)
+        except (OSError, ValueError) as ex:
+            self._logger.warning(f"ignoring unreadable graphDbConnection snapshot {self.snapshot_path}: {ex}")
+            return None
+
+    def _write_snapshot(self, connections: list):
+        if not self.snapshot_path or not connections:
+            return
+        temporary_path = f"{self.snapshot_path}.tmp"
+        try:
+            # the documents hold the credentials of the graph databases: the file is readable by its owner only,
+            # a temporary file left by an older run is replaced so its permissions are not inherited
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(descriptor, "w") as snapshot:
+                json.dump(connections, snapshot, default=str)
+            os.replace(temporary_path, self.snapshot_path)
+        except OSError as ex:
+            self._logger.warning(f"cannot write graphDbConnection snapshot {self.snapshot_path}: {ex}")
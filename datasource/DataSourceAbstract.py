@@ -1,8 +1,51 @@
+import base64
+import importlib
+import json
+import time
+
 from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+FanOutResult = namedtuple("FanOutResult", ["graph", "query", "result", "error", "elapsed"])
+Page = namedtuple("Page", ["rows", "checkpoint"])
+# the order keys JSON has no type for that a checkpoint can hold: they are written as ISO 8601 strings tagged
+# with their type and parsed back into the same value, any other key cannot be resumed exactly
+CHECKPOINT_KEY_TYPES = {
+    "datetime.date": ("datetime", "date", "fromisoformat"),
+    "datetime.datetime": ("datetime", "datetime", "fromisoformat"),
+    "datetime.time": ("datetime", "time", "fromisoformat"),
+    "neo4j.time.Date": ("neo4j.time", "Date", "from_iso_format"),
+    "neo4j.time.DateTime": ("neo4j.time", "DateTime", "from_iso_format"),
+    "neo4j.time.Time": ("neo4j.time", "Time", "from_iso_format")
+}
+
+
+class PendingResult:
+    """
+    Result of a statement submitted in a transaction, fetched from the server on the first call to `result()`
+    """
+
+    __slots__ = ("_fetch", "_value", "_done")
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._value = None
+        self._done = False
+
+    def result(self):
+        if not self._done:
+            self._value = self._fetch()
+            self._done = True
+        return self._value
 
 
 class DataSourceAbstract(ABC):
 
+    # true when the pages of run_query_paged are addressed by offset, so that they can be fetched concurrently
+    PAGES_BY_OFFSET: bool = False
+
     @abstractmethod
     def get_default_graph(self):
         ...
@@ -12,13 +55,230 @@ class DataSourceAbstract(ABC):
         ...
 
     @abstractmethod
-    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = False, result_as_df: bool = False):
+    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = None, result_as_df: bool = False):
+        """
+        :param write: true for a write, false for a read-only query; when not set (None) every data source
+                      applies its own default, Gremlin scripts being treated as writes
+        """
         ...
 
     @abstractmethod
-    def graph_from_query(self, query: str, params: dict = {}, graph: str = None):
+    def stream_query(
+            self, query: str, params: dict = {}, graph: str = None, write: bool = False,
+            fetch_size: int = None, batch_size: int = None
+    ):
+        ...
+
+    @abstractmethod
+    def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
         ...
 
     @abstractmethod
     def close(self):
-        ...
\ No newline at end of file
+        ...
+
+    def run_query_many(
+            self, queries, graphs: list = None, params: dict = {}, write: bool = None,
+            result_as_df: bool = False, max_workers: int = 8, timeout: float = None
+    ):
+        """
+        runs every query on every graph concurrently on a bounded pool of threads
+        :param queries: a query or a list of queries
+        :param graphs: the target graphs, by default every graph returned by get_graphs()
+        :param max_workers: the maximum number of queries running at the same time
+        :param timeout: the seconds a single target may run, once elapsed its FanOutResult carries a TimeoutError
+        :return: a generator yielding a FanOutResult(graph, query, result, error, elapsed) for every target
+                 as soon as it completes; a failed target carries its exception instead of stopping the others
+        """
+        queries = [queries] if isinstance(queries, str) else list(queries)
+        graphs = list(graphs) if graphs is not None else list(self.get_graphs())
+        targets = [(graph, query) for graph in graphs for query in queries]
+        started: dict = {}
+
+        def run_target(index, graph, query):
+            started[index] = time.monotonic()
+            return self.run_query(query, params=params, graph=graph, write=write, result_as_df=result_as_df)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            pending = {
+                executor.submit(run_target, index, graph, query): index
+                for index, (graph, query) in enumerate(targets)
+            }
+            while pending:
+                done, _ = wait(pending, timeout=timeout / 4 if timeout else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    graph, query = targets[index]
+                    elapsed = time.monotonic() - started.get(index, time.monotonic())
+                    error = future.exception()
+                    yield FanOutResult(graph, query, None if error else future.result(), error, elapsed)
+                if not timeout:
+                    continue
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    if index in started and now - started[index] > timeout:
+                        # the running query cannot be interrupted, its result is discarded
+                        pending.pop(future)
+                        graph, query = targets[index]
+                        error = TimeoutError(f"the query on {graph} did not complete in {timeout} seconds")
+                        yield FanOutResult(graph, query, None, error, now - started[index])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_query_many_as_df(
+            self, queries, graphs: list = None, params: dict = {},
+            max_workers: int = 8, timeout: float = None
+    ):
+        """
+        :return: the results of run_query_many merged into one pandas DataFrame with an extra `graph` column;
+                 the failed targets are listed in `df.attrs["failures"]` as FanOutResult
+        """
+        from pandas import concat, DataFrame
+        frames, failures = [], []
+        for fan_out_result in self.run_query_many(
+                queries, graphs=graphs, params=params, result_as_df=True, max_workers=max_workers, timeout=timeout
+        ):
+            if fan_out_result.error:
+                failures.append(fan_out_result)
+            else:
+                frames.append(fan_out_result.result.assign(graph=fan_out_result.graph))
+        data_frame = concat(frames, ignore_index=True) if frames else DataFrame()
+        data_frame.attrs["failures"] = failures
+        return data_frame
+
+    def run_query_paged(
+            self, query: str, params: dict = {}, graph: str = None, page_size: int = 10_000,
+            order_key: str = None, checkpoint: str = None, parallelism: int = 1
+    ):
+        """
+        runs a read query with a huge result one page at a time, every page in its own short transaction
+        (see `_fetch_page` of the backends for how the query must be written)
+        :param page_size: the number of rows of every page
+        :param order_key: the returned column the pages are ordered by, for the backends paging by key: its values
+                          must be unique, and JSON values or dates and times to be written in the checkpoints
+        :param checkpoint: the checkpoint of the last page consumed by a previous run, to resume right after it
+        :param parallelism: the number of pages fetched ahead of the consumer: concurrently when the backend
+                            pages by offset, otherwise the next page is fetched while the current one is consumed
+        :return: a generator yielding Page(rows, checkpoint) in order, the checkpoint of the last page is None
+        """
+        position = self._decode_checkpoint(checkpoint)
+        if parallelism <= 1:
+            while position is not None:
+                rows = self._fetch_page(query, params, graph, page_size, order_key, position)
+                position = self._next_page_position(position, rows, page_size, order_key)
+                yield Page(rows, self._encode_checkpoint(position))
+            return
+
+        executor = ThreadPoolExecutor(max_workers=parallelism)
+        pending = deque()
+
+        def submit(page_position):
+            return executor.submit(self._fetch_page, query, params, graph, page_size, order_key, page_position)
+
+        def fill(page_position):
+            # keyset pages wait for the last key of the previous one, offset pages are all known in advance
+            if not pending:
+                pending.append((page_position, submit(page_position)))
+            while self.PAGES_BY_OFFSET and len(pending) < parallelism:
+                ahead = self._next_page_position(pending[-1][0], None, page_size, order_key)
+                pending.append((ahead, submit(ahead)))
+
+        try:
+            fill(position)
+            while pending:
+                position, future = pending.popleft()
+                rows = future.result()
+                position = self._next_page_position(position, rows, page_size, order_key)
+                if position is None:
+                    # the pages fetched beyond the end are empty, they are discarded
+                    pending.clear()
+                else:
+                    fill(position)
+                yield Page(rows, self._encode_checkpoint(position))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def transaction(self, graph: str = None, write: bool = False):
+        """
+        unit of work running several statements in one transaction, to be used as
+        `with data_source.transaction(graph, write=True) as tx: tx.run(...)`;
+        the transaction is committed when the block exits and rolled back if it raises
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support transactions")
+
+    def _fetch_page(self, query: str, params: dict, graph: str, page_size: int, order_key: str, position: dict):
+        """
+        runs a single page of run_query_paged
+        :param position: `{"after": <last key>}` or `{"offset": <first row>}`, empty for the first page
+        :return: the rows of the page
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support paginated queries")
+
+    @classmethod
+    def _next_page_position(cls, position: dict, rows, page_size: int, order_key: str):
+        """
+        :return: the position of the page following the one at `position`, None if `rows` was the last page
+        """
+        if rows is not None and len(rows) < page_size:
+            return None
+        if cls.PAGES_BY_OFFSET:
+            return {"offset": position.get("offset", 0) + page_size}
+        return {"after": rows[-1][order_key]}
+
+    @classmethod
+    def _encode_checkpoint(cls, position: dict):
+        if position is None:
+            return None
+        after = position.get("after")
+        if isinstance(after, tuple) and type(after) is not tuple:
+            # neo4j points and durations are tuples, the json module would write them as plain arrays
+            cls._encode_order_key(after)
+        return base64.urlsafe_b64encode(json.dumps(position, default=cls._encode_order_key).encode()).decode()
+
+    @classmethod
+    def _encode_order_key(cls, value):
+        key_type = f"{type(value).__module__}.{type(value).__qualname__}"
+        if key_type not in CHECKPOINT_KEY_TYPES:
+            # as a string the key would be compared with values of another type, ending a resumed run early
+            raise ValueError(f"the order key of a paginated query cannot be checkpointed: {key_type}")
+        iso_format = value.iso_format() if hasattr(value, "iso_format") else value.isoformat()
+        return {"$type": key_type, "value": iso_format}
+
+    @classmethod
+    def _decode_order_key(cls, value: dict):
+        if set(value) != {"$type", "value"}:
+            return value
+        module_name, class_name, parse = CHECKPOINT_KEY_TYPES[value["$type"]]
+        return getattr(getattr(importlib.import_module(module_name), class_name), parse)(value["value"])
+
+    @classmethod
+    def _decode_checkpoint(cls, checkpoint: str):
+        if not checkpoint:
+            return {}
+        try:
+            return json.loads(base64.urlsafe_b64decode(checkpoint.encode()), object_hook=cls._decode_order_key)
+        except (ValueError, KeyError, ImportError):
+            raise ValueError("the checkpoint of the paginated query is not valid")
+
+    @classmethod
+    def _batch_records(cls, records, batch_size: int = None):
+        """
+        yields the records one by one or, if batch_size is set, as lists of at most batch_size records
+        """
+        if not batch_size:
+            yield from records
+            return
+        records = iter(records)
+        batch = list(islice(records, batch_size))
+        while batch:
+            yield batch
+            batch = list(islice(records, batch_size))
+
+    @classmethod
+    def _to_data_frame(cls, columns: dict):
+        """
+        builds a pandas DataFrame straight from column arrays, pandas is only needed when a data frame is requested
+        """
+        from pandas import DataFrame
+        return DataFrame(columns, copy=False)
@@ -1,90 +1,492 @@
+import asyncio
+import importlib
 import logging
+import os
+import time
 
-from datasource.GremlinDataSource import GremlinDataSource
-from datasource.Neo4jDataSource import Neo4jDataSource
-from datasource.MongoDbDataSource import MongoDbDataSource
+from threading import Event, Lock, Thread, Timer
+
+from datasource.CircuitBreaker import CircuitBreaker
+from datasource.ConnectionConfigStore import ConnectionConfigStore
+from datasource.Instrumentation import Instrumentation, default_instrumentation
 from datasource.metaclass.SingletonConnection import SingletonConnection
 
+# the backend modules (and so neo4j, gremlin_python, aiohttp) are imported only once a connection selects them
+DATA_SOURCE_CLASSES = {
+    "NEO4J": ("datasource.Neo4jDataSource", "Neo4jDataSource"),
+    "JANUSGRAPH": ("datasource.GremlinDataSource", "GremlinDataSource"),
+    "COSMOSDB": ("datasource.GremlinDataSource", "GremlinDataSource")
+}
+ASYNC_DATA_SOURCE_CLASSES = {
+    "NEO4J": ("datasource.AsyncNeo4jDataSource", "AsyncNeo4jDataSource"),
+    "JANUSGRAPH": ("datasource.AsyncGremlinDataSource", "AsyncGremlinDataSource"),
+    "COSMOSDB": ("datasource.AsyncGremlinDataSource", "AsyncGremlinDataSource")
+}
+
 
 class GdbConnection(metaclass=SingletonConnection):
 
     _logger = logging.getLogger("GdbConnection")
+    IDLE_TIMEOUT: float = 600
+    CLOSE_GRACE_PERIOD: float = 30
 
-    def __init__(self, mongo=None):
+    def __init__(self, mongo=None, idle_timeout: float = IDLE_TIMEOUT, close_grace_period: float = CLOSE_GRACE_PERIOD,
+                 instrumentation: Instrumentation = default_instrumentation,
+                 config_snapshot_path: str = None, watch_config: bool = False, config_poll_interval: float = 30,
+                 health_check_interval: float = None, failure_threshold: int = 1, retry_backoff: float = 1.0,
+                 max_retry_backoff: float = 60.0):
         self.connection_config: dict = {}
         self.driver = None
         self.connected = False
-        self.mongo = mongo or MongoDbDataSource()
+        self.async_driver = None
+        # guards the creation of the async driver, an asyncio.Lock belongs to the event loop it was created in
+        self._async_connect_lock: asyncio.Lock = None
+        self._async_connect_loop = None
+        # the process owning the drivers, a fork (even one not seen by os.register_at_fork) leaves them to the parent
+        self._pid = os.getpid()
+        self._inherited: list = []
+        # every graphDbConnection document by connection id, the graph routes and the lazily created data sources
+        # of the connections other than the default one, each one with the time it was last used
+        self.connection_configs: dict = {}
+        self.graph_routes: dict = {}
+        # the documents are applied one set at a time: the snapshot first read is never loaded over the newer
+        # documents the store read meanwhile from Mongo in the background
+        self._config_lock: Lock = Lock()
+        self.idle_timeout = idle_timeout
+        # the drivers replaced by a configuration change are closed after the requests already using them
+        self.close_grace_period = close_grace_period
+        self._data_sources: dict = {}
+        self._registry_lock: Lock = Lock()
+        # the routed data sources are created and probed outside the registry lock, one at a time per connection
+        self._build_locks: dict = {}
+        # every routed connection has its own circuit, opened by a failed build like the one of the default driver
+        self._circuit_breakers: dict = {}
+        # the idle routed data sources are closed by a daemon thread running while any of them is open
+        self._reaper_stop: Event = Event()
+        self._reaper: Thread = None
+        self.instrumentation = instrumentation
+        # the graphDbConnection documents are read through the store, never from Mongo on the request path;
+        # without an explicit mongo the store creates the MongoDbDataSource on its first read
+        self.config_store = ConnectionConfigStore(mongo, config_snapshot_path, config_poll_interval)
+        self.config_store.add_listener(self._on_config_change)
+        if watch_config:
+            self.config_store.start_watching()
+        # the default driver is rebuilt by one thread at a time, and not at all while the circuit is open:
+        # requests fail fast until the backoff expires or the health monitor sees the backend again
+        self.circuit_breaker = CircuitBreaker(failure_threshold, retry_backoff, max_retry_backoff)
+        self._connect_lock: Lock = Lock()
+        self.health_check_interval = health_check_interval
+        self._monitor_stop: Event = Event()
+        self._monitor: Thread = None
+        if health_check_interval:
+            self.start_health_monitor()
 
-    def check_driver(self):
-        if self.driver is None: raise ValueError("the driver instance is misconfigured")
+    @property
+    def mongo(self):
+        return self.config_store.mongo
+
+    def check_driver(self, driver=None):
+        default_driver = driver is None
+        driver = self.driver if default_driver else driver
+        if driver is None: raise ValueError("the driver instance is misconfigured")
         try:
-            if isinstance(self.driver, Neo4jDataSource):
-                self.driver.driver.verify_connectivity()
-            elif isinstance(self.driver, GremlinDataSource):
-                t = self.driver._get_traversal(self.driver.get_default_graph())
-                t.V().limit(1).count().next()
-            else:
-                raise Exception("the driver instance is misconfigured")
+            with self.instrumentation.timer("gdb.check_driver", type=driver.__class__.__name__):
+                self._probe_driver(driver)
         except Exception as ex:
-            self.connected = False
+            if default_driver:
+                self.connected = False
             raise ValueError(str(ex))
 
-    def get_graph_data_source(self):
-        if self.driver is None or not self.connected:
-            graph_connection_config: dict = self.get_graph_connection()
-
-            if graph_connection_config.get("type").upper() == "NEO4J":
-                driver = Neo4jDataSource(
-                    protocol=graph_connection_config.get("protocol"),
-                    uri=graph_connection_config.get("uri"),
-                    port=graph_connection_config.get("port"),
-                    user=graph_connection_config.get("user"),
-                    password=graph_connection_config.get("pass")
-                )
-            elif graph_connection_config.get("type").upper() in ["JANUSGRAPH", "COSMOSDB"]:
-                driver = GremlinDataSource(
-                    protocol=graph_connection_config.get("protocol"),
-                    host=graph_connection_config.get("uri"),
-                    port=graph_connection_config.get("port"),
-                    user=graph_connection_config.get("user"),
-                    password=graph_connection_config.get("pass")
-                )
-            else:
-                raise ValueError("unexpected.connector.type")
+    @classmethod
+    def _probe_driver(cls, driver):
+        if not hasattr(driver, "health_check"):
+            raise Exception("the driver instance is misconfigured")
+        driver.health_check()
+
+    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = None,
+                  result_as_df: bool = False):
+        """
+        runs the query on the data source of the connection serving the given graph
+        """
+        data_source = self.get_graph_data_source(graph)
+        if data_source is None:
+            raise ValueError("graphdb.connection.unavailable")
+        return data_source.run_query(query, params=params, graph=graph, write=write, result_as_df=result_as_df)
+
+    def get_graph_data_source(self, graph: str = None):
+        """
+        :param graph: if set, returns the data source of the connection configured for this graph
+        :return: the data source of the requested graph or of the default connection
+        """
+        # checked before routing too: a forked child must not reach the routed drivers of its parent
+        if self._pid != os.getpid():
+            self._after_fork()
+        if graph is not None:
+            self.get_graph_connection()
+            connection_id = self.graph_routes.get(graph)
+            if connection_id is not None and connection_id != self._connection_id(self.connection_config):
+                return self._get_routed_data_source(connection_id)
+
+        if self.driver is not None and self.connected:
+            return self.driver
+        if not self.circuit_breaker.allow_request():
+            return None
+        with self._connect_lock:
+            # another thread may have rebuilt the driver while this one was waiting for the lock
+            if self.driver is None or not self.connected:
+                self._connect()
+        return self.driver
+
+    def _connect(self):
+        graph_connection_config: dict = {}
+        try:
+            graph_connection_config = self.get_graph_connection()
+            with self.instrumentation.timer("gdb.driver_create", type=graph_connection_config.get("type")):
+                driver = self._create_data_source(graph_connection_config)
+        except Exception as ex:
+            # the documents cannot be read or the driver cannot be created: the circuit is reopened like after a
+            # failed probe, otherwise it would stay half-open and refuse every request from now on
+            self._logger.warning(f"graphdb.connection.unavailable: {ex}")
+            self._open_circuit(graph_connection_config)
+            raise
 
-            self.connection_config = graph_connection_config
+        self.connection_config = graph_connection_config
+        try:
+            self.check_driver(driver)
+        except ValueError as ex:
+            self._logger.warning(f"graphdb.connection.unavailable: {ex}")
+            driver.close()
+            self._open_circuit(graph_connection_config)
+            return
+        previous_driver = self.driver
+        self.driver, self.connected = driver, True
+        self.circuit_breaker.record_success()
+        if previous_driver is not None:
+            previous_driver.close()
+
+    def _open_circuit(self, graph_connection_config: dict):
+        if self.driver is not None:
+            self.driver.close()
+        self.driver, self.connected = None, False
+        self.circuit_breaker.record_failure()
+        self.instrumentation.record("gdb.circuit_open", 1, type=graph_connection_config.get("type"))
+
+    def _after_fork(self):
+        """
+        runs in a forked child: the drivers, pools, locks and threads inherited from the parent are dropped
+        without closing them (their sockets still serve the parent) and are created again on first use,
+        from the graphDbConnection documents already read by the parent
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._inherited.extend([self.driver, self.async_driver, *self._data_sources.values()])
+        self.driver, self.connected, self.async_driver = None, False, None
+        self._async_connect_lock, self._async_connect_loop = None, None
+        self._data_sources, self._build_locks, self._circuit_breakers = {}, {}, {}
+        self._registry_lock, self._connect_lock, self._config_lock = Lock(), Lock(), Lock()
+        self._reaper_stop, self._reaper = Event(), None
+        breaker = self.circuit_breaker
+        self.circuit_breaker = CircuitBreaker(breaker.failure_threshold, breaker.backoff, breaker.max_backoff)
+        monitoring = self._monitor is not None and not self._monitor_stop.is_set()
+        self._monitor_stop, self._monitor = Event(), None
+        self.config_store._after_fork()
+        if monitoring:
+            self.start_health_monitor()
+
+    def start_health_monitor(self, interval: float = None):
+        """
+        starts a daemon thread probing the default driver every `interval` seconds: a failing probe opens the
+        circuit, and the driver is rebuilt in the background once the backoff expires
+        """
+        self.health_check_interval = interval or self.health_check_interval or 10
+        if self._monitor and self._monitor.is_alive():
+            return
+        self._monitor_stop.clear()
+        self._monitor = Thread(target=self._monitor_health, name="graphdb-health-monitor", daemon=True)
+        self._monitor.start()
+
+    def stop_health_monitor(self):
+        self._monitor_stop.set()
+
+    def _monitor_health(self):
+        while not self._monitor_stop.wait(self.health_check_interval):
+            try:
+                self._check_health()
+            except Exception as ex:
+                self._logger.error(f"graphdb.connection.healthCheckFailed: {ex}")
+
+    def _check_health(self):
+        if self.driver is not None and self.connected:
             try:
-                self.driver = driver
                 self.check_driver()
-                self.connected = True
-            except ValueError:
-                del self.driver
-                self.driver = None
-                self.connected = False
-        return self.driver
+            except ValueError as ex:
+                self._logger.warning(f"graphdb.connection.unavailable: {ex}")
+                self.circuit_breaker.record_failure()
+        elif self.circuit_breaker.allow_request():
+            with self._connect_lock:
+                if self.driver is None or not self.connected:
+                    self._connect()
+
+    async def get_async_graph_data_source(self):
+        """
+        asyncio counterpart of get_graph_data_source, built from the same graphDbConnection document
+        """
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self.async_driver is not None:
+            return self.async_driver
+        loop = asyncio.get_running_loop()
+        if self._async_connect_lock is None or self._async_connect_loop is not loop:
+            self._async_connect_lock, self._async_connect_loop = asyncio.Lock(), loop
+        async with self._async_connect_lock:
+            # another task may have created the driver while this one was waiting for the lock
+            if self.async_driver is None:
+                graph_connection_config: dict = self.get_graph_connection()
+                driver = self._create_data_source(graph_connection_config, asynchronous=True)
+                try:
+                    if graph_connection_config.get("type").upper() == "NEO4J":
+                        await driver.driver.verify_connectivity()
+                    else:
+                        await driver.run_query(driver.HEALTH_CHECK_QUERY, graph=await driver.get_default_graph())
+                except Exception as ex:
+                    await driver.close()
+                    raise ValueError(str(ex))
+                self.async_driver = driver
+        return self.async_driver
+
+    @classmethod
+    def _create_data_source(cls, graph_connection_config: dict, asynchronous: bool = False):
+        data_source_class = cls._data_source_class(graph_connection_config.get("type"), asynchronous)
+        if graph_connection_config.get("type").upper() == "NEO4J":
+            return data_source_class(
+                protocol=graph_connection_config.get("protocol"),
+                uri=graph_connection_config.get("uri"),
+                port=graph_connection_config.get("port"),
+                user=graph_connection_config.get("user"),
+                password=graph_connection_config.get("pass")
+            )
+        return data_source_class(
+            protocol=graph_connection_config.get("protocol"),
+            host=graph_connection_config.get("uri"),
+            port=graph_connection_config.get("port"),
+            user=graph_connection_config.get("user"),
+            password=graph_connection_config.get("pass"),
+            tinkerpop_graphs=graph_connection_config.get("tinkerpopGraphs")
+        )
+
+    @classmethod
+    def _data_source_class(cls, connection_type: str, asynchronous: bool = False):
+        classes = ASYNC_DATA_SOURCE_CLASSES if asynchronous else DATA_SOURCE_CLASSES
+        module_name, class_name = classes.get((connection_type or "").upper(), (None, None))
+        if module_name is None:
+            raise ValueError("unexpected.connector.type")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def _get_routed_data_source(self, connection_id):
+        driver = self._touch_data_source(connection_id)
+        if driver is not None:
+            return driver
+        with self._registry_lock:
+            build_lock = self._build_locks.setdefault(connection_id, Lock())
+            circuit_breaker = self._circuit_breakers.get(connection_id)
+            if circuit_breaker is None:
+                breaker = self.circuit_breaker
+                circuit_breaker = self._circuit_breakers[connection_id] = CircuitBreaker(
+                    breaker.failure_threshold, breaker.backoff, breaker.max_backoff
+                )
+        # while the circuit is open the requests fail fast instead of waiting for a build that times out
+        if not circuit_breaker.allow_request():
+            return None
+        # requests to the other connections are served while this one is created and probed
+        with build_lock:
+            while True:
+                with self._registry_lock:
+                    entry = self._data_sources.get(connection_id)
+                    if entry is not None:
+                        entry[1] = time.monotonic()
+                        return entry[0]
+                    connection_config = self.connection_configs[connection_id]
+                # the build this request waited for failed
+                if circuit_breaker.state == CircuitBreaker.OPEN:
+                    return None
+                driver = None
+                try:
+                    with self.instrumentation.timer("gdb.driver_create", type=connection_config.get("type")):
+                        driver = self._create_data_source(connection_config)
+                    self.check_driver(driver)
+                except Exception as ex:
+                    self._logger.warning(f"graphdb.connection.unavailable: {connection_id}: {ex}")
+                    if driver is not None:
+                        driver.close()
+                    circuit_breaker.record_failure()
+                    self.instrumentation.record("gdb.circuit_open", 1, type=connection_config.get("type"))
+                    raise
+                circuit_breaker.record_success()
+                with self._registry_lock:
+                    # the document changed while the driver was created: it is built again from the new one
+                    registered = self.connection_configs.get(connection_id) is connection_config
+                    if registered:
+                        self._data_sources[connection_id] = [driver, time.monotonic()]
+                if registered:
+                    self._start_idle_reaper()
+                    return driver
+                driver.close()
+
+    def _touch_data_source(self, connection_id):
+        with self._registry_lock:
+            entry = self._data_sources.get(connection_id)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            return entry[0]
+
+    def _start_idle_reaper(self):
+        with self._registry_lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper_stop.clear()
+            self._reaper = Thread(target=self._reap_idle_data_sources, name="graphdb-idle-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_idle_data_sources(self):
+        # checked twice per idle timeout, so a data source is closed at most 1.5 timeouts after its last use
+        while not self._reaper_stop.wait(max(self.idle_timeout / 2, 0.01)):
+            try:
+                self._close_idle_data_sources()
+            except Exception as ex:
+                self._logger.error(f"graphdb.connection.closeIdleFailed: {ex}")
+            with self._registry_lock:
+                if not self._data_sources:
+                    self._reaper = None
+                    return
+
+    def _close_idle_data_sources(self, idle_timeout: float = None):
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        with self._registry_lock:
+            now = time.monotonic()
+            idle = [key for key, (_, last_used) in self._data_sources.items() if now - last_used >= idle_timeout]
+            drivers = [(connection_id, self._data_sources.pop(connection_id)[0]) for connection_id in idle]
+        for connection_id, driver in drivers:
+            self._logger.info(f"closing idle graph connection {connection_id}")
+            driver.close()
+
+    def close_data_sources(self):
+        """
+        closes the data sources of every connection other than the default one
+        """
+        self._reaper_stop.set()
+        self._close_idle_data_sources(idle_timeout=0)
 
     def get_graph_connection(self):
+        """
+        :return: the default connection, that is the only graphDbConnection document or the one marked as `default`
+        """
         if not self.connected:
-            connections = list(self.mongo.find_all("graphDbConnection"))
-            if connections is None or len(connections) != 1 or not isinstance(connections, list):
-                self._logger.error("graphdb.connection.misconfiguration")
-                raise ValueError("graphdb.connection.misconfiguration")
-
-            connection = connections[0]
-            if not connection.get("type"):
-                raise ValueError("graphdb.connection.misconfiguration")
-            if not connection.get("uri"):
-                raise ValueError("graphdb.connection.missingUriOrProtocol")
-            if connection.get("type") in ["COSMOSDB", "JANUSGRAPH"]:
-                if not connection.get("tinkerpopGraphs"):
-                    raise ValueError("graphdb.connection.misconfiguration")
-            elif not connection.get("protocol"):
-                raise ValueError("graphdb.connection.missingUriOrProtocol")
-            self.connection_config = connection
+            self.connection_config = self._select_default(self.get_graph_connections())
 
         return self.connection_config
 
     @classmethod
-    def evict_singleton_instance(cls):
-        SingletonConnection.evict_instance(GdbConnection)
+    def _select_default(cls, connections: dict):
+        defaults = [connection for connection in connections.values() if connection.get("default")]
+        if len(connections) == 1:
+            defaults = list(connections.values())
+        if len(defaults) != 1:
+            cls._logger.error("graphdb.connection.misconfiguration")
+            raise ValueError("graphdb.connection.misconfiguration")
+        return defaults[0]
+
+    def get_graph_connections(self, reload: bool = False):
+        """
+        :param reload: if true the documents are read again from Mongo, otherwise the cached ones are used
+        :return: every graphDbConnection document by connection id, the graphs each one serves
+                 (`graphs` or the keys of `tinkerpopGraphs`) are routed to it
+        """
+        if reload:
+            self.config_store.refresh()
+        if reload or not self.connection_configs:
+            with self._config_lock:
+                if reload or not self.connection_configs:
+                    self._load_connections(self.config_store.get_connections())
+        return self.connection_configs
+
+    def _load_connections(self, connections: list):
+        if not connections:
+            self._logger.error("graphdb.connection.misconfiguration")
+            raise ValueError("graphdb.connection.misconfiguration")
+        for connection in connections:
+            self._validate_connection(connection)
+
+        connection_configs = {self._connection_id(connection): connection for connection in connections}
+        self.graph_routes = {
+            graph: connection_id
+            for connection_id, connection in connection_configs.items()
+            for graph in connection.get("graphs") or (connection.get("tinkerpopGraphs") or {}).keys()
+        }
+        self.connection_configs = connection_configs
+
+    def _on_config_change(self, connections: list):
+        """
+        applies new graphDbConnection documents: the data sources of the changed connections are rebuilt
+        and swapped in only once connected, so requests keep using the previous driver meanwhile; the replaced
+        drivers are closed `close_grace_period` seconds later, once the requests running on them are over
+        """
+        with self._config_lock:
+            previous_configs = self.connection_configs
+            self._load_connections(connections)
+        with self._registry_lock:
+            changed = [
+                connection_id for connection_id in self._data_sources
+                if previous_configs.get(connection_id) != self.connection_configs.get(connection_id)
+            ]
+            replaced = [self._data_sources.pop(connection_id)[0] for connection_id in changed]
+            for connection_id in list(self._circuit_breakers):
+                if previous_configs.get(connection_id) != self.connection_configs.get(connection_id):
+                    del self._circuit_breakers[connection_id]
+        for driver in replaced:
+            self._close_later(driver)
+
+        default_config = self._select_default(self.connection_configs)
+        with self._connect_lock:
+            if self.driver is None or default_config == self.connection_config:
+                return
+            driver = self._create_data_source(default_config)
+            try:
+                self.check_driver(driver)
+            except ValueError:
+                driver.close()
+                raise
+            previous_driver = self.driver
+            self.driver, self.connection_config, self.connected = driver, default_config, True
+            self.circuit_breaker.record_success()
+        self._logger.info("graphdb.connection.reloaded")
+        self._close_later(previous_driver)
+
+    def _close_later(self, driver):
+        if self.close_grace_period <= 0:
+            driver.close()
+            return
+        timer = Timer(self.close_grace_period, driver.close)
+        timer.daemon = True
+        timer.start()
+
+    @classmethod
+    def _connection_id(cls, connection: dict):
+        return connection.get("name") or str(connection.get("_id"))
+
+    @classmethod
+    def _validate_connection(cls, connection: dict):
+        if not connection.get("type"):
+            raise ValueError("graphdb.connection.misconfiguration")
+        if not connection.get("uri"):
+            raise ValueError("graphdb.connection.missingUriOrProtocol")
+        if connection.get("type") in ["COSMOSDB", "JANUSGRAPH"]:
+            if not connection.get("tinkerpopGraphs"):
+                raise ValueError("graphdb.connection.misconfiguration")
+        elif not connection.get("protocol"):
+            raise ValueError("graphdb.connection.missingUriOrProtocol")
+
+    @classmethod
+    def evict_singleton_instance(cls, instance_key=None):
+        SingletonConnection.evict_instance(GdbConnection, instance_key=instance_key)
@@ -0,0 +1,429 @@
+import json
+import sys
+
+from collections.abc import Sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CHUNK_SIZE = 4096
+
+
+def _json_default(value):
+    """
+    encodes the property values JSON has no type for: label sets as sorted lists, neo4j dates and times
+    (and python ones) as ISO 8601 strings, anything else (e.g. the JanusGraph RelationIdentifier edge ids)
+    as its string. Tuples, among them neo4j points and durations, are arrays as the json module writes them
+    """
+    if isinstance(value, (set, frozenset)):
+        try:
+            return sorted(value)
+        except TypeError:
+            return list(value)
+    if isinstance(value, (tuple, ElementsView)):
+        return list(value)
+    if hasattr(value, "iso_format"):
+        return value.iso_format()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(value) -> bytes:
+    if orjson:
+        return orjson.dumps(value, default=_json_default)
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+
+class ElementsView(Sequence):
+    """
+    Read-only sequence of the nodes or the relationships of a GraphResult as the legacy dicts,
+    every dict built when the element is read
+    """
+
+    __slots__ = ("_length", "_element", "_elements")
+
+    def __init__(self, length: int, element, elements):
+        self._length = length
+        self._element = element
+        self._elements = elements
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._element(position) for position in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._element(index)
+
+    def __iter__(self):
+        return self._elements()
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, ElementsView)):
+            return len(self) == len(other) and all(element == item for element, item in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class GraphResult:
+    """
+    Compact graph returned by `graph_from_query`: nodes and edges are stored column-wise in parallel lists,
+    with an id-to-index map built on first lookup, instead of one nested dict per element.
+    The properties of every element are a tuple of values next to the tuple of their keys, which is shared
+    by all the elements with the same keys, so no dict is kept per element. With `intern` the label sets,
+    edge types and key tuples are shared and the string ids interned.
+    The legacy `{'nodes': [...], 'rels': [...]}` structure is available through `as_map()` (or
+    `result['nodes']` / `result.get('rels')`) as sequences building each dict on access, while `to_json()`
+    and `to_arrow()` serialize the columns directly.
+    """
+
+    __slots__ = (
+        "node_ids", "node_labels", "node_keys", "node_values", "node_metadata", "_node_index",
+        "edge_ids", "edge_types", "edge_sources", "edge_targets", "edge_keys", "edge_values", "_edge_index",
+        "properties", "intern", "_labels", "_keys", "_stubs"
+    )
+
+    def __init__(self, properties: list = None, intern: bool = True):
+        """
+        :param properties: if set only these property keys are kept
+        :param intern: if true labels, types and property keys are shared and string ids are interned
+        """
+        self.properties: tuple = tuple(properties) if properties is not None else None
+        self.intern = intern
+        self._labels: dict = {}
+        self._keys: dict = {}
+        # indexes of the nodes only known as the endpoint of an edge, filled in when the full node arrives
+        self._stubs: set = set()
+        self.node_ids: list = []
+        self.node_labels: list = []
+        self.node_keys: list = []
+        self.node_values: list = []
+        # metadata by node index, only for the nodes having some
+        self.node_metadata: dict = {}
+        self._node_index: dict = None
+        self.edge_ids: list = []
+        self.edge_types: list = []
+        self.edge_sources: list = []
+        self.edge_targets: list = []
+        self.edge_keys: list = []
+        self.edge_values: list = []
+        self._edge_index: dict = None
+
+    def __len__(self):
+        return len(self.node_ids) + len(self.edge_ids)
+
+    def __getitem__(self, key):
+        if key == "nodes":
+            return ElementsView(len(self.node_ids), self.node, self.nodes)
+        if key == "rels":
+            return ElementsView(len(self.edge_ids), self.rel, self.rels)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def split(self, properties) -> tuple:
+        """
+        :param properties: a mapping of properties (a dict or a driver Node/Relationship)
+        :return: the tuple of the keys, restricted to the projected ones if any, and the tuple of their values
+        """
+        keys = tuple(properties)
+        if self.properties is None:
+            if self.intern:
+                keys = self._keys.setdefault(keys, keys)
+            return keys, tuple([properties[key] for key in keys])
+        # the projected keys are worked out once per distinct set of keys
+        kept = self._keys.get(keys)
+        if kept is None:
+            kept = self._keys[keys] = tuple(key for key in self.properties if key in keys)
+        return kept, tuple([properties[key] for key in kept])
+
+    def _intern_id(self, element_id):
+        return sys.intern(element_id) if self.intern and type(element_id) is str else element_id
+
+    def _intern_labels(self, labels):
+        return self._labels.setdefault(labels, labels) if self.intern else labels
+
+    def add_node(self, node_id, labels, properties, metadata: dict = None, stub: bool = False) -> int:
+        """
+        :param stub: true for a node only referenced by an edge, whose labels and properties may be incomplete;
+                     it is replaced by the same node added later without `stub`
+        :return: the index of the node, a node already added is not added twice
+        """
+        node_id = self._intern_id(node_id)
+        index = self.node_index(node_id)
+        if index is None:
+            index = self._node_index[node_id] = len(self.node_ids)
+            keys, values = self.split(properties)
+            self.node_ids.append(node_id)
+            self.node_labels.append(self._intern_labels(labels))
+            self.node_keys.append(keys)
+            self.node_values.append(values)
+            if metadata:
+                self.node_metadata[index] = metadata
+            if stub:
+                self._stubs.add(index)
+        elif not stub and index in self._stubs:
+            self._stubs.discard(index)
+            self.node_labels[index] = self._intern_labels(labels)
+            self.node_keys[index], self.node_values[index] = self.split(properties)
+            if metadata:
+                self.node_metadata[index] = metadata
+        return index
+
+    def add_edge(self, edge_id, edge_type, source, target, properties) -> int:
+        """
+        :return: the index of the edge, an edge already added is not added twice
+        """
+        edge_id = self._intern_id(edge_id)
+        index = self.edge_index(edge_id)
+        if index is None:
+            index = self._edge_index[edge_id] = len(self.edge_ids)
+            keys, values = self.split(properties)
+            self.edge_ids.append(edge_id)
+            self.edge_types.append(sys.intern(edge_type) if self.intern and type(edge_type) is str else edge_type)
+            self.edge_sources.append(self._intern_id(source))
+            self.edge_targets.append(self._intern_id(target))
+            self.edge_keys.append(keys)
+            self.edge_values.append(values)
+        return index
+
+    def extend_nodes(self, nodes, metadata: dict = None):
+        """
+        appends driver nodes (objects with `id` and `labels` holding their properties as a mapping, like the
+        neo4j Node) in a single pass, keeping the first of repeated ids; on a non empty graph they go through add_node
+        :param metadata: metadata by node id, or by its string as apoc returns it
+        """
+        if self.node_ids:
+            for node in nodes:
+                self.add_node(node.id, node.labels, node)
+        else:
+            ids, labels, keys, values = self.node_ids, self.node_labels, self.node_keys, self.node_values
+            add_id, add_labels, add_keys, add_values = ids.append, labels.append, keys.append, values.append
+            shared_labels, shared_keys, projected = self._labels.setdefault, self._keys.setdefault, self._keys.get
+            intern, projection = self.intern, self.properties is not None
+            for node in nodes:
+                add_id(node.id)
+                node_labels = node.labels
+                add_labels(shared_labels(node_labels, node_labels) if intern else node_labels)
+                if projection:
+                    node_keys = projected(tuple(node))
+                    if node_keys is None:
+                        node_keys = self.split(node)[0]
+                    node_values = tuple([node[key] for key in node_keys])
+                else:
+                    node_keys, node_values = tuple(node), tuple(node.values())
+                    if intern:
+                        node_keys = shared_keys(node_keys, node_keys)
+                add_keys(node_keys)
+                add_values(node_values)
+            if intern and ids and type(ids[0]) is str:
+                self.node_ids = [self._intern_id(node_id) for node_id in ids]
+            self._node_index = None
+            if len(self.node_ids) != len(set(self.node_ids)):
+                self._drop_duplicates(("node_ids", "node_labels", "node_keys", "node_values"))
+        for node_id, node_metadata in (metadata or {}).items():
+            index = self.node_index(node_id)
+            if index is None and isinstance(node_id, str) and node_id.lstrip("-").isdigit():
+                index = self.node_index(int(node_id))
+            if index is not None and node_metadata:
+                self.node_metadata[index] = node_metadata
+
+    def extend_edges(self, edges):
+        """
+        appends driver relationships (objects with `id`, `type`, `start_node` and `end_node` holding their
+        properties as a mapping, like the neo4j Relationship) in a single pass, keeping the first of repeated ids;
+        on a non empty graph they go through add_edge
+        """
+        if self.edge_ids:
+            for edge in edges:
+                self.add_edge(edge.id, edge.type, edge.start_node.id, edge.end_node.id, edge)
+            return
+        ids, types, sources, targets = self.edge_ids, self.edge_types, self.edge_sources, self.edge_targets
+        add_id, add_type, add_source, add_target = ids.append, types.append, sources.append, targets.append
+        add_keys, add_values = self.edge_keys.append, self.edge_values.append
+        shared_keys, projected = self._keys.setdefault, self._keys.get
+        intern, projection = self.intern, self.properties is not None
+        for edge in edges:
+            add_id(edge.id)
+            add_type(edge.type)
+            add_source(edge.start_node.id)
+            add_target(edge.end_node.id)
+            if projection:
+                edge_keys = projected(tuple(edge))
+                if edge_keys is None:
+                    edge_keys = self.split(edge)[0]
+                edge_values = tuple([edge[key] for key in edge_keys])
+            else:
+                edge_keys, edge_values = tuple(edge), tuple(edge.values())
+                if intern:
+                    edge_keys = shared_keys(edge_keys, edge_keys)
+            add_keys(edge_keys)
+            add_values(edge_values)
+        if intern:
+            self.edge_types = [sys.intern(edge_type) if type(edge_type) is str else edge_type for edge_type in types]
+            if ids and type(ids[0]) is str:
+                self.edge_ids = [self._intern_id(edge_id) for edge_id in ids]
+            if sources and type(sources[0]) is str:
+                self.edge_sources = [self._intern_id(source) for source in sources]
+                self.edge_targets = [self._intern_id(target) for target in targets]
+        self._edge_index = None
+        if len(self.edge_ids) != len(set(self.edge_ids)):
+            self._drop_duplicates(
+                ("edge_ids", "edge_types", "edge_sources", "edge_targets", "edge_keys", "edge_values")
+            )
+
+    def _drop_duplicates(self, columns: tuple):
+        """
+        keeps only the first occurrence of every id in the given columns, the first one being the ids
+        """
+        first = {}
+        for index, element_id in enumerate(getattr(self, columns[0])):
+            first.setdefault(element_id, index)
+        kept = sorted(first.values())
+        for column in columns:
+            values = getattr(self, column)
+            setattr(self, column, [values[index] for index in kept])
+
+    def node_index(self, node_id):
+        if self._node_index is None:
+            self._node_index = {node_id: index for index, node_id in enumerate(self.node_ids)}
+        return self._node_index.get(node_id)
+
+    def edge_index(self, edge_id):
+        if self._edge_index is None:
+            self._edge_index = {edge_id: index for index, edge_id in enumerate(self.edge_ids)}
+        return self._edge_index.get(edge_id)
+
+    @property
+    def node_properties(self) -> ElementsView:
+        return ElementsView(len(self.node_ids), self.node_property_map, self._node_property_maps)
+
+    @property
+    def edge_properties(self) -> ElementsView:
+        return ElementsView(len(self.edge_ids), self.edge_property_map, self._edge_property_maps)
+
+    def node_property_map(self, index: int) -> dict:
+        return dict(zip(self.node_keys[index], self.node_values[index]))
+
+    def edge_property_map(self, index: int) -> dict:
+        return dict(zip(self.edge_keys[index], self.edge_values[index]))
+
+    def _node_property_maps(self):
+        return (dict(zip(keys, values)) for keys, values in zip(self.node_keys, self.node_values))
+
+    def _edge_property_maps(self):
+        return (dict(zip(keys, values)) for keys, values in zip(self.edge_keys, self.edge_values))
+
+    def node(self, index: int) -> dict:
+        return {
+            "id": self.node_ids[index], "labels": self.node_labels[index],
+            "properties": dict(zip(self.node_keys[index], self.node_values[index])),
+            "nodeMetadata": self.node_metadata.get(index, {})
+        }
+
+    def rel(self, index: int) -> dict:
+        return {
+            "id": self.edge_ids[index], "type": self.edge_types[index],
+            "source": self.edge_sources[index], "target": self.edge_targets[index],
+            "properties": dict(zip(self.edge_keys[index], self.edge_values[index]))
+        }
+
+    def nodes(self):
+        metadata = self.node_metadata
+        for index, (node_id, labels, keys, values) in enumerate(zip(
+                self.node_ids, self.node_labels, self.node_keys, self.node_values
+        )):
+            yield {
+                "id": node_id, "labels": labels, "properties": dict(zip(keys, values)),
+                "nodeMetadata": metadata.get(index, {})
+            }
+
+    def rels(self):
+        for edge_id, edge_type, source, target, keys, values in zip(
+                self.edge_ids, self.edge_types, self.edge_sources, self.edge_targets, self.edge_keys, self.edge_values
+        ):
+            yield {"id": edge_id, "type": edge_type, "source": source, "target": target, "properties": dict(zip(keys, values))}
+
+    def as_map(self):
+        return {"nodes": self["nodes"], "rels": self["rels"]}
+
+    def iter_json(self, chunk_size: int = JSON_CHUNK_SIZE):
+        """
+        streams the `as_map()` structure as JSON bytes, encoded from the columns `chunk_size` elements at a time
+        (through orjson when it is installed), so only one chunk of element dicts exists at any time
+        """
+        # every label set is sorted once, not once per node
+        sorted_labels: dict = {}
+        metadata = self.node_metadata
+        node_columns = (self.node_ids, self.node_labels, self.node_keys, self.node_values)
+        edge_columns = (
+            self.edge_ids, self.edge_types, self.edge_sources, self.edge_targets, self.edge_keys, self.edge_values
+        )
+
+        def node_chunk(start, end):
+            chunk = []
+            for index, node_id, labels, keys, values in zip(
+                    range(start, end), *(column[start:end] for column in node_columns)
+            ):
+                labels_list = sorted_labels.get(labels)
+                if labels_list is None:
+                    labels_list = sorted_labels[labels] = _json_default(labels)
+                chunk.append({
+                    "id": node_id, "labels": labels_list, "properties": dict(zip(keys, values)),
+                    "nodeMetadata": metadata.get(index, {})
+                })
+            return chunk
+
+        def edge_chunk(start, end):
+            return [
+                {"id": edge_id, "type": edge_type, "source": source, "target": target, "properties": dict(zip(keys, values))}
+                for edge_id, edge_type, source, target, keys, values in zip(*(column[start:end] for column in edge_columns))
+            ]
+
+        for prefix, length, chunk in ((b'{"nodes":[', len(self.node_ids), node_chunk), (b'],"rels":[', len(self.edge_ids), edge_chunk)):
+            yield prefix
+            for start in range(0, length, chunk_size):
+                encoded = _dumps(chunk(start, min(start + chunk_size, length)))
+                # the brackets of the chunk array are dropped, the chunks are joined into the enclosing array
+                yield encoded[1:-1] if start == 0 else b"," + encoded[1:-1]
+        yield b"]}"
+
+    def to_json(self) -> bytes:
+        """
+        :return: the `as_map()` structure encoded as JSON bytes, see iter_json
+        """
+        return b"".join(self.iter_json())
+
+    def to_arrow(self):
+        """
+        :return: a dict with the "nodes" and "rels" pyarrow Tables, properties and metadata are JSON encoded
+                 because their keys and types change from element to element
+        """
+        import pyarrow
+        nodes = pyarrow.table({
+            "id": self.node_ids,
+            "labels": [sorted(labels) for labels in self.node_labels],
+            "properties": [_dumps(dict(zip(keys, values))) for keys, values in zip(self.node_keys, self.node_values)],
+            "nodeMetadata": [_dumps(self.node_metadata.get(index, {})) for index in range(len(self.node_ids))]
+        })
+        rels = pyarrow.table({
+            "id": self.edge_ids,
+            "type": self.edge_types,
+            "source": self.edge_sources,
+            "target": self.edge_targets,
+            "properties": [_dumps(dict(zip(keys, values))) for keys, values in zip(self.edge_keys, self.edge_values)]
+        })
+        return {"nodes": nodes, "rels": rels}
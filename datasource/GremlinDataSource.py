@@ -1,111 +1,507 @@
 import logging
+import re
 import ssl
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from enum import Enum
+from threading import Lock
 from gremlin_python.driver.aiohttp.transport import AiohttpTransport
 from gremlin_python.driver.client import Client
 from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+from gremlin_python.driver.protocol import GremlinServerError
+from gremlin_python.driver.remote_connection import RemoteConnection
 from gremlin_python.process.anonymous_traversal import traversal
+from gremlin_python.structure.graph import Edge, Path, Vertex
 
-from datasource.DataSourceAbstract import DataSourceAbstract
+from datasource.DataSourceAbstract import DataSourceAbstract, PendingResult
+from datasource.GraphResult import GraphResult
+from datasource.Instrumentation import Instrumentation, default_instrumentation
+from datasource.RetryPolicy import RetryPolicy
+
+SCRIPT_CACHE_SIZE = 1024
+SCRIPT_BINDING_PREFIX = "_gp"
+# server side failures worth replaying: JanusGraph lock/backend contention, Cosmos DB throttling and timeouts
+TRANSIENT_ERRORS = ("TemporaryBackendException", "TemporaryLockingException", "ConcurrentModificationException")
+TRANSIENT_COSMOS_STATUS = {"408", "429", "449", "503"}
+RANGE_PAGE = "{query}.range(_pageStart, _pageEnd)"
+# data frame columns of valueMap results: the property lists as returned, or one value per property
+CARDINALITY_LIST = "list"
+CARDINALITY_SINGLE = "single"
+SCRIPT_LITERAL = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])""")
+SCRIPT_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+ESCAPED_CHARACTERS = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "0": "\0"}
+ScriptCacheInfo = namedtuple("ScriptCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+_templates: OrderedDict = OrderedDict()
+_templates_lock: Lock = Lock()
+_templates_stats: dict = {"hits": 0, "misses": 0}
+
+
+def normalize_script(query: str):
+    """
+    replaces the string and number literals of a gremlin script with bindings, so that scripts differing
+    only by their values share one template compiled once by the gremlin server script cache.
+    Double quoted strings with a `${...}` placeholder are GStrings evaluated by the server, they are kept.
+    The templates are kept in an LRU of SCRIPT_CACHE_SIZE entries: repeated templates are submitted as the same
+    string object and a miss is a template the server has to compile (see script_cache_info)
+    :return: the script template and the tuple of literals to be bound to `_gp0`, `_gp1`, ...
+    """
+    literals = []
+
+    def to_binding(match):
+        literal = match.group(0)
+        if literal[0] == '"' and "$" in SCRIPT_ESCAPE.sub("", literal):
+            return literal
+        literals.append(literal)
+        return f"{SCRIPT_BINDING_PREFIX}{len(literals) - 1}"
+
+    template = SCRIPT_LITERAL.sub(to_binding, query)
+    with _templates_lock:
+        cached = _templates.get(template)
+        if cached is None:
+            _templates_stats["misses"] += 1
+            cached = _templates[template] = template
+            if len(_templates) > SCRIPT_CACHE_SIZE:
+                _templates.popitem(last=False)
+        else:
+            _templates_stats["hits"] += 1
+            _templates.move_to_end(template)
+    return cached, tuple(literals)
+
+
+def _literal_value(literal: str):
+    if literal[0] in "'\"":
+        return SCRIPT_ESCAPE.sub(_unescape, literal[1:-1])
+    return float(literal) if "." in literal else int(literal)
+
+
+def _unescape(match) -> str:
+    escaped = match.group(1)
+    if len(escaped) == 5:
+        return chr(int(escaped[1:], 16))
+    return ESCAPED_CHARACTERS.get(escaped, escaped)
+
+
+class SharedClientRemoteConnection(DriverRemoteConnection):
+    """
+    Bytecode remote connection submitting through the pooled Client of the data source,
+    instead of opening a websocket pool of its own for every traversal source.
+    """
+
+    def __init__(self, client: Client, traversal_source: str):
+        RemoteConnection.__init__(self, client._url, traversal_source)
+        self._client = client
+        self._url = client._url
+        self._traversal_source = traversal_source
+        self._session = None
+        self._DriverRemoteConnection__spawned_sessions = []
+
+    def _extract_request_options(self, bytecode):
+        # shadows the static method called by submit and submit_async: the shared Client would otherwise
+        # run every traversal on the traversal source it was created with
+        request_options = DriverRemoteConnection._extract_request_options(bytecode) or {}
+        request_options["aliases"] = {"g": self._traversal_source}
+        return request_options
+
+    def close(self):
+        # the pool belongs to the data source, which closes it
+        pass
+
+
+class _GremlinTransaction:
+    """
+    Statements of GremlinDataSource.transaction, all submitted on one gremlin server session
+    """
+
+    __slots__ = ("data_source", "client", "pending")
+
+    def __init__(self, data_source, client: Client):
+        self.data_source = data_source
+        self.client = client
+        self.pending: list = []
+
+    def run(self, query: str, params: dict = {}):
+        """
+        :return: the results of the script
+        """
+        return self.submit(query, params).result()
+
+    def submit(self, query: str, params: dict = {}) -> PendingResult:
+        script, bindings = self.data_source._prepare_script(query, params)
+        future = self.client.submit_async(script, bindings=bindings)
+        pending = PendingResult(lambda: future.result().all().result())
+        self.pending.append(pending)
+        return pending
+
+    def flush(self):
+        for pending in self.pending:
+            pending.result()
 
 
 class GremlinDataSource(DataSourceAbstract):
 
-    _logger = logging.getLogger("Neo4jDataSource")
+    _logger = logging.getLogger("GremlinDataSource")
     _CONNECTION_STRING: str = "{protocol}://{host}:{port}/gremlin"
+    HEALTH_CHECK_QUERY: str = "g.inject(1)"
+    PAGES_BY_OFFSET: bool = True
 
     def __init__(
             self, protocol: str = None, host: str = "localhost",
             port: str = "8182", user: str = "", password: str = "",
-            tinkerpop_graphs: dict = {}
+            tinkerpop_graphs: dict = {}, normalize_scripts: bool = False,
+            pool_size: int = None, max_workers: int = None, health_check_query: str = HEALTH_CHECK_QUERY,
+            instrumentation: Instrumentation = default_instrumentation, retry_policy: RetryPolicy = None,
+            session_pool_size: int = 4
     ):
+        """
+        a single pooled Client serves every traversal source of the endpoint: scripts select their graph
+        through the `aliases` request option, and the bytecode remote connections of the graphs are created
+        lazily on top of the same pool
+        :param pool_size: the number of websocket connections of the pool, that is the maximum number of
+                          requests in flight since each connection carries one request at a time
+        :param max_workers: the number of threads of the client executor
+        :param session_pool_size: the number of idle gremlin sessions kept for the transactions of every
+                                  traversal source, each one a client with its own websocket
+        """
         connection_string = self._CONNECTION_STRING.format(protocol=protocol, host=host, port=port)
         self.tinkerpop_graphs = tinkerpop_graphs
-        self._logger.info(f"============>GREMLIN INIT CLIENTS<============")
-        self.clients: dict = {
-            key: self._init_clients(
-                traversal_source=value, connection_string=connection_string,
-                user=user, password=password
-            )
-            for key, value in tinkerpop_graphs.items() if value
-        }
-        self._logger.info(f"============>GREMLIN INIT CONNECTIONS<============")
-        self._connections: dict = {
-            key: self._init_connection(
-                traversal_source=value, connection_string=connection_string,
-                user=user, password=password
-            )
-            for key, value in tinkerpop_graphs.items() if value
-        }
-        self._logger.info(f"============>GREMLIN INIT TRAVERSALS<============")
-        self.traversals: dict = {
-            key: traversal().with_remote(value)
-            for key, value in self._connections.items() if value
-        }
+        self.normalize_scripts = normalize_scripts
+        self.health_check_query = health_check_query
+        self.instrumentation = instrumentation
+        self.retry_policy = retry_policy or RetryPolicy(self.is_transient, backend="gremlin", instrumentation=instrumentation)
+        self._logger.info(f"============>GREMLIN INIT CLIENT<============")
+        # kept to open the session clients of the transactions
+        self._client_options: dict = dict(
+            connection_string=connection_string, user=user, password=password, use_ssl=protocol == "wss"
+        )
+        self.client: Client = self._init_client(
+            traversal_source=next(iter(tinkerpop_graphs.values()), "g"),
+            pool_size=pool_size, max_workers=max_workers, **self._client_options
+        )
+        self._connections: dict = {}
+        self.traversals: dict = {}
+        # idle session clients by traversal source, reused by the next transactions
+        self.session_pool_size = session_pool_size
+        self._sessions: dict = {}
+        self._sessions_lock: Lock = Lock()
 
     def __del__(self):
-        for client in self.clients.values():
-            client.close()
-        for connection in self._connections.values():
-            connection.close()
+        self.close()
 
     def close(self):
-        for client in self.clients.values(): client.close()
-        for connection in self._connections.values(): connection.close()
+        if getattr(self, "client", None): self.client.close()
+        if not getattr(self, "_sessions", None):
+            return
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for client in (client for idle in sessions.values() for client in idle):
+            client.close()
 
     def _get_traversal(self, graph: str):
-        if self.traversals:
-            return self.traversals.get(graph)
+        traversal_source = self.tinkerpop_graphs.get(graph)
+        if not traversal_source:
+            return None
+        if graph not in self.traversals:
+            self._connections[graph] = SharedClientRemoteConnection(self.client, traversal_source)
+            self.traversals[graph] = traversal().with_remote(self._connections[graph])
+        return self.traversals.get(graph)
 
     def _get_client(self, graph: str) -> Client:
-        if self.clients:
-            return self.clients.get(graph)
+        if self.tinkerpop_graphs.get(graph):
+            return self.client
 
-    @classmethod
-    def _init_connection(
-            cls, connection_string: str = "ws://localhost:{8182}/gremlin",
-            user: str = "", password: str = "", traversal_source: str = "g"
-    ) -> DriverRemoteConnection:
+    def _submit(self, graph: str, script: str, bindings: dict = None, request_options: dict = None):
+        traversal_source = self.tinkerpop_graphs.get(graph)
+        if not traversal_source:
+            raise KeyError("the selected graph is not available")
+        request_options = dict(request_options or {}, aliases={"g": traversal_source})
+        return self.client.submit(message=script, bindings=bindings, request_options=request_options)
 
-        transport_factory = None
-        if not user and not password:
-            transport_factory = lambda: AiohttpTransport(ssl_options=ssl.create_default_context(ssl.Purpose.CLIENT_AUTH))
-        return DriverRemoteConnection(
-            url=connection_string, traversal_source=traversal_source,
-            username=user, password=password,
-            transport_factory=transport_factory
-        )
+    def health_check(self, graph: str = None):
+        """
+        runs the configured health check query on the graph (by default on the first one)
+        """
+        return self._submit(graph or self.get_default_graph(), self.health_check_query).all().result()
 
     @classmethod
-    def _init_clients(
+    def _init_client(
             cls, connection_string: str = "ws://localhost:{8182}/gremlin",
-            user: str = "", password: str = "", traversal_source: str = "g"
+            user: str = "", password: str = "", traversal_source: str = "g",
+            pool_size: int = None, max_workers: int = None, use_ssl: bool = False, session: str = None
     ) -> Client:
-        return Client(url=connection_string, traversal_source=traversal_source, username=user, password=password)
+        transport_factory = None
+        if use_ssl:
+            transport_factory = lambda: AiohttpTransport(ssl_options=ssl.create_default_context(ssl.Purpose.SERVER_AUTH))
+        return Client(
+            url=connection_string, traversal_source=traversal_source, username=user, password=password,
+            pool_size=pool_size, max_workers=max_workers, transport_factory=transport_factory, session=session
+        )
 
     def run_query(
             self, query: str, params: dict = {}, graph: str = None,
-            write: bool = False, result_as_df: bool = False
+            write: bool = None, result_as_df: bool = False, idempotent: bool = False,
+            cardinality: str = CARDINALITY_LIST
     ):
-        if result_as_df:
-            """
-                if the query returns a list of dictionaries, 
-                you could use `DataFrame.from_dict(vm)` to generate the pandas DataFrame
-            """
-            raise NotImplementedError("Gremlin query result conversion into a pandas data frame has not yet been implemented")
-        graph_client: Client = self._get_client(graph)
-        if graph_client:
-            return graph_client.submit(message=query).all().response()
-        else:
+        """
+        :param write: false marks the script read-only, so that it is replayed after a transient error; any gremlin
+                      script may mutate the graph, so one not marked (None) is a write and never replayed
+        :param idempotent: if true a write failing with a transient error is replayed like a read
+        :param cardinality: how the data frame columns are built, "list" keeps the property values as returned
+                            (valueMap wraps every value in a list), "single" unwraps them and raises a ValueError
+                            for a property with several values
+        """
+        start = time.perf_counter()
+        script, bindings = self._prepare_script(query, params)
+
+        def attempt_query():
+            result_set = self._submit(graph, script, bindings)
+            if result_as_df:
+                return self._to_data_frame(self._result_as_columns(result_set, cardinality))
+            return result_set.all().result()
+
+        result = self.retry_policy.run(attempt_query, write=write is not False, idempotent=idempotent, graph=graph)
+        elapsed = time.perf_counter() - start
+        self.instrumentation.record("gremlin.run_query", elapsed * 1_000_000, graph=graph)
+        self.instrumentation.record("gremlin.rows", len(result), graph=graph)
+        self.instrumentation.slow_query(query, elapsed * 1000, graph=graph)
+        return result
+
+    @classmethod
+    def _result_as_columns(cls, result_set, cardinality: str = CARDINALITY_LIST):
+        """
+        builds column arrays directly from the server batches of valueMap/elementMap/project results;
+        keys missing from a result are filled with None. The column types depend only on the cardinality,
+        never on the values: with "single" every list value is unwrapped, an empty list becoming None
+        :return: a dict mapping every column name to its list of values
+        """
+        if cardinality not in (CARDINALITY_LIST, CARDINALITY_SINGLE):
+            raise ValueError(f"unexpected cardinality {cardinality}")
+        columns: dict = {}
+        rows = 0
+        for server_batch in result_set:
+            for result in server_batch:
+                if not isinstance(result, dict):
+                    result = {"value": result}
+                for key, value in result.items():
+                    column = columns.get(key)
+                    if column is None:
+                        column = columns[key] = [None] * rows
+                    column.append(value)
+                rows += 1
+                for column in columns.values():
+                    if len(column) < rows:
+                        column.append(None)
+        columns = {cls._column_name(key): column for key, column in columns.items()}
+        if cardinality == CARDINALITY_SINGLE:
+            return {name: cls._single_values(name, column) for name, column in columns.items()}
+        return columns
+
+    @classmethod
+    def _column_name(cls, key):
+        # elementMap uses the T.id / T.label enum members as keys
+        return key.name if isinstance(key, Enum) else key
+
+    @classmethod
+    def _single_values(cls, name, column: list):
+        values = []
+        for value in column:
+            if isinstance(value, list):
+                if len(value) > 1:
+                    raise ValueError(f"the property {name} has several values, it cannot be read with single cardinality")
+                value = value[0] if value else None
+            values.append(value)
+        return values
+
+    @contextmanager
+    def transaction(self, graph: str = None, write: bool = False):
+        """
+        unit of work on a gremlin server session: the scripts run with `tx.run(query, params)` or
+        `tx.submit(query, params)` share the session transaction, committed with `g.tx().commit()` when a write
+        block exits and rolled back if it raises (the graph must support transactions, e.g. JanusGraph;
+        Cosmos DB has no sessions). The session is kept for the next unit of work on the traversal source,
+        up to `session_pool_size` idle sessions, and closed after a failure
+        """
+        graph = graph or self.get_default_graph()
+        traversal_source = self.tinkerpop_graphs.get(graph)
+        if not traversal_source:
+            raise KeyError("the selected graph is not available")
+        start = time.perf_counter()
+        client = self._acquire_session(traversal_source)
+        unit = _GremlinTransaction(self, client)
+        try:
+            yield unit
+            unit.flush()
+            if write:
+                client.submit("g.tx().commit()").all().result()
+        except BaseException:
+            if write:
+                try:
+                    client.submit("g.tx().rollback()").all().result()
+                except Exception as ex:
+                    self._logger.warning(f"rollback of the gremlin session failed: {ex}")
+            client.close()
+            raise
+        self._release_session(traversal_source, client, write)
+        self.instrumentation.record(
+            "gremlin.transaction", (time.perf_counter() - start) * 1_000_000, graph=graph, write=write
+        )
+        self.instrumentation.record("gremlin.transaction_statements", len(unit.pending), graph=graph)
+
+    def _acquire_session(self, traversal_source: str) -> Client:
+        with self._sessions_lock:
+            idle = self._sessions.get(traversal_source)
+            if idle:
+                return idle.pop()
+        # a session is bound to a single connection, so it gets its own client: opening it costs the websocket,
+        # TLS and authentication handshakes, which the pooled sessions pay once
+        return self._init_client(
+            traversal_source=traversal_source, pool_size=1, session=str(uuid.uuid4()), **self._client_options
+        )
+
+    def _release_session(self, traversal_source: str, client: Client, committed: bool):
+        if not committed:
+            # the reads may have opened a transaction on the graph, it must not be seen by the next unit of work;
+            # a graph without transactions refuses the rollback and its session is closed instead
+            try:
+                client.submit("g.tx().rollback()").all().result()
+            except Exception:
+                client.close()
+                return
+        with self._sessions_lock:
+            idle = self._sessions.setdefault(traversal_source, [])
+            if len(idle) < self.session_pool_size:
+                idle.append(client)
+                return
+        client.close()
+
+    def run_traversal(self, traversal_builder, graph: str = None):
+        """
+        bytecode path: the traversal is built on the remote traversal source of the graph and sent
+        as bytecode, so the gremlin server never has to compile a script
+        :param traversal_builder: a callable receiving the GraphTraversalSource and returning the traversal
+        :param graph: the graph on which to execute the traversal
+        :return: returns a list with the results of the traversal
+        """
+        g = self._get_traversal(graph)
+        if not g:
             raise KeyError("the selected graph is not available")
+        return traversal_builder(g).toList()
+
+    def _prepare_script(self, query: str, params: dict = None):
+        """
+        :return: the script to submit and its bindings, built from the params and, if normalize_scripts
+                 is enabled, from the literals extracted out of the script
+        """
+        bindings = dict(params) if params else {}
+        if not self.normalize_scripts:
+            return query, bindings or None
+        template, literals = normalize_script(query)
+        bindings.update({f"{SCRIPT_BINDING_PREFIX}{index}": _literal_value(literal) for index, literal in enumerate(literals)})
+        return template, bindings or None
+
+    def _fetch_page(self, query: str, params: dict, graph: str, page_size: int, order_key: str, position: dict):
+        """
+        offset pagination with `range()`: the query must be a traversal with a stable order
+        (e.g. `g.V().hasLabel('person').order().by('id').valueMap()`), it is submitted with a trailing range step
+        """
+        offset = position.get("offset", 0)
+        page_params = dict(params, _pageStart=offset, _pageEnd=offset + page_size)
+        return self.run_query(RANGE_PAGE.format(query=query), params=page_params, graph=graph, write=False)
+
+    @classmethod
+    def script_cache_info(cls) -> ScriptCacheInfo:
+        """
+        :return: the hits and misses of the script template LRU
+        """
+        with _templates_lock:
+            return ScriptCacheInfo(_templates_stats["hits"], _templates_stats["misses"], SCRIPT_CACHE_SIZE, len(_templates))
+
+    def stream_query(
+            self, query: str, params: dict = {}, graph: str = None, write: bool = False,
+            fetch_size: int = None, batch_size: int = None
+    ):
+        request_options = {"batchSize": fetch_size} if fetch_size else None
+        script, bindings = self._prepare_script(query, params)
+        result_set = self._submit(graph, script, bindings, request_options)
+        records = (record for server_batch in result_set for record in server_batch)
+        yield from self._batch_records(records, batch_size)
+
+    @classmethod
+    def is_transient(cls, err) -> bool:
+        """
+        :return: true if the error is a lost connection, a timeout or a server error reporting contention
+                 or throttling, after which the request can be submitted again
+        """
+        if isinstance(err, (ConnectionError, TimeoutError)):
+            return True
+        if not isinstance(err, GremlinServerError):
+            return False
+        attributes = getattr(err, "status_attributes", None) or {}
+        if str(attributes.get("x-ms-status-code")) in TRANSIENT_COSMOS_STATUS:
+            return True
+        return any(marker in str(err) for marker in TRANSIENT_ERRORS)
 
     def get_default_graph(self):
-        return self.tinkerpop_graphs.keys()[0]
+        return next(iter(self.tinkerpop_graphs), None)
 
     def get_graphs(self):
         return self.tinkerpop_graphs.keys()
 
-    def graph_from_query(self, query: str, params: dict = {}, graph: str = None):
-        raise NotImplementedError("the method has not yet been implemented")
+    def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        """
+        :param query: a read-only gremlin script returning vertices, edges or paths (e.g. `g.V().outE().path()`),
+                      also nested in lists or maps; it is replayed after a transient error
+        :param params: the parameters bound to the script
+        :param graph: the graph on which to execute the query
+        :param properties: if set only these property keys are copied from the vertices and edges
+        :return: a GraphResult with the returned vertices, edges and the endpoints of the edges
+        """
+        start = time.perf_counter()
+        script, bindings = self._prepare_script(query, params)
+
+        def attempt_query():
+            graph_result = GraphResult(properties)
+            for server_batch in self._submit(graph, script, bindings):
+                for result in server_batch:
+                    self._add_to_graph(graph_result, result)
+            return graph_result
+
+        graph_result = self.retry_policy.run(attempt_query, graph=graph)
+        elapsed = time.perf_counter() - start
+        self.instrumentation.record("gremlin.graph_from_query", elapsed * 1_000_000, graph=graph)
+        self.instrumentation.record("gremlin.graph_elements", len(graph_result), graph=graph)
+        self.instrumentation.slow_query(query, elapsed * 1000, graph=graph)
+        return graph_result
+
+    @classmethod
+    def _add_to_graph(cls, graph_result: GraphResult, element):
+        if isinstance(element, Vertex):
+            graph_result.add_node(element.id, frozenset((element.label,)), cls._element_properties(element))
+        elif isinstance(element, Edge):
+            # the endpoints of an edge are references without properties, the full vertices may come later
+            for vertex in (element.outV, element.inV):
+                graph_result.add_node(vertex.id, frozenset((vertex.label,)), cls._element_properties(vertex), stub=True)
+            graph_result.add_edge(
+                element.id, element.label, element.outV.id, element.inV.id, cls._element_properties(element)
+            )
+        elif isinstance(element, Path):
+            for path_element in element.objects:
+                cls._add_to_graph(graph_result, path_element)
+        elif isinstance(element, dict):
+            for value in element.values():
+                cls._add_to_graph(graph_result, value)
+        elif isinstance(element, (list, set, tuple)):
+            for value in element:
+                cls._add_to_graph(graph_result, value)
+
+    @classmethod
+    def _element_properties(cls, element):
+        # properties are only returned by servers materializing them on elements (TinkerPop 3.5+ scripts)
+        properties = getattr(element, "properties", None) or []
+        if isinstance(properties, dict):
+            return properties
+        return {prop.key: prop.value for prop in properties}
 
 
 
@@ -0,0 +1,150 @@
+import logging
+import os
+import random
+import time
+
+from contextlib import contextmanager
+from threading import Lock
+
+SUB_BUCKET_BITS = 5
+
+
+class Histogram:
+    """
+    Log-linear histogram in the HDR style: values are bucketed by their power of two and, inside it,
+    by their SUB_BUCKET_BITS most significant bits, so every bucket is within ~3% of the values it holds
+    and recording is a couple of integer operations and a dict increment.
+    """
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets: dict = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+        bucket = (value >> shift) << shift
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+
+    def percentile(self, percentile: float):
+        if not self.count:
+            return None
+        threshold = self.count * percentile / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return bucket
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count, "sum": self.total, "min": self.min, "max": self.max,
+            "p50": self.percentile(50), "p90": self.percentile(90),
+            "p99": self.percentile(99), "p999": self.percentile(99.9)
+        }
+
+
+class Instrumentation:
+    """
+    Collects timings (in microseconds) and sizes of the datasource operations into histograms keyed by
+    metric name and labels. Exporters are callables receiving `(metric, labels, histogram)`, so they can push
+    the values into OpenTelemetry instruments or any other backend; `to_prometheus()` renders the text format.
+    Queries slower than `slow_query_ms` are logged for a `slow_query_sample_rate` fraction of them,
+    instead of logging every query.
+    """
+
+    _logger = logging.getLogger("Instrumentation")
+
+    def __init__(self, enabled: bool = True, slow_query_ms: float = 1000, slow_query_sample_rate: float = 1.0):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_sample_rate = slow_query_sample_rate
+        self.exporters: list = []
+        self._histograms: dict = {}
+        self._lock: Lock = Lock()
+
+    def record(self, metric: str, value, **labels):
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(value)
+
+    @contextmanager
+    def timer(self, metric: str, **labels):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(metric, (time.perf_counter() - start) * 1_000_000, **labels)
+
+    def slow_query(self, query: str, elapsed_ms: float, **labels):
+        if elapsed_ms >= self.slow_query_ms and random.random() < self.slow_query_sample_rate:
+            self._logger.warning(f"slow query ({elapsed_ms:.1f} ms) {labels}:\n {query}")
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def export(self):
+        """
+        sends every histogram to the registered exporters
+        """
+        with self._lock:
+            histograms = list(self._histograms.items())
+        for (metric, labels), histogram in histograms:
+            for exporter in self.exporters:
+                exporter(metric, dict(labels), histogram)
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"metric": metric, "labels": dict(labels), **histogram.snapshot()}
+                for (metric, labels), histogram in self._histograms.items()
+            ]
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent, and the parent keeps reporting its own values
+        self._lock = Lock()
+        self._histograms = {}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_prometheus(self):
+        """
+        :return: the histograms as prometheus summaries in the text exposition format
+        """
+        lines = []
+        for entry in self.snapshot():
+            name = entry["metric"].replace(".", "_")
+            labels = ",".join(f'{key}="{value}"' for key, value in entry["labels"].items())
+            for quantile in ["p50", "p90", "p99", "p999"]:
+                quantile_labels = ",".join(filter(None, [labels, f'quantile="0.{quantile[1:]}"']))
+                lines.append(f"{name}{{{quantile_labels}}} {entry[quantile]}")
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {entry['sum']}")
+            lines.append(f"{name}_count{suffix} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+
+default_instrumentation = Instrumentation()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=default_instrumentation._after_fork)
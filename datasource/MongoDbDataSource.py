@@ -1,6 +1,8 @@
+from itertools import islice
 from os import environ
 
-from pymongo import MongoClient
+from pymongo import InsertOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError
 
 from datasource.metaclass.SingletonMongoConnection import SingletonMongoConnection
 
@@ -8,6 +10,7 @@ MONGO_COLLECTIONS = ["graphDbConnection"]
 MONGO_DB = "galileo"
 MONGO_PORT = "27017"
 MONGO_ADDRESS = "localhost"
+BULK_CHUNK_SIZE = 1000
 
 
 class MongoDbDataSource(metaclass=SingletonMongoConnection):
@@ -31,9 +34,12 @@ class MongoDbDataSource(metaclass=SingletonMongoConnection):
         return self.client
 
     def get_collection(self, collection):
-        if collection in MONGO_COLLECTIONS:
-            return self.db.get_collection(collection)
-        else:
+        self._check_collection(collection)
+        return self.db.get_collection(collection)
+
+    @classmethod
+    def _check_collection(cls, collection):
+        if collection not in MONGO_COLLECTIONS:
             raise ValueError(f"value of 'collection' must be in [{MONGO_COLLECTIONS}]")
 
     def insert_one(self, collection, doc_to_write):
@@ -61,11 +67,55 @@ class MongoDbDataSource(metaclass=SingletonMongoConnection):
         result = target_collection.delete_one(query_filter)
         return result
 
-    def find_all(self, collection):
+    def bulk_write(self, collection, operations, ordered: bool = True, chunk_size: int = BULK_CHUNK_SIZE):
+        """
+        sends the write operations (InsertOne, ReplaceOne, UpdateOne, ...) in chunks of `chunk_size`,
+        one round-trip per chunk; the operations may be a generator, they are consumed lazily
+        :param ordered: if true the first failing operation stops the whole batch, otherwise the remaining
+                        operations and chunks are still written and the errors are raised at the end
+        :return: the counts of the written documents
+        """
+        target_collection = self.get_collection(collection)
+        totals = self._empty_bulk_result()
+        for offset, chunk in self._chunks(operations, chunk_size):
+            try:
+                self._add_bulk_result(totals, target_collection.bulk_write(chunk, ordered=ordered).bulk_api_result, offset)
+            except BulkWriteError as bwe:
+                self._add_bulk_result(totals, bwe.details, offset)
+                if ordered:
+                    raise BulkWriteError(totals)
+        if self._has_bulk_errors(totals):
+            raise BulkWriteError(totals)
+        return totals
+
+    def insert_many(self, collection, documents, ordered: bool = True, chunk_size: int = BULK_CHUNK_SIZE):
+        return self.bulk_write(collection, (InsertOne(document) for document in documents), ordered, chunk_size)
+
+    def upsert_many(self, collection, documents, key="_id", ordered: bool = True, chunk_size: int = BULK_CHUNK_SIZE):
+        """
+        replaces or inserts every document, matched on the `key` field (or list of fields)
+        """
+        return self.bulk_write(collection, self._upserts(documents, key), ordered, chunk_size)
+
+    def find_all(self, collection, query_filter: dict = None, projection=None, batch_size: int = 0, limit: int = 0):
+        """
+        :return: a cursor over the matching documents, fetched from the server `batch_size` documents at a time
+        """
         target_collection = self.get_collection(collection)
-        result = target_collection.find({})
+        result = target_collection.find(query_filter or {}, projection, batch_size=batch_size, limit=limit)
         return result
 
+    def stream_all(self, collection, query_filter: dict = None, projection=None, batch_size: int = BULK_CHUNK_SIZE):
+        """
+        yields the matching documents as lists of at most `batch_size` documents, one server batch at a time
+        """
+        cursor = self.find_all(collection, query_filter, projection, batch_size=batch_size)
+        try:
+            for _, batch in self._chunks(cursor, batch_size):
+                yield batch
+        finally:
+            cursor.close()
+
     def delete_all(self, collection):
         self.get_collection(collection).delete_many({})
 
@@ -74,6 +124,43 @@ class MongoDbDataSource(metaclass=SingletonMongoConnection):
         result = target_collection.find_one({"_id": doc_id})
         return result
 
+    @classmethod
+    def _chunks(cls, items, chunk_size: int):
+        items = iter(items)
+        offset = 0
+        chunk = list(islice(items, chunk_size))
+        while chunk:
+            yield offset, chunk
+            offset += len(chunk)
+            chunk = list(islice(items, chunk_size))
+
+    @classmethod
+    def _upserts(cls, documents, key):
+        keys = [key] if isinstance(key, str) else list(key)
+        for document in documents:
+            yield ReplaceOne({field: document[field] for field in keys}, document, upsert=True)
+
+    @classmethod
+    def _empty_bulk_result(cls):
+        return {
+            "nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0,
+            "upserted": [], "writeErrors": [], "writeConcernErrors": []
+        }
+
+    @classmethod
+    def _has_bulk_errors(cls, totals: dict) -> bool:
+        # a write concern error leaves the documents written but not acknowledged by the requested members
+        return bool(totals["writeErrors"] or totals["writeConcernErrors"])
+
+    @classmethod
+    def _add_bulk_result(cls, totals: dict, result: dict, offset: int):
+        for counter in ["nInserted", "nMatched", "nModified", "nRemoved", "nUpserted"]:
+            totals[counter] += result.get(counter, 0)
+        # the indexes reported by the server are relative to the chunk, they are made relative to the whole batch
+        totals["upserted"].extend(dict(upsert, index=upsert["index"] + offset) for upsert in result.get("upserted", []))
+        totals["writeErrors"].extend(dict(error, index=error["index"] + offset) for error in result.get("writeErrors", []))
+        totals["writeConcernErrors"].extend(result.get("writeConcernErrors", []))
+
     @classmethod
     def get_mongo_port(cls):
         mongo_port = environ.get("MONGO_PORT") if environ.get("MONGO_PORT") and environ.get("MONGO_PORT") != " " \
@@ -97,5 +184,5 @@ class MongoDbDataSource(metaclass=SingletonMongoConnection):
         return f"mongodb://{username}:{password}@{address}"
 
     @classmethod
-    def evict_singleton_instance(cls):
-        SingletonMongoConnection.evict_instance(MongoDbDataSource)
+    def evict_singleton_instance(cls, instance_key=None):
+        SingletonMongoConnection.evict_instance(MongoDbDataSource, instance_key=instance_key)
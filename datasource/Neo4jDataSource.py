@@ -1,28 +1,130 @@
 import logging
+import time
 import neo4j
 
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from threading import Lock, RLock
+
 from neo4j import Result, GraphDatabase
-from neo4j.graph import Node, Relationship
-from neo4j.exceptions import DriverError, Neo4jError
+from neo4j.exceptions import DriverError, Neo4jError, ServiceUnavailable, SessionExpired, TransientError
 
-from datasource.DataSourceAbstract import DataSourceAbstract
+from datasource.DataSourceAbstract import DataSourceAbstract, PendingResult
+from datasource.GraphResult import GraphResult
+from datasource.Instrumentation import Instrumentation, default_instrumentation
+from datasource.QueryProfiler import QueryProfiler
+from datasource.RetryPolicy import RetryPolicy
 
 GET_DEFAULT_DB = "SHOW DEFAULT DATABASE"
 GET_DBs = "SHOW DATABASES"
 APOC_GRAPH_FROM_CYPHER = "CALL apoc.graph.fromCypher($query, $param, apoc.create.uuid(), {}) \
                         YIELD graph AS g \
                         RETURN g.nodes AS nodes, g.relationships AS rels";
+UNWIND_ROWS = "UNWIND $rows AS row\n{query}"
+KEYSET_PAGE = "{query}\nORDER BY {order_key}\nLIMIT $pageSize"
+# fewer records than the 700 allocations collecting the youngest gc generation, which would scan every chunk
+DF_CHUNK_SIZE = 256
+# transient errors after which the transaction cannot be replayed, and client errors after which it can
+NOT_RETRYABLE_CODES = {"Neo.TransientError.Transaction.Terminated", "Neo.TransientError.Transaction.LockClientStopped"}
+RETRYABLE_CODES = {"Neo.ClientError.Cluster.NotALeader", "Neo.ClientError.General.ForbiddenOnReadOnlyDatabase"}
+BATCH_COUNTERS = [
+    "nodes_created", "nodes_deleted", "relationships_created",
+    "relationships_deleted", "properties_set", "labels_added"
+]
+
+
+class _QueryTracker:
+    """
+    Follows a single transaction function: the time spent waiting for a connection, the server time to the
+    first record, the time to stream the records and the remaining client side conversion time
+    """
+
+    __slots__ = ("data_source", "access_mode", "graph", "started", "acquired", "summary")
+
+    def __init__(self, data_source, access_mode, graph):
+        self.data_source = data_source
+        self.access_mode = access_mode
+        self.graph = graph
+        self.started = time.perf_counter()
+        self.acquired = None
+        self.summary = None
+
+    def connection_acquired(self):
+        self.acquired = time.perf_counter()
+        self.data_source.instrumentation.record(
+            "neo4j.session_acquire", (self.acquired - self.started) * 1_000_000, graph=self.graph
+        )
+
+    def consumed(self, res: Result):
+        summary = self.summary = res.consume()
+        self.data_source._count_server(self.access_mode, str(summary.server.address))
+        instrumentation = self.data_source.instrumentation
+        if not instrumentation.enabled:
+            return
+        server_ms = summary.result_available_after or 0
+        fetch_ms = summary.result_consumed_after or 0
+        elapsed_ms = (time.perf_counter() - self.acquired) * 1000
+        instrumentation.record("neo4j.server_time", server_ms * 1000, graph=self.graph)
+        instrumentation.record("neo4j.record_fetch", fetch_ms * 1000, graph=self.graph)
+        instrumentation.record("neo4j.conversion", max(elapsed_ms - server_ms - fetch_ms, 0) * 1000, graph=self.graph)
+
+
+class _Neo4jTransaction:
+    """
+    Statements of Neo4jDataSource.transaction, all run in one explicit transaction. `submit` sends a statement
+    without reading its records, so independent reads are pipelined on the connection and their records are
+    read by `result()`, at the latest before the commit
+    """
+
+    __slots__ = ("tx", "pending")
+
+    def __init__(self, tx):
+        self.tx = tx
+        self.pending: list = []
+
+    def run(self, query: str, params: dict = {}):
+        """
+        :return: the records of the statement as dicts
+        """
+        return self.submit(query, params).result()
+
+    def submit(self, query: str, params: dict = {}) -> PendingResult:
+        res: Result = self.tx.run(query=query, parameters=params)
+        pending = PendingResult(res.data)
+        self.pending.append(pending)
+        return pending
+
+    def flush(self):
+        for pending in self.pending:
+            pending.result()
 
 
 class Neo4jDataSource(DataSourceAbstract):
     _logger = logging.getLogger("Neo4jDataSource")
 
-    def __init__(self, protocol, uri, port, user, password):
+    def __init__(self, protocol, uri, port, user, password, fetch_size: int = 1000, metadata_ttl: float = 300,
+                 instrumentation: Instrumentation = default_instrumentation, retry_policy: RetryPolicy = None,
+                 profiler: QueryProfiler = None):
         auth = (user, password) if user and password else None
         connection_uri = f"{protocol}://{uri}:{port or '7684'}"
 
-        self.driver = GraphDatabase.driver(connection_uri, auth=auth)
+        # transactions are replayed by the retry policy only, not by the driver
+        self.driver = GraphDatabase.driver(connection_uri, auth=auth, max_transaction_retry_time=0)
         self.default_db = None
+        self.fetch_size = fetch_size
+        self.metadata_ttl = metadata_ttl
+        self._metadata: dict = {}
+        self._metadata_lock: RLock = RLock()
+        # bookmarks of the writes done on every graph and number of transactions served by every server
+        self._bookmarks: dict = {}
+        self._bookmarks_lock: Lock = Lock()
+        self._routing_stats: dict = {neo4j.READ_ACCESS: {}, neo4j.WRITE_ACCESS: {}}
+        self._routing_lock: Lock = Lock()
+        self.instrumentation = instrumentation
+        self.retry_policy = retry_policy or RetryPolicy(self.is_transient, backend="neo4j", instrumentation=instrumentation)
+        # profiles only the queries run with profile=True until a sample rate is set
+        self.profiler = profiler or QueryProfiler()
 
     def __del__(self):
         self.driver.close()
@@ -30,87 +132,360 @@ class Neo4jDataSource(DataSourceAbstract):
     def close(self):
         self.driver.close()
 
-    def _session(self, database=None, bookmarks=(), access_mode=neo4j.WRITE_ACCESS, fetch_size=1000):
+    def _session(self, database=None, bookmarks=(), access_mode=neo4j.READ_ACCESS, fetch_size=None):
         database = database or self.default_db
         return self.driver.session(
             database=database, bookmarks=bookmarks,
-            default_access_mode=access_mode, fetch_size=fetch_size
+            default_access_mode=access_mode, fetch_size=fetch_size or self.fetch_size
         )
 
+    def health_check(self):
+        self.driver.verify_connectivity()
+
+    def get_bookmarks(self, graph: str = None):
+        """
+        :return: the bookmarks of the writes done on the graph, to be passed to a session that must see them
+        """
+        return self._bookmarks.get(graph or self.get_default_graph(), ())
+
+    def _save_bookmarks(self, graph: str, ssn, chained=()):
+        """
+        merges the bookmark of the write done by the session into the ones of the graph
+        :param chained: the bookmarks the session started from, its own bookmark follows them so they are dropped;
+                        the ones of the writes committed meanwhile by other sessions are kept
+        """
+        # neo4j 5 exposes a Bookmarks object, the 4.x driver a single bookmark string
+        if hasattr(ssn, "last_bookmarks"):
+            last = self._bookmark_values(ssn.last_bookmarks())
+        else:
+            last = frozenset(bookmark for bookmark in (ssn.last_bookmark(),) if bookmark)
+        if not last:
+            return
+        with self._bookmarks_lock:
+            current = self._bookmark_values(self._bookmarks.get(graph, ()))
+            values = (current - self._bookmark_values(chained)) | last
+            bookmarks_class = getattr(neo4j, "Bookmarks", None)
+            self._bookmarks[graph] = bookmarks_class.from_raw_values(values) if bookmarks_class else tuple(values)
+
+    @classmethod
+    def _bookmark_values(cls, bookmarks) -> frozenset:
+        return frozenset(getattr(bookmarks, "raw_values", bookmarks) or ())
+
+    def _count_server(self, access_mode, address: str):
+        with self._routing_lock:
+            servers = self._routing_stats[access_mode]
+            servers[address] = servers.get(address, 0) + 1
+
+    def get_routing_stats(self):
+        """
+        :return: the number of READ and WRITE transactions executed by every server of the cluster
+        """
+        with self._routing_lock:
+            return {
+                "READ": dict(self._routing_stats[neo4j.READ_ACCESS]),
+                "WRITE": dict(self._routing_stats[neo4j.WRITE_ACCESS])
+            }
+
+    def _get_metadata(self, key: str, loader):
+        """
+        returns the cached value of the given metadata key, calling the loader when it is missing or expired;
+        concurrent misses wait on the lock and reuse the value loaded by the first caller
+        (the lock is reentrant because loading the graphs resolves the default graph too)
+        """
+        cached = self._metadata.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        with self._metadata_lock:
+            cached = self._metadata.get(key)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            value = loader()
+            self._metadata[key] = (value, time.monotonic() + self.metadata_ttl)
+            return value
+
+    def invalidate_metadata(self, key: str = None):
+        """
+        :param key: the metadata key to drop ("default_db" or "graphs"), if not set the whole cache is cleared
+        """
+        with self._metadata_lock:
+            if key:
+                self._metadata.pop(key, None)
+            else:
+                self._metadata.clear()
+
     def get_default_graph(self):
-        if not self.default_db:
-            try:
-                with self._session() as ssn:
-                    query_result = ssn.run(GET_DEFAULT_DB)
-                    return query_result.single()["name"]
-            except DriverError as nErr:
-                raise RuntimeError("an unexpected error occurred in the neo4j driver")
-            except Exception:
-                self.default_db = "neo4j"
+        return self._get_metadata("default_db", self._load_default_graph)
+
+    def _load_default_graph(self):
+        try:
+            with self._session() as ssn:
+                query_result = ssn.run(GET_DEFAULT_DB)
+                self.default_db = query_result.single()["name"]
+        except DriverError as nErr:
+            raise RuntimeError("an unexpected error occurred in the neo4j driver")
+        except Exception:
+            self.default_db = "neo4j"
+        return self.default_db
 
     def get_graphs(self):
+        return list(self._get_metadata("graphs", self._load_graphs))
+
+    def _load_graphs(self):
         databases = self.run_query(query=GET_DBs)
         return [database.get("name") for database in databases if database]
 
-    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = False,
-                  result_as_df: bool = False):
+    def run_query(self, query: str, params: dict = {}, graph: str = None, write: bool = None,
+                  result_as_df: bool = False, read_your_writes: bool = False, idempotent: bool = False,
+                  profile: bool = False):
         """
         :param result_as_df: if true returns the result as dataframe pands
         :param graph: the graph on which to execute the query
         :param query: the string containing the cypher query to be executed
         :param params: the parameters to be passed when executing the query
-        :param write: if set to true indicates that the query is in write, otherwise it is read-only query
+        :param write: if set to true indicates that the query is in write, otherwise (also when None) it is read-only query
+        :param read_your_writes: if true a read waits until the server has applied the last write done on the graph
+        :param idempotent: if true a write failing with a transient error is replayed like a read
+        :param profile: if true the query runs with PROFILE and its plan is stored by the profiler,
+                        as it is for the queries sampled by the profiler
         :return: returns a list with the results of the query
         """
         graph = graph if graph else self.get_default_graph()
-        self._logger.info(f"LOG - INFO [neoj4 - query]: running query on {graph} DB instance:\n {query}")
-        try:
-            with self._session(database=graph) as ssn:
-                query_runner =  self._run_query_df if result_as_df else self._run_query_dict
+        self._logger.debug(f"LOG - DEBUG [neoj4 - query]: running query on {graph} DB instance:\n {query}")
+        access_mode = neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS
+        # a write session starts from the bookmarks of the graph, so that its own bookmark supersedes them
+        bookmarks = self.get_bookmarks(graph) if read_your_writes or write else ()
+        query_runner = self._run_query_df if result_as_df else self._run_query_dict
+        profile = profile or self.profiler.should_profile(query)
+        statement = self.profiler.plan_query(query) if profile else query
+        tracker = _QueryTracker(self, access_mode, graph)
+        start = tracker.started
+
+        def attempt_query():
+            tracker.started = time.perf_counter()
+            with self._session(database=graph, bookmarks=bookmarks, access_mode=access_mode) as ssn:
                 if not write:
-                    result = ssn.read_transaction(
-                        transaction_function=query_runner,
-                        query=query, params=params
-                    )
-                else:
-                    result = ssn.write_transaction(
+                    return ssn.read_transaction(
                         transaction_function=query_runner,
-                        query=query, params=params
+                        query=statement, params=params, track=tracker
                     )
+                result = ssn.write_transaction(
+                    transaction_function=query_runner,
+                    query=statement, params=params, track=tracker
+                )
+                self._save_bookmarks(graph, ssn, bookmarks)
                 return result
+
+        try:
+            result = self.retry_policy.run(attempt_query, write=write, idempotent=idempotent, graph=graph)
         except (Neo4jError, DriverError) as nErr:
-            if isinstance(nErr, Neo4jError):
-                error = ValueError(f"the given neo4j query is not invalid: {nErr.message}")
-            else:
-                error = RuntimeError("InternalServerError -> error of Neo4j Driver")
-            raise error
+            self.instrumentation.record("neo4j.errors", 1, graph=graph, error=nErr.__class__.__name__)
+            raise self._map_error(nErr)
+        elapsed = time.perf_counter() - start
+        if profile:
+            self.profiler.record(query, tracker.summary, elapsed_ms=elapsed * 1000, graph=graph)
+        self.instrumentation.record("neo4j.run_query", elapsed * 1_000_000, graph=graph, write=bool(write))
+        self.instrumentation.record("neo4j.rows", len(result), graph=graph)
+        self.instrumentation.slow_query(query, elapsed * 1000, graph=graph)
+        return result
 
+    @contextmanager
+    def transaction(self, graph: str = None, write: bool = False, read_your_writes: bool = False):
+        """
+        unit of work: the statements run with `tx.run(query, params)` or `tx.submit(query, params)` share one
+        session and one explicit transaction, committed when the block exits and rolled back if it raises;
+        unlike run_query the block is not replayed after a transient error
+        :param read_your_writes: if true a read transaction waits until the server has applied the last write done on the graph
+        """
+        graph = graph if graph else self.get_default_graph()
+        access_mode = neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS
+        # a write session starts from the bookmarks of the graph, so that its own bookmark supersedes them
+        bookmarks = self.get_bookmarks(graph) if read_your_writes or write else ()
+        start = time.perf_counter()
+        try:
+            with self._session(database=graph, bookmarks=bookmarks, access_mode=access_mode) as ssn:
+                with ssn.begin_transaction() as tx:
+                    unit = _Neo4jTransaction(tx)
+                    yield unit
+                    unit.flush()
+                    tx.commit()
+                if write:
+                    self._save_bookmarks(graph, ssn, bookmarks)
+        except (Neo4jError, DriverError) as nErr:
+            self.instrumentation.record("neo4j.errors", 1, graph=graph, error=nErr.__class__.__name__)
+            raise self._map_error(nErr)
+        self.instrumentation.record(
+            "neo4j.transaction", (time.perf_counter() - start) * 1_000_000, graph=graph, write=write
+        )
+        self.instrumentation.record("neo4j.transaction_statements", len(unit.pending), graph=graph)
 
-    def graph_from_query(self, query: str, params: dict = {}, graph: str = None):
-        graph = graph or self.get_default_graph()
-        print(f"LOG - INFO [neoj4_utils - query]: running query on {graph} DB instance: {query}")
+    def explain(self, query: str, params: dict = {}, graph: str = None):
+        """
+        plans the query with EXPLAIN, without running it
+        :return: the plan stored by the profiler, with its operators and the detected anti-patterns
+        """
+        graph = graph if graph else self.get_default_graph()
         try:
             with self._session(database=graph) as ssn:
-                result = ssn.read_transaction(
+                summary = ssn.run(self.profiler.plan_query(query, "EXPLAIN"), parameters=params).consume()
+        except (Neo4jError, DriverError) as nErr:
+            raise self._map_error(nErr)
+        return self.profiler.record(query, summary, mode="EXPLAIN", graph=graph)
+
+    def stream_query(
+            self, query: str, params: dict = {}, graph: str = None, write: bool = False,
+            fetch_size: int = None, batch_size: int = None
+    ):
+        """
+        :param query: the string containing the cypher query to be executed
+        :param params: the parameters to be passed when executing the query
+        :param graph: the graph on which to execute the query
+        :param write: if set to true indicates that the query is in write, otherwise it is read-only query
+        :param fetch_size: the number of records pulled from the server at a time
+        :param batch_size: if set the records are yielded as lists of at most batch_size dicts
+        :return: a generator lazily yielding the records of the query as dicts;
+                 session and transaction stay open until the generator is exhausted or closed
+        """
+        graph = graph if graph else self.get_default_graph()
+        self._logger.debug(f"LOG - DEBUG [neoj4 - query]: streaming query on {graph} DB instance:\n {query}")
+        try:
+            access_mode = neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS
+            bookmarks = self.get_bookmarks(graph) if write else ()
+            with self._session(database=graph, bookmarks=bookmarks, access_mode=access_mode, fetch_size=fetch_size) as ssn:
+                with ssn.begin_transaction() as tx:
+                    res: Result = tx.run(query=query, parameters=params)
+                    records = (record.data() for record in res)
+                    yield from self._batch_records(records, batch_size)
+                if write:
+                    self._save_bookmarks(graph, ssn, bookmarks)
+        except (Neo4jError, DriverError) as nErr:
+            raise self._map_error(nErr)
+
+    def write_batch(
+            self, query: str, rows, batch_size: int = 1000, graph: str = None,
+            parallelism: int = 1, max_retries: int = 3
+    ):
+        """
+        :param query: the cypher statement executed for every row, it refers to the current parameters as `row`
+        :param rows: an iterable of parameter dicts, consumed lazily one batch at a time
+        :param batch_size: the number of rows sent in a single `UNWIND $rows AS row` transaction
+        :param graph: the graph on which to execute the query
+        :param parallelism: the number of batches written concurrently, each one on its own session
+        :param max_retries: how many times a batch is retried after a transient failure
+        :return: a list with the counters, the size and the elapsed time of every batch
+        """
+        graph = graph if graph else self.get_default_graph()
+        unwind_query = UNWIND_ROWS.format(query=query)
+        batches = self._batch_records(rows, batch_size)
+        self._logger.debug(f"LOG - DEBUG [neoj4 - query]: writing batches on {graph} DB instance:\n {unwind_query}")
+        if parallelism <= 1:
+            return [
+                self._write_chunk(unwind_query, chunk, graph, index, max_retries)
+                for index, chunk in enumerate(batches)
+            ]
+
+        results = []
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            pending = set()
+            for index, chunk in enumerate(batches):
+                # never pull more rows than the workers can write, so the ingest memory stays flat
+                if len(pending) >= parallelism:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                pending.add(executor.submit(self._write_chunk, unwind_query, chunk, graph, index, max_retries))
+            results.extend(future.result() for future in wait(pending).done)
+        return sorted(results, key=lambda batch: batch["batch"])
+
+    def _write_chunk(self, query: str, chunk: list, graph: str, index: int, max_retries: int):
+        attempts = []
+
+        def attempt_chunk():
+            attempts.append(time.perf_counter())
+            bookmarks = self.get_bookmarks(graph)
+            with self._session(database=graph, bookmarks=bookmarks, access_mode=neo4j.WRITE_ACCESS) as ssn:
+                counters = ssn.write_transaction(self._run_query_counters, query=query, params={"rows": chunk})
+                self._save_bookmarks(graph, ssn, bookmarks)
+            return counters
+
+        try:
+            # a failed batch transaction is rolled back as a whole, so write_batch always replays it
+            counters = self.retry_policy.run(
+                attempt_chunk, write=True, idempotent=True, max_attempts=max_retries + 1, graph=graph
+            )
+        except (Neo4jError, DriverError) as nErr:
+            raise self._map_error(nErr)
+        return {
+            "batch": index, "rows": len(chunk), "attempts": len(attempts),
+            "elapsed": time.perf_counter() - attempts[-1], **counters
+        }
+
+    def _fetch_page(self, query: str, params: dict, graph: str, page_size: int, order_key: str, position: dict):
+        """
+        keyset pagination: every page is a run_query seeking past the last key of the previous one, so a page
+        costs the same at any depth (SKIP would read again every previous row). The query must return the
+        `order_key` column and filter on `$after`, null on the first page, without ORDER BY and LIMIT, e.g.
+        `MATCH (n:Person) WHERE $after IS NULL OR n.id > $after RETURN n.id AS id, n.name AS name`.
+        The `order_key` values must be unique: a page seeks strictly past the last key of the previous one, so
+        the rows sharing that key beyond the page boundary would be skipped
+        """
+        if not order_key:
+            raise ValueError("order_key is required to page a cypher query")
+        page_query = KEYSET_PAGE.format(query=query, order_key=order_key)
+        return self.run_query(page_query, params=dict(params, after=position.get("after"), pageSize=page_size), graph=graph)
+
+    def graph_from_query(self, query: str, params: dict = {}, graph: str = None, properties: list = None):
+        """
+        :param properties: if set only these property keys are copied from the nodes and relationships
+        :return: a GraphResult with the nodes and the relationships returned by the query
+        """
+        graph = graph or self.get_default_graph()
+        self._logger.debug(f"LOG - DEBUG [neoj4_utils - query]: running query on {graph} DB instance: {query}")
+        start = time.perf_counter()
+        def attempt_query():
+            with self._session(database=graph) as ssn:
+                return ssn.read_transaction(
                     self._run_query_single,
                     APOC_GRAPH_FROM_CYPHER,
                     {'query': query, 'param': params}
                 )
-                nodes = [self._get_node_as_map(n, result.get("nodeMetadata")) for n in result.get("nodes")]
-                rels = [self._get_edge_as_map(r) for r in result.get("rels")]
-                return {'nodes': nodes, 'rels': rels}
+
+        try:
+            result = self.retry_policy.run(attempt_query, graph=graph)
+            fetched = time.perf_counter()
+            graph_result = self._graph_from_record(result, properties)
         except (Neo4jError, DriverError) as nErr:
-            if isinstance(nErr, Neo4jError):
-                error = ValueError(f"the given neo4j query is not invalid: {nErr.message}")
-            else:
-                error = RuntimeError("InternalServerError -> error of Neo4j Driver")
-            raise error
+            self.instrumentation.record("neo4j.errors", 1, graph=graph, error=nErr.__class__.__name__)
+            raise self._map_error(nErr)
+        end = time.perf_counter()
+        self.instrumentation.record("neo4j.graph_from_query", (end - start) * 1_000_000, graph=graph)
+        self.instrumentation.record("neo4j.graph_conversion", (end - fetched) * 1_000_000, graph=graph)
+        self.instrumentation.record("neo4j.graph_elements", len(graph_result), graph=graph)
+        self.instrumentation.slow_query(query, (end - start) * 1000, graph=graph)
+        return graph_result
 
 
     """
         utility methods
     """
 
+    @classmethod
+    def is_transient(cls, err) -> bool:
+        """
+        :return: true if the error is a transient failure (leader switch, deadlock, lost connection, ...)
+                 after which the transaction can be run again
+        """
+        if isinstance(err, (ServiceUnavailable, SessionExpired)):
+            return True
+        code = getattr(err, "code", None)
+        if isinstance(err, TransientError):
+            return code not in NOT_RETRYABLE_CODES
+        return isinstance(err, Neo4jError) and code in RETRYABLE_CODES
+
+    @classmethod
+    def _map_error(cls, err):
+        if isinstance(err, Neo4jError):
+            return ValueError(f"the given neo4j query is not invalid: {err.message}")
+        return RuntimeError("InternalServerError -> error of Neo4j Driver")
+
     @classmethod
     def _get_error_response(cls, err):
         if isinstance(err, DriverError):
@@ -122,40 +497,45 @@ class Neo4jDataSource(DataSourceAbstract):
         return error
 
     @classmethod
-    def _run_query_dict(cls, tx, query, params):
+    def _run_query_dict(cls, tx, query, params, track: _QueryTracker = None):
+        if track: track.connection_acquired()
         res: Result = tx.run(query=query, parameters=params)
-        return res.data()
+        data = res.data()
+        if track: track.consumed(res)
+        return data
 
     @classmethod
-    def _run_query_df(cls, tx, query, params):
+    def _run_query_df(cls, tx, query, params, track: _QueryTracker = None):
+        """
+        fills one array per returned key while the records are fetched, skipping the
+        per-record dict conversion of `Result.to_df()`: the records (tuples) are transposed
+        `DF_CHUNK_SIZE` at a time, so no python code runs per record or per value
+        """
+        if track: track.connection_acquired()
         res: Result = tx.run(query=query, parameters=params)
-        return res.to_df()
+        keys = res.keys()
+        columns = [[] for _ in keys]
+        records = iter(res)
+        for chunk in iter(lambda: list(islice(records, DF_CHUNK_SIZE)), []):
+            for column, values in zip(columns, zip(*chunk)):
+                column.extend(values)
+        if track: track.consumed(res)
+        return cls._to_data_frame(dict(zip(keys, columns)))
 
     @classmethod
-    def _run_query_single(cls, tx, query, params):
+    def _run_query_counters(cls, tx, query, params):
         res: Result = tx.run(query=query, parameters=params)
-        return res.single()
+        counters = res.consume().counters
+        return {counter: getattr(counters, counter) for counter in BATCH_COUNTERS}
 
     @classmethod
-    def _get_node_as_map(cls, node: Node, metadata={}):
-        node_map = {
-            "id": node.id,
-            "labels": node.labels,
-            "properties": {k: v for (k, v) in node.items()},
-            "nodeMetadata": metadata.get(str(node.id)) if metadata else {}
-        }
-        return node_map
+    def _run_query_single(cls, tx, query, params):
+        res: Result = tx.run(query=query, parameters=params)
+        return res.single()
 
     @classmethod
-    def _get_edge_as_map(cls, edge: Relationship):
-        edge_map = {
-            "id": edge.id,
-            "type": edge.type,
-            "source": edge.start_node.id,
-            "target": edge.end_node.id,
-            "properties": {k: v for (k, v) in edge.items()}
-        }
-        for key in edge.keys():
-            edge_map.get("properties")[key] = edge.get(key)
-        return edge_map
-
+    def _graph_from_record(cls, record, properties: list = None) -> GraphResult:
+        graph_result = GraphResult(properties)
+        graph_result.extend_nodes(record.get("nodes"), record.get("nodeMetadata"))
+        graph_result.extend_edges(record.get("rels"))
+        return graph_result
@@ -0,0 +1,146 @@
+import hashlib
+import random
+import re
+import time
+
+from collections import OrderedDict, deque
+from threading import Lock
+
+CYPHER_LITERAL = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|(?<![\w.$])-?\d+(?:\.\d+)?(?![\w.])""")
+PLAN_PREFIX = re.compile(r"^\s*(EXPLAIN|PROFILE)\b", re.IGNORECASE)
+SCAN_OPERATORS = {"NodeByLabelScan", "AllNodesScan"}
+# administration and schema commands cannot be planned
+NOT_PLANNABLE = re.compile(
+    r"^\s*(SHOW|GRANT|DENY|REVOKE|ALTER|START|STOP|DROP|CREATE\s+(OR\s+REPLACE\s+)?(DATABASE|ALIAS|USER|ROLE"
+    r"|CONSTRAINT|((TEXT|RANGE|POINT|LOOKUP|FULLTEXT|BTREE)\s+)?INDEX))\b", re.IGNORECASE
+)
+
+
+def fingerprint(query: str) -> str:
+    """
+    :return: a short hash of the query with its literals and whitespace normalized, so that queries differing
+             only by their values share one fingerprint
+    """
+    normalized = " ".join(CYPHER_LITERAL.sub("?", PLAN_PREFIX.sub("", query)).split())
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class QueryProfiler:
+    """
+    Keeps the EXPLAIN/PROFILE plans of the queries run by Neo4jDataSource, either requested explicitly or for a
+    `sample_rate` fraction of the queries. Every plan is flattened into its operators (db hits, rows, time) and
+    checked for the usual anti-patterns; the store keeps the last `max_plans` plans of at most `max_fingerprints`
+    query fingerprints, evicting the least recently profiled one, so a hot query can be followed over time.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, max_fingerprints: int = 256, max_plans: int = 10):
+        self.sample_rate = sample_rate
+        self.max_fingerprints = max_fingerprints
+        self.max_plans = max_plans
+        self._plans: OrderedDict = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def should_profile(self, query: str) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate and not NOT_PLANNABLE.match(query)
+
+    @classmethod
+    def plan_query(cls, query: str, mode: str = "PROFILE") -> str:
+        """
+        :return: the query prefixed by EXPLAIN or PROFILE, unless it already starts with one of them
+        """
+        return query if PLAN_PREFIX.match(query) else f"{mode} {query}"
+
+    def record(self, query: str, summary, mode: str = "PROFILE", elapsed_ms: float = None, graph: str = None):
+        """
+        stores the plan carried by the result summary of a profiled or explained query
+        :return: the stored plan, None if the summary has no plan
+        """
+        root = getattr(summary, "profile", None) if mode == "PROFILE" else None
+        root = root or getattr(summary, "plan", None)
+        if not root:
+            return None
+        operators = self._flatten(root)
+        plan = {
+            "fingerprint": fingerprint(query), "query": query, "graph": graph, "mode": mode,
+            "timestamp": time.time(), "elapsed_ms": elapsed_ms,
+            "db_hits": sum(operator["db_hits"] or 0 for operator in operators),
+            "rows": operators[0]["rows"], "operators": operators,
+            "warnings": self.anti_patterns(operators) + [
+                notification.get("title") or notification.get("code")
+                for notification in (getattr(summary, "notifications", None) or [])
+            ]
+        }
+        with self._lock:
+            plans = self._plans.pop(plan["fingerprint"], None) or deque(maxlen=self.max_plans)
+            plans.append(plan)
+            self._plans[plan["fingerprint"]] = plans
+            while len(self._plans) > self.max_fingerprints:
+                self._plans.popitem(last=False)
+        return plan
+
+    @classmethod
+    def _flatten(cls, root) -> list:
+        """
+        :return: the operators of the plan tree in depth first order, each one with the operator it feeds
+        """
+        operators = []
+        stack = [(root, None, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            node = node if isinstance(node, dict) else vars(node)
+            arguments = node.get("args") or node.get("arguments") or {}
+            operator = node.get("operatorType") or node.get("operator_type", "")
+            operators.append({
+                "operator": operator.split("@")[0], "parent": parent, "depth": depth,
+                "db_hits": node.get("dbHits", arguments.get("DbHits")),
+                "rows": node.get("rows", arguments.get("Rows")),
+                "time": node.get("time", arguments.get("Time")),
+                "estimated_rows": arguments.get("EstimatedRows"),
+                "details": arguments.get("Details") or ", ".join(node.get("identifiers") or [])
+            })
+            index = len(operators) - 1
+            stack.extend((child, index, depth + 1) for child in reversed(node.get("children") or []))
+        return operators
+
+    @classmethod
+    def anti_patterns(cls, operators: list) -> list:
+        warnings = []
+        for operator in operators:
+            name = operator["operator"]
+            parent = operators[operator["parent"]] if operator["parent"] is not None else None
+            if name == "CartesianProduct":
+                warnings.append("cartesian product: disconnected patterns are combined row by row")
+            elif name in SCAN_OPERATORS and parent and parent["operator"] == "Filter":
+                warnings.append(f"missing index: {name} filtered by {parent['details'] or 'a predicate'}")
+            elif name == "AllNodesScan":
+                warnings.append("all nodes scan: the pattern has no label")
+            elif name == "Eager":
+                warnings.append("eager operator: the whole intermediate result is materialized")
+        return warnings
+
+    def get_plans(self, query_or_fingerprint: str = None) -> list:
+        """
+        :return: the stored plans of a query (or fingerprint) from the oldest to the latest, or every stored plan
+        """
+        with self._lock:
+            if query_or_fingerprint is None:
+                return [plan for plans in self._plans.values() for plan in plans]
+            plans = self._plans.get(query_or_fingerprint) or self._plans.get(fingerprint(query_or_fingerprint))
+            return list(plans or [])
+
+    def regressions(self, factor: float = 2.0) -> list:
+        """
+        :return: the latest plans whose db hits grew beyond `factor` times the best plan stored for the same fingerprint
+        """
+        with self._lock:
+            history = [list(plans) for plans in self._plans.values()]
+        regressed = []
+        for plans in history:
+            best = min(plan["db_hits"] for plan in plans)
+            if len(plans) > 1 and plans[-1]["db_hits"] > max(best, 1) * factor:
+                regressed.append(dict(plans[-1], best_db_hits=best))
+        return regressed
+
+    def reset(self):
+        with self._lock:
+            self._plans.clear()
@@ -0,0 +1,61 @@
+import logging
+import random
+import time
+
+from datasource.Instrumentation import Instrumentation, default_instrumentation
+
+
+class RetryPolicy:
+    """
+    Replays an operation failing with a transient error (as decided by the `is_transient` classifier of the
+    backend) with full-jitter exponential backoff, until `max_attempts` or the `budget` seconds are spent.
+    Reads are always replayed, writes only when the caller marks them idempotent.
+    Every replay is counted as `<backend>.retries`, so failovers absorbed by the policy are not reported as errors.
+    """
+
+    _logger = logging.getLogger("RetryPolicy")
+
+    def __init__(self, is_transient=None, max_attempts: int = 5, initial_backoff: float = 0.1,
+                 max_backoff: float = 5.0, budget: float = 30.0, backend: str = "datasource",
+                 instrumentation: Instrumentation = default_instrumentation):
+        self.is_transient = is_transient or (lambda err: False)
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.backend = backend
+        self.instrumentation = instrumentation
+
+    def run(self, operation, write: bool = False, idempotent: bool = False, max_attempts: int = None, **labels):
+        """
+        :param operation: the callable to run, without arguments
+        :param write: if true the operation is replayed only when `idempotent` is set
+        :param max_attempts: overrides the policy max_attempts for this operation
+        :return: the result of the first successful attempt; the last error is raised when the
+                 error is not transient, the operation cannot be replayed or the attempts/budget are exhausted
+        """
+        max_attempts = max_attempts or self.max_attempts
+        replayable = not write or idempotent
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return operation()
+            except Exception as err:
+                if not replayable or attempt >= max_attempts or not self.is_transient(err):
+                    raise
+                delay = self.backoff(attempt)
+                if time.monotonic() + delay > deadline:
+                    raise
+                self.instrumentation.record(
+                    f"{self.backend}.retries", 1, error=err.__class__.__name__, write=write, **labels
+                )
+                self._logger.warning(f"retrying after {err.__class__.__name__} (attempt {attempt}): {err}")
+                time.sleep(delay)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        full jitter: a random delay up to the exponential backoff of the attempt
+        """
+        return random.uniform(0, min(self.initial_backoff * 2 ** (attempt - 1), self.max_backoff))
@@ -0,0 +1,85 @@
+import os
+
+from threading import Lock
+
+
+class SingletonRegistry(type):
+    """
+    Shared registry of the thread-safe singletons of the package.
+    Instances are stored by `(class, instance_key)` in one dict: once an instance exists it is returned by a
+    plain dict lookup, without taking any lock. Only the creation takes a lock, and that lock is owned by the
+    class, so the first access to one singleton never waits for the creation of another one.
+    Passing `instance_key=...` to the constructor keeps one instance per key (e.g. per tenant or config).
+    """
+
+    _instances: dict = {}
+    _locks: dict = {}
+    # instances inherited from the parent process and dropped after a fork: they stay referenced so that they are
+    # never closed (nor garbage collected) in the child, their sockets being still used by the parent
+    _inherited: list = []
+
+    def __call__(cls, *args, instance_key=None, **kwargs):
+        """
+        Possible changes to the value of the `__init__` argument do not affect
+        the returned instance.
+        """
+        key = (cls, instance_key)
+        # fast path: dict reads are atomic, an existing instance is returned without locking
+        instance = SingletonRegistry._instances.get(key)
+        if instance is not None:
+            return instance
+        with SingletonRegistry._class_lock(cls):
+            # another thread may have created the instance while this one was waiting for the lock
+            instance = SingletonRegistry._instances.get(key)
+            if instance is None:
+                instance = super().__call__(*args, **kwargs)
+                SingletonRegistry._instances[key] = instance
+        return instance
+
+    @staticmethod
+    def _class_lock(cls) -> Lock:
+        lock = SingletonRegistry._locks.get(cls)
+        if lock is None:
+            lock = SingletonRegistry._locks.setdefault(cls, Lock())
+        return lock
+
+    @classmethod
+    def evict_instance(mcs, class_name, instance_key=None):
+        """
+        removes the instance from the registry and closes it; readers are never blocked, a caller
+        arriving after the removal simply creates a new instance
+        """
+        with SingletonRegistry._class_lock(class_name):
+            instance = SingletonRegistry._instances.pop((class_name, instance_key), None)
+        if instance is not None:
+            mcs._close_instance(instance)
+
+    @classmethod
+    def _close_instance(mcs, instance):
+        ...
+
+    @staticmethod
+    def _after_fork_in_child():
+        """
+        the locks may have been held by another thread of the parent when it forked, so they are replaced;
+        every instance resets the connections it inherited through its `_after_fork` hook, the instances
+        without one are dropped and created again on their next access
+        """
+        SingletonRegistry._locks = {}
+        for key, instance in list(SingletonRegistry._instances.items()):
+            after_fork = getattr(instance, "_after_fork", None)
+            if after_fork:
+                after_fork()
+            else:
+                SingletonRegistry._inherited.append(SingletonRegistry._instances.pop(key))
+
+    @classmethod
+    def get_instances(mcs, class_name):
+        """
+        :return: the instances of the class by instance key
+        """
+        return {key: instance for (cls, key), instance in list(SingletonRegistry._instances.items()) if cls is class_name}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=SingletonRegistry._after_fork_in_child)
@@ -1,14 +1,23 @@
+import asyncio
+import multiprocessing
 import os
+import time
 import unittest
 
 from testcontainers.neo4j import Neo4jContainer
 from testcontainers.mongodb import MongoDbContainer
 from neo4j import GraphDatabase
+from neo4j.exceptions import CypherSyntaxError, ServiceUnavailable
 from pymongo import MongoClient
 
+from datasource.AsyncNeo4jDataSource import AsyncNeo4jDataSource
+from datasource.CachedDataSource import CachedDataSource
+from datasource.CircuitBreaker import CircuitBreaker
+from datasource.Instrumentation import default_instrumentation
 from datasource.MongoDbDataSource import MongoDbDataSource
 from datasource.Neo4jDataSource import Neo4jDataSource
 from datasource.GdbConnection import GdbConnection
+from datasource.RetryPolicy import RetryPolicy
 
 
 class MyTestCase(unittest.TestCase):
@@ -68,6 +77,256 @@ class MyTestCase(unittest.TestCase):
         self.assertIsNotNone(alchemist)
         self.assertEqual(alchemist.get("name"), "Alphonse")
 
+    def test_metadata_cache(self):
+        data_source = GdbConnection().get_graph_data_source()
+
+        self.assertEqual("neo4j", data_source.get_default_graph())
+        self.assertIn("default_db", data_source._metadata)
+        self.assertIn("neo4j", data_source.get_graphs())
+
+        data_source.invalidate_metadata()
+        self.assertEqual({}, data_source._metadata)
+        self.assertEqual("neo4j", data_source.get_default_graph())
+
+    def test_async_data_source(self):
+        async def run_queries():
+            connection = GdbConnection()
+            data_source = await connection.get_async_graph_data_source()
+            try:
+                self.assertTrue(isinstance(data_source, AsyncNeo4jDataSource))
+                self.assertEqual("neo4j", await data_source.get_default_graph())
+                results = await asyncio.gather(*[
+                    data_source.run_query("MATCH (n:Alchemist {name: $name}) RETURN n.name AS name", params={'name': name})
+                    for name in ["Edward", "Alphonse"]
+                ])
+                self.assertEqual([[{"name": "Edward"}], [{"name": "Alphonse"}]], results)
+            finally:
+                await data_source.close()
+                connection.async_driver = None
+
+        asyncio.run(run_queries())
+
+    def test_write_batch(self):
+        data_source = GdbConnection().get_graph_data_source()
+        rows = ({"name": f"Homunculus-{index}"} for index in range(25))
+
+        batches = data_source.write_batch("CREATE (:Homunculus {name: row.name})", rows, batch_size=10, parallelism=2)
+        self.assertEqual([0, 1, 2], [batch.get("batch") for batch in batches])
+        self.assertEqual(25, sum(batch.get("nodes_created") for batch in batches))
+
+        count = data_source.run_query("MATCH (n:Homunculus) RETURN count(n) AS total")
+        self.assertEqual(25, count[0].get("total"))
+        data_source.run_query("MATCH (n:Homunculus) DELETE n", write=True)
+
+    def test_graph_from_query(self):
+        data_source = GdbConnection().get_graph_data_source()
+
+        graph_result = data_source.graph_from_query("MATCH p = (:Alchemist)-[:BROTHER_OF]->(:Alchemist) RETURN p")
+        self.assertEqual(2, len(graph_result.node_ids))
+        self.assertEqual(["BROTHER_OF"], graph_result.edge_types)
+        source = graph_result.node_index(graph_result.edge_sources[0])
+        self.assertEqual("Edward", graph_result.node_properties[source].get("name"))
+        self.assertEqual(2, len(graph_result.as_map().get("nodes")))
+        self.assertEqual(1, len(graph_result["rels"]))
+
+        projected = data_source.graph_from_query("MATCH (n:Alchemist) RETURN n", properties=["missing"])
+        self.assertEqual([{}, {}], projected.node_properties)
+        self.assertTrue(projected.to_json().startswith(b'{"nodes":'))
+
+    def test_cached_data_source(self):
+        data_source = CachedDataSource(GdbConnection().get_graph_data_source(), ttl=60)
+        query = "MATCH (n:Alchemist {name: $name}) RETURN n.name AS name"
+
+        first = data_source.run_query(query, params={'name': 'Edward'})
+        second = data_source.run_query(query, params={'name': 'Edward'})
+        self.assertIs(first, second)
+        self.assertEqual(1, data_source.get_stats().get("hits"))
+        self.assertEqual(1, data_source.get_stats().get("misses"))
+
+        data_source.run_query("MATCH (n:Alchemist {name: 'Edward'}) SET n.checked = true", write=True)
+        self.assertEqual(0, data_source.get_stats().get("entries"))
+        data_source.run_query(query, params={'name': 'Edward'})
+        self.assertEqual(2, data_source.get_stats().get("misses"))
+
+    def test_graph_routing(self):
+        connection = GdbConnection()
+        connection.get_graph_data_source()
+
+        self.assertEqual(1, len(connection.get_graph_connections()))
+        self.assertIs(connection.get_graph_data_source(), connection.get_graph_data_source("unrouted"))
+        names = connection.run_query("MATCH (n:Alchemist) RETURN n.name AS name", graph="neo4j")
+        self.assertEqual(2, len(names))
+
+    def test_read_your_writes(self):
+        data_source = GdbConnection().get_graph_data_source()
+
+        data_source.run_query("CREATE (:Chimera {name: 'Nina'})", write=True)
+        self.assertTrue(data_source.get_bookmarks())
+        chimera = data_source.run_query("MATCH (n:Chimera) RETURN n.name AS name", read_your_writes=True)
+        self.assertEqual([{"name": "Nina"}], chimera)
+        data_source.run_query("MATCH (n:Chimera) DELETE n", write=True)
+
+        routing_stats = data_source.get_routing_stats()
+        self.assertTrue(routing_stats.get("READ"))
+        self.assertTrue(routing_stats.get("WRITE"))
+
+    def test_run_query_many(self):
+        data_source = GdbConnection().get_graph_data_source()
+        queries = ["MATCH (n:Alchemist) RETURN n.name AS name", "MATCH (n:Alchemist {name: 'Edward'}) RETURN n.name AS name"]
+
+        results = list(data_source.run_query_many(queries, graphs=["neo4j", "missing"], max_workers=2))
+        self.assertEqual(4, len(results))
+        self.assertEqual(2, len([result for result in results if result.error is None]))
+        self.assertTrue(all(result.error for result in results if result.graph == "missing"))
+
+    def test_instrumentation(self):
+        data_source = GdbConnection().get_graph_data_source()
+        default_instrumentation.reset()
+
+        data_source.run_query("MATCH (n:Alchemist) RETURN n.name AS name")
+        metrics = {entry.get("metric"): entry for entry in default_instrumentation.snapshot()}
+        for metric in ["neo4j.run_query", "neo4j.session_acquire", "neo4j.server_time", "neo4j.record_fetch", "neo4j.rows"]:
+            self.assertIn(metric, metrics)
+        self.assertEqual(2, metrics.get("neo4j.rows").get("max"))
+        self.assertIn("neo4j_run_query_count", default_instrumentation.to_prometheus())
+
+    def test_config_store(self):
+        connection = GdbConnection()
+        data_source = connection.get_graph_data_source()
+
+        self.assertFalse(connection.config_store.refresh())
+        connection.connected = False
+        self.assertIs(connection.connection_config, connection.get_graph_connection())
+        self.assertIs(data_source, connection.driver)
+        connection.get_graph_data_source()
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, backoff=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertFalse(breaker.allow_request())
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+        connection = GdbConnection()
+        connection.get_graph_data_source()
+        connection.circuit_breaker.record_failure()
+        connection.connected = False
+        self.assertIsNone(connection.get_graph_data_source())
+        connection.circuit_breaker.record_success()
+        self.assertIsNotNone(connection.get_graph_data_source())
+
+    def test_mongo_bulk_operations(self):
+        mongo = MongoDbDataSource()
+        documents = list(mongo.find_all("graphDbConnection"))
+
+        result = mongo.upsert_many("graphDbConnection", documents, chunk_size=1)
+        self.assertEqual(len(documents), result["nMatched"])
+        self.assertEqual(0, result["nUpserted"])
+
+        projected = list(mongo.find_all("graphDbConnection", projection={"type": True, "_id": False}, batch_size=1))
+        self.assertEqual([{"type": "NEO4J"}], projected)
+        self.assertEqual(len(documents), sum(len(batch) for batch in mongo.stream_all("graphDbConnection", batch_size=1)))
+        self.assertRaises(ValueError, lambda: mongo.insert_many("jobs", [{}]))
+
+    def test_retry_policy(self):
+        failures = [ServiceUnavailable("leader switch")] * 2
+
+        def operation():
+            if failures:
+                raise failures.pop()
+            return "done"
+
+        policy = RetryPolicy(Neo4jDataSource.is_transient, initial_backoff=0.01, backend="test")
+        self.assertEqual("done", policy.run(operation))
+        failures.append(ServiceUnavailable("leader switch"))
+        self.assertRaises(ServiceUnavailable, lambda: policy.run(operation, write=True))
+        self.assertEqual("done", policy.run(operation, write=True, idempotent=True))
+        self.assertFalse(Neo4jDataSource.is_transient(CypherSyntaxError()))
+        retries = [metric for metric in default_instrumentation.snapshot() if metric["metric"] == "test.retries"]
+        self.assertEqual(3, sum(metric["count"] for metric in retries))
+
+    def test_run_query_paged(self):
+        data_source = GdbConnection().get_graph_data_source()
+        query = "MATCH (n:Alchemist) WHERE $after IS NULL OR n.name > $after RETURN n.name AS name"
+
+        pages = list(data_source.run_query_paged(query, page_size=1, order_key="name"))
+        self.assertEqual([[{"name": "Alphonse"}], [{"name": "Edward"}], []], [page.rows for page in pages])
+        self.assertIsNone(pages[-1].checkpoint)
+
+        resumed = list(data_source.run_query_paged(query, page_size=1, order_key="name", checkpoint=pages[0].checkpoint))
+        self.assertEqual([{"name": "Edward"}], resumed[0].rows)
+        self.assertEqual(pages, list(data_source.run_query_paged(query, page_size=1, order_key="name", parallelism=2)))
+
+    def test_data_source_class(self):
+        self.assertIs(Neo4jDataSource, GdbConnection._data_source_class("neo4j"))
+        self.assertIs(AsyncNeo4jDataSource, GdbConnection._data_source_class("NEO4J", asynchronous=True))
+        self.assertRaises(ValueError, lambda: GdbConnection._data_source_class("ORIENTDB"))
+
+    def test_query_profiler(self):
+        data_source = GdbConnection().get_graph_data_source()
+        query = "MATCH (n:Alchemist) WHERE n.name = 'Edward' RETURN n.name AS name"
+
+        self.assertEqual([{"name": "Edward"}], data_source.run_query(query, profile=True))
+        plan = data_source.profiler.get_plans(query)[-1]
+        self.assertEqual("PROFILE", plan["mode"])
+        self.assertGreater(plan["db_hits"], 0)
+        self.assertTrue(any(warning.startswith("missing index") for warning in plan["warnings"]))
+
+        explained = data_source.explain(query.replace("Edward", "Alphonse"))
+        self.assertEqual(plan["fingerprint"], explained["fingerprint"])
+        self.assertEqual(2, len(data_source.profiler.get_plans(query)))
+
+    def test_fork_safety(self):
+        connection = GdbConnection()
+        data_source = connection.get_graph_data_source()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+
+        def child():
+            forked = GdbConnection()
+            rows = forked.run_query("MATCH (n:Alchemist) RETURN count(n) AS alchemists")
+            results.put((forked is connection, forked.driver is not data_source, rows[0]["alchemists"]))
+
+        process = context.Process(target=child)
+        process.start()
+        self.assertEqual((True, True, 2), results.get(timeout=60))
+        process.join()
+        self.assertIs(data_source, connection.get_graph_data_source())
+
+    def test_transaction(self):
+        data_source = GdbConnection().get_graph_data_source()
+
+        with data_source.transaction(write=True) as tx:
+            tx.run("CREATE (:Homunculus {name: $name})", {"name": "Envy"})
+            pending = tx.submit("MATCH (n:Homunculus) RETURN n.name AS name")
+            self.assertEqual([{"name": "Envy"}], tx.run("MATCH (n:Homunculus {name: 'Envy'}) RETURN n.name AS name"))
+        self.assertEqual([{"name": "Envy"}], pending.result())
+
+        with self.assertRaises(ValueError):
+            with data_source.transaction(write=True) as tx:
+                tx.run("CREATE (:Homunculus {name: 'Lust'})")
+                tx.run("MATCH (n:Homunculus RETURN n")
+        self.assertEqual([], data_source.run_query("MATCH (n:Homunculus {name: 'Lust'}) RETURN n"))
+        data_source.run_query("MATCH (n:Homunculus) DELETE n", write=True)
+
+    def test_stream_query(self):
+        data_source = GdbConnection().get_graph_data_source()
+
+        records = list(data_source.stream_query("MATCH (n:Alchemist) RETURN n.name AS name", fetch_size=1))
+        self.assertEqual(2, len(records))
+        self.assertEqual({"Edward", "Alphonse"}, {record.get("name") for record in records})
+
+        batches = list(data_source.stream_query("MATCH (n:Alchemist) RETURN n.name AS name", batch_size=1))
+        self.assertEqual(2, len(batches))
+        self.assertTrue(all(len(batch) == 1 for batch in batches))
+
 
 
 if __name__ == '__main__':
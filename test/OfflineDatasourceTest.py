@@ -0,0 +1,544 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import neo4j
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from neo4j.spatial import CartesianPoint
+from neo4j.time import Date, DateTime
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from gremlin_python.structure.graph import Edge, Path, Vertex, VertexProperty
+
+from gremlin_python.process.traversal import T
+
+from benchmark.fakes import (
+    fake_neo4j_data_source, FakeGremlinDataSource, FakeGremlinServer, FakeMongoDbDataSource, FakeNeo4jDriver,
+    FakeNode, FakeRelationship, FakeResultSet, FakeTransaction
+)
+from datasource.AsyncGremlinDataSource import AsyncGremlinDataSource
+from datasource.AsyncNeo4jDataSource import AsyncNeo4jDataSource
+from datasource.CachedDataSource import CachedDataSource
+from datasource import GdbConnection as gdb_connection
+from datasource.MongoDbDataSource import MongoDbDataSource
+from datasource.GraphResult import GraphResult
+from datasource.GremlinDataSource import GremlinDataSource, normalize_script
+from datasource.Neo4jDataSource import Neo4jDataSource
+from datasource.RetryPolicy import RetryPolicy
+
+
+class SlowGremlinDataSource(FakeGremlinDataSource):
+    """
+    a data source whose creation on the `slow` host takes 200ms and fails on the `broken` one,
+    recording every instance
+    """
+
+    created = []
+    attempts = 0
+
+    def __init__(self, *args, **kwargs):
+        SlowGremlinDataSource.attempts += 1
+        if kwargs["host"] == "broken":
+            raise ConnectionError("cannot resolve broken")
+        time.sleep(0.2 if kwargs["host"] == "slow" else 0)
+        super().__init__(*args, **kwargs)
+        self.host = kwargs["host"]
+        self.closed = False
+        self.created.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+class SlowAsyncGremlinDataSource(AsyncGremlinDataSource):
+    """
+    an async data source whose health check takes 50ms, recording every instance
+    """
+
+    created = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created.append(self)
+
+    async def run_query(self, query: str, params: dict = {}, graph: str = None, **kwargs):
+        await asyncio.sleep(0.05)
+        return [1]
+
+
+class OfflineTestCase(unittest.TestCase):
+    """
+    Tests running against the in-process fakes of benchmark.fakes, without containers
+    """
+
+    def test_async_gremlin_data_source(self):
+        edward, alphonse = Vertex(1, "Alchemist"), Vertex(2, "Alchemist")
+        responses = {
+            "g.V().valueMap()": lambda bindings: [{"name": ["Edward"]}, {"name": ["Alphonse"]}],
+            "g.V(id).valueMap()": lambda bindings: [{"id": [bindings["id"]]}],
+            "g.E()": [Edge(3, edward, "BROTHER_OF", alphonse)]
+        }
+
+        async def run(port):
+            data_source = AsyncGremlinDataSource(protocol="ws", host="127.0.0.1", port=port, tinkerpop_graphs={"graph": "g"})
+            try:
+                rows = await asyncio.gather(*(
+                    data_source.run_query("g.V(id).valueMap()", {"id": index}, graph="graph") for index in range(50)
+                ))
+                self.assertEqual([[{"id": [index]}] for index in range(50)], rows)
+                self.assertEqual(1, len(data_source._sockets))
+
+                df = await data_source.run_query("g.V().valueMap()", graph="graph", result_as_df=True, cardinality="single")
+                self.assertEqual(["Edward", "Alphonse"], list(df["name"]))
+
+                graph = await data_source.graph_from_query("g.E()", graph="graph")
+                self.assertEqual([1, 2], graph.node_ids)
+                self.assertEqual([("BROTHER_OF", 1, 2)], [(rel["type"], rel["source"], rel["target"]) for rel in graph.rels()])
+                with self.assertRaises(KeyError):
+                    await data_source.run_query("g.V()", graph="unknown")
+            finally:
+                await data_source.close()
+
+        with FakeGremlinServer(responses) as server:
+            asyncio.run(run(server.port))
+            self.assertEqual(52, server.requests)
+
+    def test_script_normalization(self):
+        template, literals = normalize_script("g.V().has('name', 'a\\nb').has(\"k\", \"x${y}\").limit(10)")
+        self.assertEqual("g.V().has(_gp0, _gp1).has(_gp2, \"x${y}\").limit(_gp3)", template)
+        self.assertEqual(("'name'", "'a\\nb'", '"k"', "10"), literals)
+        self.assertIs(template, normalize_script("g.V().has('name', 'c').has(\"k\", \"x${y}\").limit(5)")[0])
+
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"}, normalize_scripts=True)
+        hits = GremlinDataSource.script_cache_info().hits
+        data_source.run_query("g.V().has('name', 'it\\'s\\u00e9').has('age', age)", params={"age": 4}, graph="graph")
+        data_source.run_query("g.V().has('name', \"\\$x\\t\").has('age', age)", params={"age": 5}, graph="graph")
+        (first, first_bindings, _), (second, second_bindings, _) = data_source.client.requests
+        self.assertIs(first, second)
+        self.assertEqual({"age": 4, "_gp0": "name", "_gp1": "it'sé", "_gp2": "age"}, first_bindings)
+        self.assertEqual({"age": 5, "_gp0": "name", "_gp1": "$x\t", "_gp2": "age"}, second_bindings)
+        self.assertEqual(hits + 1, GremlinDataSource.script_cache_info().hits)
+
+    def test_result_as_columns(self):
+        results = [
+            {"name": ["Edward"], "tags": ["t1"]},
+            {"name": ["Alphonse"], "tags": ["t1", "t2"], "age": [14]},
+            {T.id: 3, T.label: "Alchemist", "name": "Izumi"}
+        ]
+        columns = GremlinDataSource._result_as_columns(FakeResultSet(results, batch_size=2))
+        self.assertEqual({
+            "name": [["Edward"], ["Alphonse"], "Izumi"], "tags": [["t1"], ["t1", "t2"], None],
+            "age": [None, [14], None], "id": [None, None, 3], "label": [None, None, "Alchemist"]
+        }, columns)
+        # the column types do not depend on the values of the other rows
+        single_tag = GremlinDataSource._result_as_columns(FakeResultSet(results[:1]))
+        self.assertEqual([["t1"]], single_tag["tags"])
+
+        single = GremlinDataSource._result_as_columns(FakeResultSet([results[0], {"name": []}]), cardinality="single")
+        self.assertEqual({"name": ["Edward", None], "tags": ["t1", None]}, single)
+        with self.assertRaises(ValueError):
+            GremlinDataSource._result_as_columns(FakeResultSet(results), cardinality="single")
+
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"})
+        data_source.client.responses["g.V().valueMap()"] = results[:2]
+        df = data_source.run_query("g.V().valueMap()", graph="graph", result_as_df=True)
+        self.assertEqual([["t1"], ["t1", "t2"]], list(df["tags"]))
+
+    def test_run_query_df(self):
+        query = "MATCH (n:Alchemist) RETURN n.name AS name, n.age AS age"
+        driver = FakeNeo4jDriver({query: [{"name": "Edward", "age": 15}, {"name": "Alphonse", "age": None}]})
+        df = Neo4jDataSource._run_query_df(FakeTransaction(driver), query, {})
+        self.assertEqual(["name", "age"], list(df.columns))
+        self.assertEqual(["Edward", "Alphonse"], list(df["name"]))
+        self.assertEqual(15, df["age"][0])
+
+        empty = Neo4jDataSource._run_query_df(FakeTransaction(driver), "MATCH (n:Homunculus) RETURN n", {})
+        self.assertEqual(0, len(empty))
+
+    def test_gremlin_graph_from_query(self):
+        edward, alphonse, izumi = Vertex(1, "Alchemist"), Vertex(2, "Alchemist"), Vertex(4, "Alchemist")
+        alphonse.properties = [VertexProperty(10, "name", "Alphonse", alphonse)]
+        brother_of = Edge(3, Vertex(1), "BROTHER_OF", Vertex(2))
+        student_of = Edge(5, Vertex(1), "STUDENT_OF", Vertex(4))
+        izumi.properties = [VertexProperty(11, "name", "Izumi", izumi)]
+        query = "g.V(1).outE().path()"
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"})
+        data_source.client.responses[query] = [brother_of, alphonse, Path([], [edward, student_of, izumi])]
+
+        graph = data_source.graph_from_query(query, graph="graph")
+        nodes = {node["id"]: node for node in graph["nodes"]}
+        self.assertEqual({1, 2, 4}, set(nodes))
+        self.assertEqual({"name": "Alphonse"}, nodes[2]["properties"])
+        self.assertEqual(frozenset(("Alchemist",)), nodes[2]["labels"])
+        self.assertEqual({"name": "Izumi"}, nodes[4]["properties"])
+        self.assertEqual(frozenset(("Alchemist",)), nodes[1]["labels"])
+        self.assertEqual([(3, 1, 2), (5, 1, 4)], [(rel["id"], rel["source"], rel["target"]) for rel in graph["rels"]])
+
+        projected = data_source.graph_from_query(query, graph="graph", properties=["age"])
+        self.assertEqual([{}, {}, {}], [node["properties"] for node in projected["nodes"]])
+
+    def test_graph_result_to_json(self):
+        class RelationIdentifier:
+            def __str__(self):
+                return "4r-6-1l-3"
+
+        born = DateTime(1899, 2, 3, 12, 30, 0)
+        edward = FakeNode(1, ["Alchemist", "Human"], {"born": born, "home": CartesianPoint((1.5, 2.5))})
+        alphonse = FakeNode(2, ["Alchemist"], {"tags": {"armor", "soul"}})
+        brother_of = FakeRelationship(3, "BROTHER_OF", edward, alphonse, {"since": Date(1899, 2, 3)})
+        graph = Neo4jDataSource._graph_from_record({"nodes": [edward, alphonse], "rels": [brother_of]})
+        encoded = json.loads(graph.to_json())
+        self.assertEqual(["Alchemist", "Human"], encoded["nodes"][0]["labels"])
+        self.assertEqual(born.iso_format(), encoded["nodes"][0]["properties"]["born"])
+        self.assertEqual([1.5, 2.5], encoded["nodes"][0]["properties"]["home"])
+        self.assertEqual(["armor", "soul"], encoded["nodes"][1]["properties"]["tags"])
+        self.assertEqual("1899-02-03", encoded["rels"][0]["properties"]["since"])
+        self.assertEqual(encoded, json.loads(b"".join(graph.iter_json(chunk_size=1))))
+
+        interned, not_interned = GraphResult(), GraphResult(intern=False)
+        for graph_result in (interned, not_interned):
+            graph_result.add_node("v-1", frozenset(("Alchemist",)), {"name": "Edward"})
+            graph_result.add_node("v-2", frozenset(("Alchemist",)), {"name": "Alphonse"})
+        self.assertIs(interned.node_keys[0], interned.node_keys[1])
+        self.assertIsNot(not_interned.node_keys[0], not_interned.node_keys[1])
+        self.assertEqual(interned.to_json(), not_interned.to_json())
+
+        gremlin_graph = GraphResult()
+        gremlin_graph.add_node(1, frozenset(("Alchemist",)), {})
+        gremlin_graph.add_edge(RelationIdentifier(), "BROTHER_OF", 1, 1, {})
+        self.assertEqual("4r-6-1l-3", json.loads(gremlin_graph.to_json())["rels"][0]["id"])
+
+    def test_cached_stream_query_write(self):
+        read, write = "MATCH (n) RETURN n.name AS name", "MATCH (n) SET n.seen = true RETURN n.name AS name"
+        rows = [{"name": "Edward"}, {"name": "Alphonse"}]
+        data_source = CachedDataSource(fake_neo4j_data_source({read: rows, write: rows}))
+        data_source.run_query(read)
+
+        stream = data_source.stream_query(write, write=True)
+        self.assertEqual({"name": "Edward"}, next(stream))
+        # the entries cached before and while the write is streamed are dropped when the stream is over
+        data_source.run_query(read)
+        self.assertEqual(1, data_source.get_stats()["entries"])
+        self.assertEqual([{"name": "Alphonse"}], list(stream))
+        self.assertEqual(0, data_source.get_stats()["entries"])
+
+        data_source.run_query(read)
+        stream = data_source.stream_query(write, write=True)
+        next(stream)
+        stream.close()
+        self.assertEqual(0, data_source.get_stats()["entries"])
+
+    def test_routed_data_sources(self):
+        gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"] = (__name__, "SlowGremlinDataSource")
+        SlowGremlinDataSource.created = []
+        mongo = FakeMongoDbDataSource({"graphDbConnection": [
+            {"name": name, "type": "SLOWGREMLIN", "protocol": "ws", "uri": name, "default": name == "main",
+             "tinkerpopGraphs": {f"{name}_graph": "g"}}
+            for name in ["main", "slow", "fast"]
+        ]})
+        gdb_connection.GdbConnection.evict_singleton_instance()
+        connection = gdb_connection.GdbConnection(mongo=mongo, idle_timeout=0.2)
+        try:
+            connection.get_graph_data_source()
+            slow = [threading.Thread(target=connection.get_graph_data_source, args=("slow_graph",)) for _ in range(4)]
+            for thread in slow: thread.start()
+            time.sleep(0.05)
+            # the slow connection being built holds neither the other connections nor the registry
+            start = time.perf_counter()
+            fast = connection.get_graph_data_source("fast_graph")
+            self.assertLess(time.perf_counter() - start, 0.15)
+            for thread in slow: thread.join()
+            self.assertEqual(["main", "fast", "slow"], [data_source.host for data_source in SlowGremlinDataSource.created])
+
+            # no routed request is needed for the idle data sources to be closed
+            time.sleep(0.6)
+            self.assertEqual({}, connection._data_sources)
+            self.assertTrue(fast.closed)
+            self.assertFalse(connection.driver.closed)
+
+            # as in a forked child: the routed data source of the parent is not handed out
+            fast = connection.get_graph_data_source("fast_graph")
+            connection._pid = -1
+            self.assertIsNot(fast, connection.get_graph_data_source("fast_graph"))
+            self.assertFalse(fast.closed)
+        finally:
+            gdb_connection.GdbConnection.evict_singleton_instance()
+            del gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"]
+
+    def test_neo4j_bookmarks(self):
+        data_source = fake_neo4j_data_source()
+
+        def session(*bookmarks):
+            return SimpleNamespace(last_bookmarks=lambda: neo4j.Bookmarks.from_raw_values(bookmarks))
+
+        # two writes started from the same bookmarks: both are kept, the bookmark they followed is dropped
+        data_source._save_bookmarks("neo4j", session("b1"))
+        chained = data_source.get_bookmarks("neo4j")
+        data_source._save_bookmarks("neo4j", session("b2"), chained)
+        data_source._save_bookmarks("neo4j", session("b3"), chained)
+        self.assertEqual({"b2", "b3"}, data_source.get_bookmarks("neo4j").raw_values)
+        data_source._save_bookmarks("neo4j", session("b4"), data_source.get_bookmarks("neo4j"))
+        self.assertEqual({"b4"}, data_source.get_bookmarks("neo4j").raw_values)
+        self.assertEqual((), data_source.get_bookmarks("other"))
+
+    def test_async_neo4j_access_mode(self):
+        class Session:
+            def __init__(self, **kwargs):
+                self.access_mode = kwargs["default_access_mode"]
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            async def read_transaction(self, transaction_function, **kwargs):
+                return "READ", self.access_mode
+
+            async def write_transaction(self, transaction_function, **kwargs):
+                return "WRITE", self.access_mode
+
+        async def run():
+            data_source = AsyncNeo4jDataSource("bolt", "localhost", "7687", None, None)
+            await data_source.close()
+            data_source.driver = SimpleNamespace(session=Session)
+            self.assertEqual(("READ", neo4j.READ_ACCESS), await data_source.run_query("RETURN 1", graph="neo4j"))
+            self.assertEqual(
+                ("WRITE", neo4j.WRITE_ACCESS), await data_source.run_query("CREATE ()", graph="neo4j", write=True)
+            )
+
+        asyncio.run(run())
+
+    def test_traversal_request_options(self):
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g", "other": "g_other"})
+        self.assertEqual([], data_source._get_traversal("other").V().limit(1).to_list())
+        self.assertEqual([], data_source._get_traversal("graph").V().limit(1).to_list())
+        (other, _, other_options), (graph, _, graph_options) = data_source.client.requests
+        self.assertEqual({"g": "g_other"}, other_options["aliases"])
+        self.assertEqual({"g": "g"}, graph_options["aliases"])
+        self.assertIs(data_source._connections["other"]._client, data_source._connections["graph"]._client)
+
+    def test_config_snapshot_refresh(self):
+        def document(host):
+            return {"name": "main", "type": "SLOWGREMLIN", "protocol": "ws", "uri": host, "tinkerpopGraphs": {"graph": "g"}}
+
+        gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"] = (__name__, "SlowGremlinDataSource")
+        SlowGremlinDataSource.created = []
+        snapshot_path = os.path.join(tempfile.mkdtemp(), "graphDbConnection.json")
+        with open(snapshot_path, "w") as snapshot:
+            json.dump([document("stale")], snapshot)
+        mongo = FakeMongoDbDataSource({"graphDbConnection": [document("current")]})
+        gdb_connection.GdbConnection.evict_singleton_instance()
+        connection = gdb_connection.GdbConnection(mongo=mongo, config_snapshot_path=snapshot_path, close_grace_period=0.2)
+        try:
+            # the snapshot serves the first request, Mongo is read in the background without watch_config
+            stale = connection.get_graph_data_source()
+            deadline = time.monotonic() + 2
+            while connection.driver is stale and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual("current", connection.driver.host)
+            self.assertEqual("current", connection.get_graph_connection()["uri"])
+            with open(snapshot_path) as snapshot:
+                self.assertEqual([document("current")], json.load(snapshot))
+            self.assertEqual(0o600, os.stat(snapshot_path).st_mode & 0o777)
+            # the replaced driver stays open for the requests still running on it
+            self.assertFalse(stale.closed)
+            time.sleep(0.4)
+            self.assertTrue(stale.closed)
+        finally:
+            gdb_connection.GdbConnection.evict_singleton_instance()
+            del gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"]
+
+    def test_connection_lifecycle(self):
+        gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"] = (__name__, "SlowGremlinDataSource")
+        SlowGremlinDataSource.created = []
+        mongo = FakeMongoDbDataSource({"graphDbConnection": [
+            {"name": name, "type": "SLOWGREMLIN", "protocol": "ws", "uri": name, "default": name == "broken",
+             "tinkerpopGraphs": {f"{name}_graph": "g"}}
+            for name in ["broken", "fast"]
+        ]})
+        gdb_connection.GdbConnection.evict_singleton_instance()
+        connection = gdb_connection.GdbConnection(mongo=mongo, retry_backoff=0.05, watch_config=True, config_poll_interval=60)
+        try:
+            # a driver that cannot be created reopens the circuit instead of leaving it half-open
+            with self.assertRaises(ConnectionError):
+                connection.get_graph_data_source()
+            self.assertEqual("OPEN", connection.circuit_breaker.state)
+            self.assertIsNone(connection.get_graph_data_source())
+            time.sleep(0.1)
+            with self.assertRaises(ConnectionError):
+                connection.get_graph_data_source()
+
+            fast = connection.get_graph_data_source("fast_graph")
+
+            # a routed connection that cannot be built opens its own circuit: the next requests fail fast
+            connection.connection_configs["fast"] = dict(connection.connection_configs["fast"], uri="broken")
+            connection.close_data_sources()
+            SlowGremlinDataSource.attempts = 0
+            with self.assertRaises(ConnectionError):
+                connection.get_graph_data_source("fast_graph")
+            self.assertIsNone(connection.get_graph_data_source("fast_graph"))
+            with self.assertRaises(ValueError):
+                connection.run_query("g.V()", graph="fast_graph")
+            self.assertEqual(1, SlowGremlinDataSource.attempts)
+            time.sleep(0.1)
+            with self.assertRaises(ConnectionError):
+                connection.get_graph_data_source("fast_graph")
+            self.assertEqual(2, SlowGremlinDataSource.attempts)
+        finally:
+            gdb_connection.GdbConnection.evict_singleton_instance()
+            del gdb_connection.DATA_SOURCE_CLASSES["SLOWGREMLIN"]
+        # the eviction stops the config watcher and closes the routed data sources
+        self.assertTrue(fast.closed)
+        self.assertEqual({}, connection._data_sources)
+        self.assertTrue(connection.config_store._stop.is_set())
+
+    def test_unordered_bulk_write_errors(self):
+        class Collection:
+            def bulk_write(self, chunk, ordered):
+                # every chunk is written, none is acknowledged by the majority
+                raise BulkWriteError({
+                    "nInserted": len(chunk), "writeErrors": [],
+                    "writeConcernErrors": [{"code": 64, "errmsg": "waiting for replication timed out"}]
+                })
+
+        data_source = MongoDbDataSource.__new__(MongoDbDataSource)
+        data_source.client = None
+        data_source.get_collection = lambda collection: Collection()
+        with self.assertRaises(BulkWriteError) as raised:
+            data_source.bulk_write("graphDbConnection", (InsertOne({"_id": index}) for index in range(5)),
+                                   ordered=False, chunk_size=2)
+        self.assertEqual(5, raised.exception.details["nInserted"])
+        self.assertEqual(3, len(raised.exception.details["writeConcernErrors"]))
+
+    def test_paged_checkpoint_order_keys(self):
+        query = "MATCH (n:Alchemist) WHERE $after IS NULL OR n.born > $after RETURN n.born AS born"
+        births = [DateTime(1899, 2, 3, 12, 0, 0), DateTime(1900, 2, 3, 12, 0, 0), DateTime(1901, 2, 3, 12, 0, 0)]
+        page_query = f"{query}\nORDER BY born\nLIMIT $pageSize"
+
+        def page(parameters):
+            after = parameters["after"]
+            return [{"born": born} for born in births if after is None or born > after][:parameters["pageSize"]]
+
+        data_source = fake_neo4j_data_source({page_query: page})
+        first = next(data_source.run_query_paged(query, page_size=2, order_key="born"))
+        self.assertEqual(births[:2], [row["born"] for row in first.rows])
+        # the checkpoint gives back the DateTime itself, the resumed run seeks past it and reaches the last row
+        self.assertEqual({"after": births[1]}, data_source._decode_checkpoint(first.checkpoint))
+        resumed = list(data_source.run_query_paged(query, page_size=2, order_key="born", checkpoint=first.checkpoint))
+        self.assertEqual([[{"born": births[2]}]], [resumed_page.rows for resumed_page in resumed])
+
+        with self.assertRaises(ValueError):
+            data_source._encode_checkpoint({"after": CartesianPoint((1.5, 2.5))})
+        with self.assertRaises(ValueError):
+            data_source._decode_checkpoint(data_source._encode_checkpoint({"after": {"$type": "os.system", "value": "ls"}}))
+
+    def test_gremlin_transaction_sessions(self):
+        data_source = FakeGremlinDataSource(protocol="ws", tinkerpop_graphs={"graph": "g"}, session_pool_size=1)
+        with data_source.transaction("graph", write=True) as tx:
+            tx.run("g.addV('Alchemist')")
+            session = tx.client
+        with data_source.transaction("graph") as tx:
+            tx.run("g.V().count()")
+            self.assertIs(session, tx.client)
+        self.assertEqual(
+            ["g.addV('Alchemist')", "g.tx().commit()", "g.V().count()", "g.tx().rollback()"],
+            [message for message, _, _ in session.requests]
+        )
+
+        # a failed unit of work does not give its session back
+        with self.assertRaises(RuntimeError):
+            with data_source.transaction("graph", write=True) as tx:
+                raise RuntimeError("conflict")
+        with data_source.transaction("graph") as tx:
+            self.assertIsNot(session, tx.client)
+            self.assertIsNot(data_source.client, tx.client)
+
+    def test_gremlin_retry_only_read_only_scripts(self):
+        calls, failures = [], []
+
+        def flaky(bindings):
+            calls.append(1)
+            if failures:
+                raise failures.pop()
+            return [1]
+
+        FakeGremlinDataSource.responses = {"g.addV()": flaky}
+        try:
+            data_source = FakeGremlinDataSource(
+                protocol="ws", tinkerpop_graphs={"graph": "g"},
+                retry_policy=RetryPolicy(GremlinDataSource.is_transient, initial_backoff=0)
+            )
+            # a script not marked read-only may have been applied before the connection was lost
+            failures.append(ConnectionError("connection reset"))
+            with self.assertRaises(ConnectionError):
+                data_source.run_query("g.addV()", graph="graph")
+            self.assertEqual(1, len(calls))
+            for marked in ({"write": False}, {"idempotent": True}):
+                failures.append(ConnectionError("connection reset"))
+                self.assertEqual([1], data_source.run_query("g.addV()", graph="graph", **marked))
+            self.assertEqual(5, len(calls))
+        finally:
+            FakeGremlinDataSource.responses = {}
+
+    def test_async_graph_data_source_cold_start(self):
+        gdb_connection.ASYNC_DATA_SOURCE_CLASSES["SLOWGREMLIN"] = (__name__, "SlowAsyncGremlinDataSource")
+        SlowAsyncGremlinDataSource.created = []
+        mongo = FakeMongoDbDataSource({"graphDbConnection": [
+            {"type": "SLOWGREMLIN", "protocol": "ws", "uri": "slow", "tinkerpopGraphs": {"graph": "g"}}
+        ]})
+        gdb_connection.GdbConnection.evict_singleton_instance()
+        connection = gdb_connection.GdbConnection(mongo=mongo)
+
+        async def cold_start():
+            return await asyncio.gather(*[connection.get_async_graph_data_source() for _ in range(8)])
+
+        try:
+            drivers = asyncio.run(cold_start())
+            # the tasks arriving while the driver is being checked wait for it instead of creating their own
+            self.assertEqual(1, len(SlowAsyncGremlinDataSource.created))
+            self.assertEqual({id(connection.async_driver)}, {id(driver) for driver in drivers})
+            # a new event loop gets its own lock
+            self.assertIs(connection.async_driver, asyncio.run(connection.get_async_graph_data_source()))
+        finally:
+            gdb_connection.GdbConnection.evict_singleton_instance()
+            del gdb_connection.ASYNC_DATA_SOURCE_CLASSES["SLOWGREMLIN"]
+
+    def test_cached_read_after_write(self):
+        read, write = "MATCH (n) RETURN n.name AS name", "MATCH (n) SET n.name = 'new'"
+        graph = {"name": "old"}
+        reading, release = threading.Event(), threading.Event()
+
+        def slow_read(parameters):
+            value = graph["name"]
+            reading.set()
+            release.wait(2)
+            return [{"name": value}]
+
+        def update(parameters):
+            graph["name"] = "new"
+            return []
+
+        data_source = CachedDataSource(fake_neo4j_data_source({read: slow_read, write: update}))
+        first = ThreadPoolExecutor(max_workers=1).submit(data_source.run_query, read)
+        reading.wait(2)
+        data_source.run_query(write, write=True)
+        # the read started before the write is not joined by a reader arriving after it
+        second = ThreadPoolExecutor(max_workers=1).submit(data_source.run_query, read)
+        time.sleep(0.05)
+        release.set()
+        self.assertEqual([{"name": "old"}], first.result())
+        self.assertEqual([{"name": "new"}], second.result())
+        self.assertEqual(0, data_source.get_stats()["coalesced"])
+        self.assertEqual([{"name": "new"}], data_source.run_query(read))
+
+
+if __name__ == '__main__':
+    unittest.main()